@@ -4,7 +4,7 @@ from CommonServerUserPython import *
 
 
 ''' IMPORTS '''
-from typing import Dict, Tuple, Union
+from typing import Dict, List, Tuple, Union
 import urllib3
 
 # Disable insecure warnings
@@ -27,6 +27,7 @@ INTEGRATION_COMMAND_NAME = 'alienvault'
 INTEGRATION_CONTEXT_NAME = 'AlienVaultOTX'
 DEFAULT_THRESHOLD = int(demisto.params().get('default_threshold', 2))
 TOKEN = demisto.params().get('api_token')
+MAX_CONCURRENT_REQUESTS = 10
 
 
 class Client(BaseClient):
@@ -50,6 +51,39 @@ class Client(BaseClient):
         Returns:
             Response JSON
         """
+        return self._http_request(**self.query_request(section, argument, sub_section, params))
+
+    def query_many(self, section: str, arguments: List[str], sub_section: str = 'general') -> List[Dict]:
+        """Query several indicators of the same type concurrently.
+
+        Args:
+            section: indicator type
+            arguments: indicator values
+            sub_section: sub section of api
+
+        Returns:
+            Response JSONs, in the order of the indicator values
+        """
+        raw_responses = self._bulk_http_request([self.query_request(section, argument, sub_section)
+                                                 for argument in arguments], max_workers=MAX_CONCURRENT_REQUESTS)
+        for raw_response in raw_responses:
+            if isinstance(raw_response, Exception):
+                raise raw_response
+        return raw_responses
+
+    @staticmethod
+    def query_request(section: str, argument: str = None, sub_section: str = 'general', params: dict = None) -> Dict:
+        """Builds the http request arguments of a query.
+
+        Args:
+            section: indicator type
+            argument: indicator value
+            sub_section: sub section of api
+            params: params to send in http request
+
+        Returns:
+            The http request arguments
+        """
         # The service endpoint to request from
         if section == 'pulses':
             suffix = f'{section}/{argument}'
@@ -57,15 +91,10 @@ class Client(BaseClient):
             suffix = f'indicators/{section}/{argument}/{sub_section}'
         else:
             suffix = f'{section}/{sub_section}'
-        # Send a request using our http_request wrapper
+        request: Dict = {'method': 'GET', 'url_suffix': suffix, 'params': params}
         if sub_section == 'passive_dns':
-            return self._http_request('GET',
-                                      url_suffix=suffix,
-                                      params=params,
-                                      timeout=30)
-        return self._http_request('GET',
-                                  url_suffix=suffix,
-                                  params=params)
+            request['timeout'] = 30
+        return request
 
 
 ''' HELPER FUNCTIONS '''
@@ -178,9 +207,7 @@ def ip_command(client: Client, ip_address: str, ip_version: str) -> Tuple[str, D
     ip_ec: list = []
     alienvault_ec: list = []
     dbotscore_ec: list = []
-    for arg in query_args:
-        raw_response = client.query(section=ip_version,
-                                    argument=arg)
+    for arg, raw_response in zip(query_args, client.query_many(section=ip_version, arguments=query_args)):
         if raw_response:
             raws.append(raw_response)
             ip_ec.append({
@@ -232,9 +259,7 @@ def domain_command(client: Client, domain: str) -> Tuple[str, Dict, Union[Dict,
     domain_ec = []
     dbotscore_ec = []
     alienvault_ec = []
-    for args in query_args:
-        raw_response = client.query(section='domain',
-                                    argument=args)
+    for raw_response in client.query_many(section='domain', arguments=query_args):
         if raw_response:
             raws.append(raw_response)
             domain_ec.append({
@@ -282,12 +307,9 @@ def file_command(client: Client, file: str) -> Tuple[str, Dict, Union[Dict, list
     raws: list = []
     file_ec: list = []
     dbotscore_ec: list = []
-    for args in query_args:
-        raw_response_analysis = client.query(section='file',
-                                             argument=args,
-                                             sub_section='analysis')
-        raw_response_general = client.query(section='file',
-                                            argument=args)
+    raw_responses_analysis = client.query_many(section='file', arguments=query_args, sub_section='analysis')
+    raw_responses_general = client.query_many(section='file', arguments=query_args)
+    for raw_response_analysis, raw_response_general in zip(raw_responses_analysis, raw_responses_general):
         if raw_response_analysis and raw_response_general:
             raws.append(raw_response_analysis)
             raws.append(raw_response_general)
@@ -338,9 +360,7 @@ def url_command(client: Client, url: str) -> Tuple[str, Dict, Union[Dict, list]]
     url_ec: list = []
     alienvault_ec: list = []
     dbotscore_ec: list = []
-    for args in query_args:
-        raw_response = client.query(section='url',
-                                    argument=args)
+    for args, raw_response in zip(query_args, client.query_many(section='url', arguments=query_args)):
         if raw_response:
             raws.append(raw_response)
             url_ec.append({
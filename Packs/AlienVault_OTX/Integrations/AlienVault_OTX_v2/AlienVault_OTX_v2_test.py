@@ -4,7 +4,8 @@
 import pytest
 
 # Import local packages
-from AlienVault_OTX_v2 import calculate_dbot_score
+from AlienVault_OTX_v2 import calculate_dbot_score, Client, file_command, ip_command
+from CommonServerPython import outputPaths
 
 # DBot calculation Test
 arg_names_dbot = "pulse, score"
@@ -24,3 +25,31 @@ arg_values_dbot = [
 @pytest.mark.parametrize(argnames=arg_names_dbot, argvalues=arg_values_dbot)
 def test_dbot_score(pulse: dict, score: int):
     assert calculate_dbot_score(pulse) == score, f"Error calculate DBot Score {pulse.get('count')}"
+
+
+# Enrichment of several indicators Test
+MOCK_BASE_URL = 'https://otx.alienvault.com/api/v1/'
+
+
+def test_ip_command_multiple_ips(requests_mock):
+    ips = [f'1.1.1.{i}' for i in range(20)]
+    for ip in ips:
+        requests_mock.get(f'{MOCK_BASE_URL}indicators/IPv4/{ip}/general',
+                          json={'indicator': ip, 'asn': 'AS13335', 'pulse_info': {'count': 0}})
+    client = Client(base_url=MOCK_BASE_URL)
+    _, context, raws = ip_command(client, ip_address=','.join(ips), ip_version='IPv4')
+    assert [raw['indicator'] for raw in raws] == ips
+    assert [alienvault_ip['IP']['IP'] for alienvault_ip in context['AlienVaultOTX.IP(val.IP && val.IP === obj.IP)']] == ips
+
+
+def test_file_command_multiple_hashes(requests_mock):
+    hashes = ['a' * 32, 'b' * 32]
+    for file_hash in hashes:
+        requests_mock.get(f'{MOCK_BASE_URL}indicators/file/{file_hash}/analysis',
+                          json={'analysis': {'info': {'results': {'md5': file_hash}}}})
+        requests_mock.get(f'{MOCK_BASE_URL}indicators/file/{file_hash}/general',
+                          json={'indicator': file_hash, 'pulse_info': {'count': 1}})
+    client = Client(base_url=MOCK_BASE_URL)
+    _, context, _ = file_command(client, file=','.join(hashes))
+    assert [file_ec['MD5'] for file_ec in context[outputPaths['file']]] == hashes
+    assert [dbot_score['Indicator'] for dbot_score in context[outputPaths['dbotscore']]] == hashes
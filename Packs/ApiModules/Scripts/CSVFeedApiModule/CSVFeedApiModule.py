@@ -5,20 +5,29 @@ from CommonServerUserPython import *
 ''' IMPORTS '''
 import csv
 import gzip
+import hashlib
+import threading
 import urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from dateutil.parser import parse
-from typing import Optional, Pattern, Dict, Any, Tuple, Union
+from typing import Optional, Pattern, Dict, Any, Tuple, Union, List
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
+DEFAULT_CONCURRENT_REQUESTS = 5
+# integration context key of the ETag, Last-Modified and content digest of each feed URL
+FEEDS_CACHE_KEY = 'feeds_cache'
+
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_url_to_config: Optional[Dict[str, dict]] = None, fieldnames: str = '',
                  insecure: bool = False, credentials: dict = None, ignore_regex: str = None, encoding: str = 'latin-1',
                  delimiter: str = ',', doublequote: bool = True, escapechar: str = '',
                  quotechar: str = '"', skipinitialspace: bool = False, polling_timeout: int = 20, proxy: bool = False,
-                 **kwargs):
+                 concurrent_requests: int = DEFAULT_CONCURRENT_REQUESTS, skip_unchanged_feeds: bool = False,
+                 incremental_fetch: bool = False, **kwargs):
         """
         :param url: URL of the feed.
         :param feed_url_to_config: for each URL, a configuration of the feed that contains
@@ -59,6 +68,15 @@ class Client(BaseClient):
             <https://docs.python.org/2/library/csv.html#dialects-and-formatting-parameters>`. Default False
         :param polling_timeout: timeout of the polling request in seconds. Default: 20
         :param proxy: Sets whether use proxy when sending requests
+        :param concurrent_requests: The maximal number of feed URLs to fetch at the same time. Default: 5
+            (it has no effect on a feed with a single URL, so such feeds do not expose it as a parameter).
+        :param skip_unchanged_feeds: boolean, if *true* fetch-indicators sends conditional requests and skips
+            the URLs whose content did not change since the last fetch (HTTP 304 or an identical content digest).
+            A URL whose configuration changed since the last fetch is never skipped.
+            Should not be used with a feed expiration policy that expires indicators missing from the last fetch.
+            Default: *false*
+        :param incremental_fetch: boolean, if *true* fetch-indicators submits only the indicators that were added
+            or changed since the last fetch, see ``FeedIndicatorsDiff``. Default: *false*
         """
         if not credentials:
             credentials = {}
@@ -96,6 +114,18 @@ class Client(BaseClient):
             'quotechar': quotechar,
             'skipinitialspace': skipinitialspace
         }
+        try:
+            self.concurrent_requests = max(int(concurrent_requests), 1)
+        except (ValueError, TypeError):
+            return_error('Please provide an integer value for "Concurrent Requests"')
+        self._host_to_session: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+        self.skip_unchanged_feeds = argToBoolean(skip_unchanged_feeds)
+        self.url_to_cache_info: Dict[str, dict] = {}
+        self.url_to_new_cache_info: Dict[str, dict] = {}
+        self.unchanged_urls: List[str] = []
+        self.incremental_fetch = argToBoolean(incremental_fetch)
 
     def _build_request(self, url):
         r = requests.Request(
@@ -106,63 +136,190 @@ class Client(BaseClient):
 
         return r.prepare()
 
-    def build_iterator(self, **kwargs):
+    def get_session(self, url: str) -> requests.Session:
+        """Gets the session of the URL host, so requests to the same host reuse a single connection pool.
+
+        Args:
+            url: The URL to request.
+
+        Returns:
+            requests.Session. The session of the host.
+        """
+        host = urlparse(url).netloc
+        with self._sessions_lock:
+            session = self._host_to_session.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrent_requests)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._host_to_session[host] = session
+        return session
+
+    def get_feed_config_hash(self, url, fetch_config=None):
+        """Gets a hash of the configuration that determines the indicators of a feed URL,
+        so a URL whose configuration changed is not skipped as unchanged.
+
+        Args:
+            url: The feed's url.
+            fetch_config: The configuration applied by the fetch, e.g. the default indicator type.
+
+        Returns:
+            str. The hash of the configuration.
+        """
+        config = {
+            'feed_config': (self.feed_url_to_config or {}).get(url),
+            'fieldnames': self.fieldnames,
+            'dialect': self.dialect,
+            'ignore_regex': self.ignore_regex.pattern if self.ignore_regex is not None else None,
+            'encoding': self.encoding,
+            'fetch_config': fetch_config
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def fetch_feed_lines(self, url, use_cache=False, config_hash=None, **kwargs):
+        """Sends the request of a single feed URL and divides its content to lines.
+
+        Args:
+            url: The feed's url.
+            use_cache: Whether to skip the URL if its content and configuration did not change since the last fetch.
+            config_hash: The hash of the URL configuration, see ``get_feed_config_hash``.
+            kwargs: Arguments to send with the request.
+
+        Returns:
+            List. List of lines from the feed content, or None if the content did not change.
+        """
+        _session = self.get_session(url)
+
+        prepreq = self._build_request(url)
+
+        # this is to honour the proxy environment variables
+        kwargs.update(_session.merge_environment_settings(
+            prepreq.url,
+            {}, None, None, None  # defaults
+        ))
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+
+        if self.headers:
+            if 'headers' in kwargs:
+                kwargs['headers'].update(self.headers)
+            else:
+                kwargs['headers'] = self.headers
+
+        cache_info = self.url_to_cache_info.get(url, {})
+        # a URL whose configuration changed is parsed again, even if its content did not change
+        if cache_info.get('config') != config_hash:
+            cache_info = {}
+        if use_cache:
+            prepreq.headers.update({
+                header: cache_info[key] for header, key in (('If-None-Match', 'etag'),
+                                                            ('If-Modified-Since', 'last_modified'))
+                if cache_info.get(key)
+            })
+
+        try:
+            r = _session.send(prepreq, **kwargs)
+        except requests.ConnectionError:
+            raise requests.ConnectionError('Failed to establish a new connection.'
+                                           ' Please make sure your URL is valid.')
+        if use_cache and r.status_code == 304:
+            return None
+        try:
+            r.raise_for_status()
+        except Exception:
+            raise DemistoException('Exception in request: {} {}'.format(r.status_code, r.content))
+
+        if use_cache:
+            new_cache_info = {
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+                'digest': hashlib.sha256(r.content).hexdigest(),
+                'size': len(r.content),
+                'config': config_hash
+            }
+            if new_cache_info['digest'] == cache_info.get('digest'):
+                self.url_to_new_cache_info[url] = dict(cache_info, etag=new_cache_info['etag'],
+                                                       last_modified=new_cache_info['last_modified'])
+                return None
+            self.url_to_new_cache_info[url] = new_cache_info
+
+        return self.get_feed_content_divided_to_lines(url, r)
+
+    def build_iterator(self, use_cache=False, fetch_config=None, **kwargs):
+        """Fetches the feed URLs, up to ``concurrent_requests`` of them at the same time.
+        A URL that fails is skipped as long as at least one of the URLs succeeds.
+
+        Args:
+            use_cache: Whether to skip the URLs whose content and configuration did not change since the last fetch.
+                The new state of the URLs is kept until ``save_feeds_cache`` is called.
+            fetch_config: The configuration applied by the fetch, e.g. the default indicator type.
+        """
         results = []
+        errors = []
         urls = self._base_url
         if not isinstance(urls, list):
             urls = [urls]
-        for url in urls:
-            _session = requests.Session()
-
-            prepreq = self._build_request(url)
-
-            # this is to honour the proxy environment variables
-            kwargs.update(_session.merge_environment_settings(
-                prepreq.url,
-                {}, None, None, None  # defaults
-            ))
-            kwargs['stream'] = True
-            kwargs['verify'] = self._verify
-            kwargs['timeout'] = self.polling_timeout
-
-            if self.headers:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(self.headers)
+        if use_cache:
+            self.url_to_cache_info = demisto.getIntegrationContext().get(FEEDS_CACHE_KEY, {})
+            self.unchanged_urls = []
+        with ThreadPoolExecutor(max_workers=max(min(self.concurrent_requests, len(urls)), 1)) as executor:
+            future_to_url = {executor.submit(self.fetch_feed_lines, url, use_cache,
+                                             self.get_feed_config_hash(url, fetch_config), **kwargs): url
+                             for url in urls}
+            # the responses are handed to the parser in the order they arrive
+            for future in as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    demisto.error(f'Failed to fetch {url}: {e}')
+                    errors.append(e)
+                    continue
+                if response is None:
+                    self.unchanged_urls.append(url)
+                    continue
+
+                if self.feed_url_to_config:
+                    fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
                 else:
-                    kwargs['headers'] = self.headers
-
-            try:
-                r = _session.send(prepreq, **kwargs)
-            except requests.ConnectionError:
-                raise requests.ConnectionError('Failed to establish a new connection.'
-                                               ' Please make sure your URL is valid.')
-            try:
-                r.raise_for_status()
-            except Exception:
-                return_error('Exception in request: {} {}'.format(r.status_code, r.content))
-                raise
-
-            response = self.get_feed_content_divided_to_lines(url, r)
-            if self.feed_url_to_config:
-                fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
-            else:
-                fieldnames = self.fieldnames
-            if self.ignore_regex is not None:
-                response = filter(  # type: ignore
-                    lambda x: self.ignore_regex.match(x) is None,  # type: ignore
-                    response
+                    fieldnames = self.fieldnames
+                if self.ignore_regex is not None:
+                    response = filter(  # type: ignore
+                        lambda x: self.ignore_regex.match(x) is None,  # type: ignore
+                        response
+                    )
+
+                csvreader = csv.DictReader(
+                    response,
+                    fieldnames=fieldnames,
+                    **self.dialect
                 )
 
-            csvreader = csv.DictReader(
-                response,
-                fieldnames=fieldnames,
-                **self.dialect
-            )
-
-            results.append({url: csvreader})
+                results.append({url: csvreader})
 
+        # a single unavailable URL should not fail the indicators of the other URLs
+        if errors and len(errors) == len(urls):
+            raise errors[0]
         return results
 
+    def save_feeds_cache(self):
+        """Stores the state of the URLs fetched with ``use_cache`` in the integration context,
+        and reports what was skipped.
+        Should be called only after the indicators were submitted, so a failed run is not skipped next time.
+        """
+        skipped_bytes = sum(self.url_to_cache_info.get(url, {}).get('size', 0) for url in self.unchanged_urls)
+        skipped_indicators = sum(self.url_to_cache_info.get(url, {}).get('indicators', 0) for url in self.unchanged_urls)
+        demisto.info(f'{len(self.unchanged_urls)} unchanged feed URLs were skipped, '
+                     f'{skipped_bytes} bytes and {skipped_indicators} indicators were not processed again.')
+
+        self.url_to_cache_info.update(self.url_to_new_cache_info)
+        integration_context = demisto.getIntegrationContext()
+        integration_context[FEEDS_CACHE_KEY] = self.url_to_cache_info
+        demisto.setIntegrationContext(integration_context)
+        self.url_to_new_cache_info = {}
+
     def get_feed_content_divided_to_lines(self, url, raw_response):
         """Fetch feed data and divides its content to lines
 
@@ -240,13 +397,18 @@ def create_fields_mapping(raw_json: Dict[str, Any], mapping: Dict[str, Union[Tup
     return fields_mapping
 
 
-def fetch_indicators_command(client: Client, default_indicator_type: str, **kwargs):
-    iterator = client.build_iterator(**kwargs)
+def fetch_indicators_command(client: Client, default_indicator_type: str,
+                             indicators_diff: FeedIndicatorsDiff = None, **kwargs):
+    iterator = client.build_iterator(fetch_config={'indicator_type': default_indicator_type}, **kwargs)
     indicators = []
     config = client.feed_url_to_config or {}
     for url_to_reader in iterator:
         for url, reader in url_to_reader.items():
+            if indicators_diff is not None:
+                # a URL with no indicators is added as well, so its removed indicators are found
+                indicators_diff.add_source(url)
             mapping = config.get(url, {}).get('mapping', {})
+            indicators_count = 0
             for item in reader:
                 raw_json = dict(item)
                 value = item.get('value')
@@ -263,7 +425,11 @@ def fetch_indicators_command(client: Client, default_indicator_type: str, **kwar
                         'rawJSON': raw_json,
                         'fields': create_fields_mapping(raw_json, mapping) if mapping else {}
                     }
-                    indicators.append(indicator)
+                    indicators_count += 1
+                    if indicators_diff is None or indicators_diff.is_new_or_changed(url, indicator):
+                        indicators.append(indicator)
+            if url in client.url_to_new_cache_info:
+                client.url_to_new_cache_info[url]['indicators'] = indicators_count
 
     return indicators
 
@@ -277,6 +443,26 @@ def get_indicators_command(client, args):
     return hr, {}, indicators_list
 
 
+def get_removed_indicators_command(client, args):
+    """Gets the indicators that were removed from the feed URLs in their last fetch, see ``FeedIndicatorsDiff``.
+
+    Args:
+        client: The client.
+        args: The command arguments.
+
+    Returns:
+        tuple. The readable output, the context and the raw response.
+    """
+    if not client.incremental_fetch:
+        return 'The removed indicators are tracked only when incremental fetch is enabled.', {}, []
+    limit = int(args.get('limit', 50))
+    removed = [{'Value': indicator['value'], 'Type': indicator['type'], 'Source': indicator['source']}
+               for indicator in FeedIndicatorsDiff().get_removed_indicators()[:limit]]
+    hr = tableToMarkdown('Indicators removed from the feed in the last fetch', removed,
+                         headers=['Value', 'Type', 'Source'])
+    return hr, {'FeedRemovedIndicator(val.Value == obj.Value && val.Source == obj.Source)': removed}, removed
+
+
 def feed_main(feed_name, params=None, prefix=''):
     if not params:
         params = {k: v for k, v in demisto.params().items() if v is not None}
@@ -290,14 +476,24 @@ def feed_main(feed_name, params=None, prefix=''):
     # Switch case
     commands: dict = {
         'test-module': module_test_command,
-        f'{prefix}get-indicators': get_indicators_command
+        f'{prefix}get-indicators': get_indicators_command,
+        f'{prefix}get-removed-indicators': get_removed_indicators_command
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, params.get('indicator_type'))
+            indicators_diff = FeedIndicatorsDiff() if client.incremental_fetch else None
+            indicators = fetch_indicators_command(client, params.get('indicator_type'),
+                                                  indicators_diff=indicators_diff,
+                                                  use_cache=client.skip_unchanged_feeds)
             # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)  # type: ignore
+            create_indicators_in_batches(indicators)
+            if client.skip_unchanged_feeds:
+                client.save_feeds_cache()
+            if indicators_diff is not None:
+                for source, counts in indicators_diff.save().items():
+                    demisto.info(f'{source} - {counts["new_or_changed"]} new or changed indicators were submitted, '
+                                 f'{counts["unchanged"]} unchanged indicators were skipped '
+                                 f'and {counts["removed"]} indicators were removed since the last fetch.')
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
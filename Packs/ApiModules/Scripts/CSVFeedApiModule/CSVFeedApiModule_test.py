@@ -156,3 +156,75 @@ def test_date_format_parsing():
 
     formatted_date = date_format_parsing('2020-02-01 12:13:14.11111')
     assert formatted_date == '2020-02-01T12:13:14Z'
+
+
+def test_build_iterator_isolates_failed_urls(mocker):
+    """
+    Given
+    - A feed with 2 URLs, one of them returns an error.
+
+    When
+    - Building the iterator with concurrent requests.
+
+    Then
+    - Ensure the rows of the valid URL are returned, and the failed URL is only logged.
+    """
+    feed_url_to_config = {
+        'https://ipstack.com': {
+            'fieldnames': ['value'],
+            'indicator_type': 'IP'
+        },
+        'https://ipstack.com/broken': {
+            'fieldnames': ['value'],
+            'indicator_type': 'IP'
+        }
+    }
+    mocker.patch.object(demisto, 'error')
+    with requests_mock.Mocker() as m:
+        m.get('https://ipstack.com', content=b'1.1.1.1\n2.2.2.2')
+        m.get('https://ipstack.com/broken', status_code=500)
+        client = Client(
+            url=list(feed_url_to_config.keys()),
+            feed_url_to_config=feed_url_to_config,
+            concurrent_requests=2
+        )
+        results = client.build_iterator()
+
+    assert len(results) == 1
+    assert [row['value'] for row in results[0]['https://ipstack.com']] == ['1.1.1.1', '2.2.2.2']
+    assert demisto.error.call_count == 1
+
+
+def test_feed_main_skip_unchanged_feeds(mocker):
+    """
+    Given
+    - A feed with skip_unchanged_feeds enabled, whose URL answers 304 to the cached ETag.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure the If-None-Match header is sent and no indicators are submitted.
+    - Ensure the skipped bytes and indicators are reported.
+    """
+    params = {
+        'url': 'https://ipstack.com',
+        'feed_url_to_config': {'https://ipstack.com': {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'skip_unchanged_feeds': True
+    }
+    config_hash = Client(**params).get_feed_config_hash('https://ipstack.com', {'indicator_type': None})
+    mocker.patch.object(demisto, 'params', return_value=params)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value={'feeds_cache': {
+        'https://ipstack.com': {'etag': '"v1"', 'digest': 'a', 'size': 100, 'indicators': 7, 'config': config_hash}
+    }})
+    mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'info')
+    with requests_mock.Mocker() as m:
+        not_modified = m.get('https://ipstack.com', status_code=304)
+        feed_main('great_feed_name')
+
+    assert not_modified.last_request.headers['If-None-Match'] == '"v1"'
+    assert demisto.createIndicators.call_count == 0
+    assert '1 unchanged feed URLs were skipped, 100 bytes and 7 indicators' in demisto.info.call_args[0][0]
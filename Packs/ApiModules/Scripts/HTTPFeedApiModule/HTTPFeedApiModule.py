@@ -6,21 +6,131 @@ from CommonServerUserPython import *
 import urllib3
 import requests
 import traceback
+import itertools
+import threading
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from dateutil.parser import parse
-from typing import Optional, Pattern, List
+from typing import Optional, Pattern, List, Dict
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
 ''' GLOBALS '''
 TAGS = 'feedTags'
+DEFAULT_CONCURRENT_REQUESTS = 5
+# integration context key of the ETag, Last-Modified and content digest of each feed URL
+FEEDS_CACHE_KEY = 'feeds_cache'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# matches the group references of a transform template, e.g. \1 or \g<1>
+TRANSFORM_GROUP_REFERENCE = re.compile(r'\\g<(\d+)>|\\([1-9])(?!\d)')
+
+
+def compile_transform(transform: str) -> Optional[list]:
+    """
+    Split a transform template into its literal strings and group numbers, so applying it does not
+    re-parse the template on every line like ``Match.expand`` does.
+    :param transform: The transform template, for example: '\\1/\\2'
+    :return: The template parts, or None if the template has escapes other than group references.
+    """
+    parts: list = []
+    position = 0
+    for reference in TRANSFORM_GROUP_REFERENCE.finditer(transform):
+        parts.append(transform[position:reference.start()])
+        parts.append(int(reference.group(1) or reference.group(2)))
+        position = reference.end()
+    parts.append(transform[position:])
+    if any('\\' in part for part in parts if isinstance(part, str)):
+        return None
+    return [part for part in parts if part != '']
+
+
+def expand_transform(match, parts: list) -> str:
+    """
+    Apply compiled transform parts (see ``compile_transform``) to a regex match.
+    :param match: The regex match.
+    :param parts: The compiled transform parts.
+    :return: The transformed value.
+    """
+    if len(parts) == 1 and isinstance(parts[0], int):
+        return match.group(parts[0]) or ''
+    return ''.join(part if isinstance(part, str) else match.group(part) or '' for part in parts)
+
+
+class ExtractionPlan:
+    def __init__(self, feed_config: dict, feed_name: str = 'http'):
+        """Precompiled extraction instructions of a single feed URL.
+        The plan is built once per client, so parsing a line does not re-read the feed configuration
+        or re-compile any of its regular expressions and transforms.
+        :param feed_config: The configuration of the URL, see ``feed_url_to_config`` in the ``Client``.
+        :param feed_name: The name of the feed.
+        """
+        if not isinstance(feed_config, dict):
+            feed_config = {}
+        self.indicator_type: Optional[str] = feed_config.get('indicator_type')
+        self.indicator_regex: Optional[Pattern] = None
+        self.indicator_transform: str = r'\g<0>'
+        indicator = feed_config.get('indicator')
+        if indicator:
+            if 'regex' in indicator:
+                self.indicator_regex = re.compile(indicator['regex'])
+            self.indicator_transform = indicator.get('transform', r'\g<0>')
+        self.indicator_transform_parts = compile_transform(self.indicator_transform)
+
+        self.fields: List[tuple] = []
+        for field in feed_config.get('fields', []):
+            for f, fattrs in field.items():
+                if 'regex' not in fattrs:
+                    raise ValueError(f'{feed_name} - {f} field does not have a regex')
+                transform = fattrs.get('transform', r'\g<0>')
+                self.fields.append((f, re.compile(fattrs['regex']), transform, compile_transform(transform)))
+
+    def extract_indicator(self, line: str) -> Optional[str]:
+        """Extracts the indicator value from a (stripped) feed line.
+        :param line: The feed line.
+        :return: The indicator value, or None if the indicator regex does not match the line.
+        """
+        if self.indicator_regex is None:
+            return line.split()[0]
+        indicator_match = self.indicator_regex.search(line)
+        if indicator_match is None:
+            return None
+        if self.indicator_transform_parts is None:
+            return indicator_match.expand(self.indicator_transform)
+        return expand_transform(indicator_match, self.indicator_transform_parts)
+
+    def extract_fields(self, line: str) -> dict:
+        """Extracts the fields of the plan from a (stripped) feed line.
+        :param line: The feed line.
+        :return: The extracted fields, integer values are converted to int.
+        """
+        attributes: dict = {}
+        for f, regex, transform, transform_parts in self.fields:
+            field_match = regex.search(line)
+            if field_match is None:
+                continue
+            if transform_parts is None:
+                attributes[f] = field_match.expand(transform)
+            else:
+                attributes[f] = expand_transform(field_match, transform_parts)
+
+        for f, value in attributes.items():
+            try:
+                attributes[f] = int(value)
+            except Exception:
+                pass
+        return attributes
 
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_name: str = 'http', insecure: bool = False, credentials: dict = None,
                  ignore_regex: str = None, encoding: str = None, indicator_type: str = '',
                  indicator: str = '', fields: str = '{}', feed_url_to_config: dict = None, polling_timeout: int = 20,
-                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None, **kwargs):
+                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None,
+                 concurrent_requests: int = DEFAULT_CONCURRENT_REQUESTS, skip_unchanged_feeds: bool = False,
+                 incremental_fetch: bool = False, **kwargs):
         """Implements class for miners of plain text feeds over HTTP.
         **Config parameters**
         :param: url: URL of the feed.
@@ -60,6 +170,13 @@ class Client(BaseClient):
             }]
         }
         :param: proxy: Use proxy in requests.
+        :param: concurrent_requests: The maximal number of feed URLs to fetch at the same time. Default: 5
+            (it has no effect on a feed with a single URL, so such feeds do not expose it as a parameter).
+        :param: skip_unchanged_feeds: boolean, if *true* fetch-indicators sends conditional requests and skips
+            the URLs whose content did not change since the last fetch (HTTP 304 or an identical content digest).
+            A URL whose configuration changed since the last fetch is never skipped.
+            Should not be used with a feed expiration policy that expires indicators missing from the last fetch.
+            Default: *false*
         **Extraction dictionary**
             Extraction dictionaries contain the following keys:
             :regex: Python regular expression for searching the text.
@@ -137,6 +254,54 @@ class Client(BaseClient):
             custom_fields_mapping = {}
         self.custom_fields_mapping = custom_fields_mapping
 
+        try:
+            self.concurrent_requests = max(int(concurrent_requests), 1)
+        except (ValueError, TypeError):
+            raise ValueError('Please provide an integer value for "Concurrent Requests"')
+        self._host_to_session: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+        self.skip_unchanged_feeds = argToBoolean(skip_unchanged_feeds)
+        self.url_to_cache_info: Dict[str, dict] = {}
+        self.url_to_new_cache_info: Dict[str, dict] = {}
+        self.unchanged_urls: List[str] = []
+        self.incremental_fetch = argToBoolean(incremental_fetch)
+
+        self.url_to_extraction_plan: Dict[str, ExtractionPlan] = {}
+        if isinstance(self.feed_url_to_config, dict):
+            for feed_url, feed_config in self.feed_url_to_config.items():
+                self.url_to_extraction_plan[feed_url] = ExtractionPlan(feed_config, self.feed_name)
+
+    def get_extraction_plan(self, url: str) -> ExtractionPlan:
+        """
+        Get the precompiled extraction plan of a feed URL.
+        :param url: The feed URL
+        :return: The extraction plan
+        """
+        plan = self.url_to_extraction_plan.get(url)
+        if plan is None:
+            plan = self.url_to_extraction_plan[url] = ExtractionPlan({}, self.feed_name)
+        return plan
+
+    def get_feed_config_hash(self, url: str, fetch_config: Optional[dict] = None) -> str:
+        """
+        Get a hash of the configuration that determines the indicators of a feed URL,
+        so a URL whose configuration changed is not skipped as unchanged.
+        :param url: The feed URL
+        :param fetch_config: The configuration applied by the fetch, e.g. the default indicator type and tags.
+        :return: The hash of the configuration
+        """
+        feed_config = self.feed_url_to_config.get(url) if isinstance(self.feed_url_to_config, dict) else None
+        config = {
+            'feed_config': feed_config,
+            'indicator_type': self.indicator_type,
+            'ignore_regex': self.ignore_regex.pattern if self.ignore_regex is not None else None,
+            'encoding': self.encoding,
+            'custom_fields_mapping': self.custom_fields_mapping,
+            'fetch_config': fetch_config
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
     def get_feed_config(self, fields_json: str = '', indicator_json: str = ''):
         """
         Get the feed configuration from the indicator and field JSON strings.
@@ -188,9 +353,96 @@ class Client(BaseClient):
 
         return config
 
-    def build_iterator(self, **kwargs):
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Get the session of the URL host, so requests to the same host reuse a single connection pool.
+        :param url: The URL to request.
+        :return: The session of the host
         """
-        For each URL (service), send an HTTP request to get indicators and return them after filtering by Regex
+        host = urlparse(url).netloc
+        with self._sessions_lock:
+            session = self._host_to_session.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrent_requests)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._host_to_session[host] = session
+        return session
+
+    def send_feed_request(self, url: str, use_cache: bool = False, config_hash: Optional[str] = None, **kwargs):
+        """
+        Send the HTTP request of a single feed URL.
+        :param url: The feed URL.
+        :param use_cache: Whether to skip the URL if its content and configuration did not change since the last fetch.
+        :param config_hash: The hash of the URL configuration, see ``get_feed_config_hash``.
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: The (streamed) response, the downloaded content file when using the cache,
+            or None if the content did not change.
+        """
+        cache_info = self.url_to_cache_info.get(url, {})
+        # a URL whose configuration changed is parsed again, even if its content did not change
+        if cache_info.get('config') != config_hash:
+            cache_info = {}
+        if use_cache:
+            headers = dict(kwargs.get('headers') or {})
+            if cache_info.get('etag'):
+                headers['If-None-Match'] = cache_info['etag']
+            if cache_info.get('last_modified'):
+                headers['If-Modified-Since'] = cache_info['last_modified']
+            kwargs['headers'] = headers
+        try:
+            r = self.get_session(url).get(
+                url,
+                **kwargs
+            )
+        except requests.ConnectionError:
+            raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
+        if use_cache and r.status_code == 304:
+            r.close()
+            return None
+        try:
+            r.raise_for_status()
+        except Exception:
+            LOG(f'{self.feed_name!r} - exception in request:'
+                f' {r.status_code!r} {r.content!r}')
+            raise
+        if not use_cache:
+            return r
+
+        # the content is spooled to disk while it is hashed, so an unchanged feed is never parsed
+        # and a changed one is still parsed line by line
+        content_file = tempfile.TemporaryFile()
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            content_file.write(chunk)
+            size += len(chunk)
+        new_cache_info = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'digest': digest.hexdigest(),
+            'size': size,
+            'config': config_hash
+        }
+        if new_cache_info['digest'] == cache_info.get('digest'):
+            content_file.close()
+            self.url_to_new_cache_info[url] = dict(cache_info, etag=new_cache_info['etag'],
+                                                   last_modified=new_cache_info['last_modified'])
+            return None
+        self.url_to_new_cache_info[url] = new_cache_info
+        content_file.seek(0)
+        return content_file
+
+    def build_iterator(self, use_cache: bool = False, fetch_config: Optional[dict] = None, **kwargs):
+        """
+        For each URL (service), send an HTTP request to get indicators and return them after filtering by Regex.
+        Up to ``concurrent_requests`` URLs are requested at the same time, and a URL that fails is skipped
+        as long as at least one of the URLs succeeds.
+        :param use_cache: Whether to skip the URLs whose content and configuration did not change since the last fetch.
+            The new state of the URLs is kept until ``save_feeds_cache`` is called.
+        :param fetch_config: The configuration applied by the fetch, e.g. the default indicator type and tags.
         :param kwargs: Arguments to send to the HTTP API endpoint
         :return: List of indicators
         """
@@ -203,30 +455,42 @@ class Client(BaseClient):
 
         if self.username is not None and self.password is not None:
             kwargs['auth'] = (self.username, self.password)
-        try:
-            urls = self._base_url
-            url_to_response_list: List[dict] = []
-            if not isinstance(urls, list):
-                urls = [urls]
-            for url in urls:
-                r = requests.get(
-                    url,
-                    **kwargs
-                )
+        if use_cache:
+            self.url_to_cache_info = demisto.getIntegrationContext().get(FEEDS_CACHE_KEY, {})
+            self.unchanged_urls = []
+        urls = self._base_url
+        if not isinstance(urls, list):
+            urls = [urls]
+        url_to_response_list: List[dict] = []
+        errors: List[Exception] = []
+        with ThreadPoolExecutor(max_workers=max(min(self.concurrent_requests, len(urls)), 1)) as executor:
+            future_to_url = {executor.submit(self.send_feed_request, url, use_cache,
+                                             self.get_feed_config_hash(url, fetch_config), **kwargs): url
+                             for url in urls}
+            # the responses are handed to the parser in the order they arrive
+            for future in as_completed(future_to_url):
+                url = future_to_url[future]
                 try:
-                    r.raise_for_status()
-                except Exception:
-                    LOG(f'{self.feed_name!r} - exception in request:'
-                        f' {r.status_code!r} {r.content!r}')
-                    raise
-                url_to_response_list.append({url: r})
-        except requests.ConnectionError:
-            raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
+                    response = future.result()
+                except Exception as e:
+                    demisto.error(f'{self.feed_name!r} - failed to fetch {url}: {e}')
+                    errors.append(e)
+                    continue
+                if response is None:
+                    self.unchanged_urls.append(url)
+                else:
+                    url_to_response_list.append({url: response})
+        # a single unavailable URL should not fail the indicators of the other URLs
+        if errors and len(errors) == len(urls):
+            raise errors[0]
 
         results = []
         for url_to_response in url_to_response_list:
             for url, lines in url_to_response.items():
-                result = lines.iter_lines()
+                if isinstance(lines, requests.Response):
+                    result = lines.iter_lines()
+                else:
+                    result = map(lambda x: x.rstrip(b'\r\n'), lines)
                 if self.encoding is not None:
                     result = map(
                         lambda x: x.decode(self.encoding).encode('utf_8'),
@@ -245,6 +509,22 @@ class Client(BaseClient):
                 results.append({url: result})
         return results
 
+    def save_feeds_cache(self):
+        """
+        Store the state of the URLs fetched with ``use_cache`` in the integration context, and report what was skipped.
+        Should be called only after the indicators were submitted, so a failed run is not skipped next time.
+        """
+        skipped_bytes = sum(self.url_to_cache_info.get(url, {}).get('size', 0) for url in self.unchanged_urls)
+        skipped_indicators = sum(self.url_to_cache_info.get(url, {}).get('indicators', 0) for url in self.unchanged_urls)
+        demisto.info(f'{self.feed_name!r} - {len(self.unchanged_urls)} unchanged feed URLs were skipped, '
+                     f'{skipped_bytes} bytes and {skipped_indicators} indicators were not processed again.')
+
+        self.url_to_cache_info.update(self.url_to_new_cache_info)
+        integration_context = demisto.getIntegrationContext()
+        integration_context[FEEDS_CACHE_KEY] = self.url_to_cache_info
+        demisto.setIntegrationContext(integration_context)
+        self.url_to_new_cache_info = {}
+
     def custom_fields_creator(self, attributes: dict):
         created_custom_fields = {}
         for attribute in attributes.keys():
@@ -273,66 +553,37 @@ def get_indicator_fields(line, url, feed_tags: list, client: Client):
     """
     attributes = None
     value: str = ''
-    indicator = None
-    fields_to_extract = []
-    feed_config = client.feed_url_to_config.get(url, {})
-    if feed_config:
-        if 'indicator' in feed_config:
-            indicator = feed_config['indicator']
-            if 'regex' in indicator:
-                indicator['regex'] = re.compile(indicator['regex'])
-            if 'transform' not in indicator:
-                indicator['transform'] = r'\g<0>'
-
-    if 'fields' in feed_config:
-        fields = feed_config['fields']
-        for field in fields:
-            for f, fattrs in field.items():
-                field = {f: {}}
-                if 'regex' in fattrs:
-                    field[f]['regex'] = re.compile(fattrs['regex'])
-                if 'transform' not in fattrs:
-                    field[f]['transform'] = r'\g<0>'
-                else:
-                    field[f]['transform'] = fattrs['transform']
-                fields_to_extract.append(field)
+    plan = client.get_extraction_plan(url)
 
     line = line.strip()
     if line:
-        extracted_indicator = line.split()[0]
-        if indicator:
-            extracted_indicator = indicator['regex'].search(line)
-            if extracted_indicator is None:
-                return attributes, value
-            if 'transform' in indicator:
-                extracted_indicator = extracted_indicator.expand(indicator['transform'])
-        attributes = {}
-        for field in fields_to_extract:
-            for f, fattrs in field.items():
-                m = fattrs['regex'].search(line)
-
-                if m is None:
-                    continue
-
-                attributes[f] = m.expand(fattrs['transform'])
-
-                try:
-                    i = int(attributes[f])
-                except Exception:
-                    pass
-                else:
-                    attributes[f] = i
+        extracted_indicator = plan.extract_indicator(line)
+        if extracted_indicator is None:
+            return attributes, value
+        attributes = plan.extract_fields(line)
         attributes['value'] = value = extracted_indicator
-        attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+        attributes['type'] = plan.indicator_type or client.indicator_type
         attributes['tags'] = feed_tags
     return attributes, value
 
 
-def fetch_indicators_command(client, feed_tags, itype, **kwargs):
-    iterators = client.build_iterator(**kwargs)
-    indicators = []
+def fetch_indicators_generator(client, feed_tags, itype, indicators_diff: FeedIndicatorsDiff = None, **kwargs):
+    """
+    Lazily fetch the indicators from all the feed URLs, one indicator at a time.
+    Nothing is accumulated, so memory stays constant regardless of the feed size.
+    :param client: The client
+    :param feed_tags: The indicator tags.
+    :param itype: The default indicator type.
+    :param indicators_diff: If given, only the indicators that were added or changed since the last fetch are yielded.
+    :return: A generator of indicators
+    """
+    iterators = client.build_iterator(fetch_config={'indicator_type': itype, 'tags': feed_tags}, **kwargs)
     for iterator in iterators:
         for url, lines in iterator.items():
+            if indicators_diff is not None:
+                # a URL with no indicators is added as well, so its removed indicators are found
+                indicators_diff.add_source(url)
+            indicators_count = 0
             for line in lines:
                 attributes, value = get_indicator_fields(line, url, feed_tags, client)
                 if value:
@@ -354,20 +605,44 @@ def fetch_indicators_command(client, feed_tags, itype, **kwargs):
                         custom_fields = client.custom_fields_creator(attributes)
                         indicator_data["fields"] = custom_fields
 
-                    indicators.append(indicator_data)
-    return indicators
+                    indicators_count += 1
+                    if indicators_diff is None or indicators_diff.is_new_or_changed(url, indicator_data):
+                        yield indicator_data
+            if url in client.url_to_new_cache_info:
+                client.url_to_new_cache_info[url]['indicators'] = indicators_count
+
+
+def fetch_indicators_command(client, feed_tags, itype, **kwargs):
+    return list(fetch_indicators_generator(client, feed_tags, itype, **kwargs))
 
 
 def get_indicators_command(client: Client, args):
     itype = args.get('indicator_type', client.indicator_type)
     limit = int(args.get('limit'))
     feed_tags = args.get('feedTags')
-    indicators_list = fetch_indicators_command(client, feed_tags, itype)[:limit]
+    indicators_list = list(itertools.islice(fetch_indicators_generator(client, feed_tags, itype), limit))
     entry_result = camelize(indicators_list)
     hr = tableToMarkdown('Indicators', entry_result, headers=['Value', 'Type', 'Rawjson'])
     return hr, {}, indicators_list
 
 
+def get_removed_indicators_command(client: Client, args):
+    """
+    Get the indicators that were removed from the feed URLs in their last fetch, see ``FeedIndicatorsDiff``.
+    :param client: The client
+    :param args: The command arguments
+    :return: The readable output, the context and the raw response
+    """
+    if not client.incremental_fetch:
+        return 'The removed indicators are tracked only when incremental fetch is enabled.', {}, []
+    limit = int(args.get('limit', 50))
+    removed = [{'Value': indicator['value'], 'Type': indicator['type'], 'Source': indicator['source']}
+               for indicator in FeedIndicatorsDiff().get_removed_indicators()[:limit]]
+    hr = tableToMarkdown('Indicators removed from the feed in the last fetch', removed,
+                         headers=['Value', 'Type', 'Source'])
+    return hr, {'FeedRemovedIndicator(val.Value == obj.Value && val.Source == obj.Source)': removed}, removed
+
+
 def test_module(client: Client, args):
     if not client.feed_url_to_config:
         indicator_type = args.get('indicator_type', demisto.params().get('indicator_type'))
@@ -398,14 +673,25 @@ def feed_main(feed_name, params=None, prefix=''):
     # Switch case
     commands: dict = {
         'test-module': test_module,
-        f'{prefix}get-indicators': get_indicators_command
+        f'{prefix}get-indicators': get_indicators_command,
+        f'{prefix}get-removed-indicators': get_removed_indicators_command
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, feed_tags, params.get('indicator_type'))
-            # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            indicators_diff = FeedIndicatorsDiff() if client.incremental_fetch else None
+            indicators = fetch_indicators_generator(client, feed_tags, params.get('indicator_type'),
+                                                    indicators_diff=indicators_diff,
+                                                    use_cache=client.skip_unchanged_feeds)
+            # we submit the indicators in batches, without holding the whole feed in memory.
+            # the generator makes no demisto calls once started, so a batch is parsed while the previous one is sent
+            create_indicators_in_batches(indicators, pipeline=True)
+            if client.skip_unchanged_feeds:
+                client.save_feeds_cache()
+            if indicators_diff is not None:
+                for source, counts in indicators_diff.save().items():
+                    demisto.info(f'{source} - {counts["new_or_changed"]} new or changed indicators were submitted, '
+                                 f'{counts["unchanged"]} unchanged indicators were skipped '
+                                 f'and {counts["removed"]} indicators were removed since the last fetch.')
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
@@ -1,4 +1,8 @@
-from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main
+from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main, \
+    fetch_indicators_generator, compile_transform, expand_transform, get_indicator_fields
+from CommonServerPython import batch
+import pytest
+import re
 import requests_mock
 import demistomock as demisto
 
@@ -287,3 +291,282 @@ def test_feed_main_test_module(mocker, requests_mock):
     assert demisto.results.call_count == 1
     results = demisto.results.call_args[0][0]
     assert results['HumanReadable'] == 'ok'
+
+
+def test_fetch_indicators_generator_is_lazy(mocker):
+    """
+    Given
+    - A feed whose lines are served by an endless generator.
+
+    When
+    - Consuming only the first few indicators of fetch_indicators_generator.
+
+    Then
+    - Ensure the indicators are yielded without reading the whole feed.
+    """
+    def endless_lines():
+        i = 0
+        while True:
+            yield f'AS{i} ; US | SOME ORG'
+            i += 1
+
+    url = 'https://www.spamhaus.org/drop/asndrop.txt'
+    client = Client(url=url, feed_url_to_config={url: {'indicator_type': 'ASN', 'indicator': {'regex': '^AS[0-9]+'}}})
+    mocker.patch.object(client, 'build_iterator', return_value=[{url: endless_lines()}])
+    first_batch = next(batch(fetch_indicators_generator(client, [], 'ASN'), batch_size=3))
+    assert [indicator['value'] for indicator in first_batch] == ['AS0', 'AS1', 'AS2']
+
+
+@pytest.mark.parametrize('transform, line', [
+    (r'\1/\2', '1.2.3.4\t24'),
+    (r'\g<0>', '1.2.3.4\t24'),
+    (r'ip-\g<1>-\2.', '1.2.3.4\t24'),
+    (r'\1', '1.2.3.4'),
+    ('', '1.2.3.4\t24'),
+])
+def test_compile_transform(transform, line):
+    """
+    Given
+    - A transform template and a line matched by a regex with an optional group.
+
+    When
+    - Expanding the compiled transform.
+
+    Then
+    - Ensure the result is identical to re.Match.expand.
+    """
+    match = re.compile(r'^(\S+)\t?(\d+)?').search(line)
+    assert expand_transform(match, compile_transform(transform)) == match.expand(transform)
+
+
+def test_compile_transform_unsupported_escape():
+    assert compile_transform(r'\1\t\2') is None
+
+
+def test_get_indicator_fields_uses_extraction_plan():
+    """
+    Given
+    - A client configured with a URL to config mapping, including a field with an escape in its transform.
+
+    When
+    - Extracting the indicator fields of a line.
+
+    Then
+    - Ensure the extraction plan was built once in the client and the fields are extracted as before.
+    """
+    url = 'https://www.dshield.org/block.txt'
+    client = Client(url=url, feed_url_to_config={url: {
+        'indicator_type': 'CIDR',
+        'indicator': {'regex': r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\t[\d.]*\t(\d{1,2})', 'transform': r'\1/\2'},
+        'fields': [
+            {'numberofattacks': {'regex': r'^.*\t.*\t[0-9]+\t([0-9]+)', 'transform': r'\1'}},
+            {'networkname': {'regex': r'^.*\t.*\t[0-9]+\t[0-9]+\t([^\t]+)', 'transform': r'\1\t'}},
+            {'geocountry': {'regex': r'^.*\t.*\t[0-9]+\t[0-9]+\t[^\t]+\t([A-Z]+)'}}
+        ]
+    }})
+    plan = client.get_extraction_plan(url)
+    assert plan.indicator_regex.pattern.startswith('^')
+    assert plan.fields[1][3] is None
+
+    attributes, value = get_indicator_fields('1.2.3.0\t1.2.3.255\t24\t11\tSOME-NET\tUS', url, ['tag'], client)
+    assert value == '1.2.3.0/24'
+    assert attributes == {
+        'numberofattacks': 11,
+        'networkname': 'SOME-NET\t',
+        'geocountry': '1.2.3.0\t1.2.3.255\t24\t11\tSOME-NET\tUS',
+        'value': value,
+        'type': 'CIDR',
+        'tags': ['tag']
+    }
+
+
+def test_build_iterator_isolates_failed_urls(mocker, requests_mock):
+    """
+    Given
+    - A feed with 3 URLs on the same host, one of them returns an error.
+
+    When
+    - Building the iterator with concurrent requests.
+
+    Then
+    - Ensure the lines of the valid URLs are returned, and the failed URL is only logged.
+    - Ensure the URLs of the same host share a single session.
+    """
+    urls = ['https://www.spamhaus.org/drop/drop.txt', 'https://www.spamhaus.org/drop/edrop.txt',
+            'https://www.spamhaus.org/drop/asndrop.txt']
+    requests_mock.get(urls[0], text='1.1.1.0/24 ; SBL1')
+    requests_mock.get(urls[1], text='2.2.2.0/24 ; SBL2')
+    requests_mock.get(urls[2], status_code=500)
+    mocker.patch.object(demisto, 'error')
+    client = Client(url=urls, feed_url_to_config={url: {} for url in urls}, concurrent_requests=3)
+
+    url_to_lines = {url: list(lines) for iterator in client.build_iterator() for url, lines in iterator.items()}
+
+    assert url_to_lines == {urls[0]: ['1.1.1.0/24 ; SBL1'], urls[1]: ['2.2.2.0/24 ; SBL2']}
+    assert demisto.error.call_count == 1
+    assert len(client._host_to_session) == 1
+
+
+def test_build_iterator_all_urls_failed(mocker, requests_mock):
+    """
+    Given
+    - A feed whose only URL returns an error.
+
+    When
+    - Building the iterator.
+
+    Then
+    - Ensure the error is raised.
+    """
+    url = 'https://www.spamhaus.org/drop/drop.txt'
+    requests_mock.get(url, status_code=404)
+    mocker.patch.object(demisto, 'error')
+    client = Client(url=url)
+    with pytest.raises(Exception, match='404'):
+        client.build_iterator()
+
+
+def test_feed_main_skip_unchanged_feeds(mocker, requests_mock):
+    """
+    Given
+    - A feed with skip_unchanged_feeds enabled, and 3 URLs:
+      one answering 304, one with the same content as the last fetch and one with new content.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure conditional headers are sent with the cached ETag and Last-Modified.
+    - Ensure only the indicators of the changed URL are submitted.
+    - Ensure the cache is updated in the integration context and the skipped bytes and indicators are reported.
+    """
+    import hashlib
+    urls = ['https://feed.com/not_modified.txt', 'https://feed.com/same.txt', 'https://feed.com/new.txt']
+    same_content = b'1.1.1.1\n2.2.2.2\n'
+    params = {
+        'url': urls, 'feed_url_to_config': {url: {'indicator_type': 'IP'} for url in urls},
+        'skip_unchanged_feeds': True
+    }
+    config_hash = Client(**params).get_feed_config_hash
+    fetch_config = {'indicator_type': None, 'tags': []}
+    integration_context = {'feeds_cache': {
+        urls[0]: {'etag': '"v1"', 'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT', 'digest': 'a', 'size': 10,
+                  'indicators': 3, 'config': config_hash(urls[0], fetch_config)},
+        urls[1]: {'etag': None, 'last_modified': None, 'digest': hashlib.sha256(same_content).hexdigest(),
+                  'size': len(same_content), 'indicators': 2, 'config': config_hash(urls[1], fetch_config)},
+    }}
+    mocker.patch.object(demisto, 'params', return_value=params)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value=integration_context)
+    mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'info')
+    not_modified = requests_mock.get(urls[0], status_code=304)
+    requests_mock.get(urls[1], content=same_content)
+    requests_mock.get(urls[2], content=b'3.3.3.3\r\n', headers={'ETag': '"new"'})
+
+    feed_main('great_feed_name')
+
+    assert not_modified.last_request.headers['If-None-Match'] == '"v1"'
+    assert not_modified.last_request.headers['If-Modified-Since'] == 'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert demisto.createIndicators.call_count == 1
+    assert [indicator['value'] for indicator in demisto.createIndicators.call_args[0][0]] == ['3.3.3.3']
+    feeds_cache = demisto.setIntegrationContext.call_args[0][0]['feeds_cache']
+    assert feeds_cache[urls[2]]['etag'] == '"new"'
+    assert feeds_cache[urls[2]]['indicators'] == 1
+    assert feeds_cache[urls[1]]['indicators'] == 2
+    assert '2 unchanged feed URLs were skipped, 26 bytes and 5 indicators' in demisto.info.call_args[0][0]
+
+
+def test_feed_main_skip_unchanged_feeds_config_changed(mocker, requests_mock):
+    """
+    Given
+    - A feed with skip_unchanged_feeds enabled, whose content did not change since the last fetch,
+      but whose configuration (the indicator regex) did.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure no conditional headers are sent and the indicators are extracted with the new configuration.
+    - Ensure the new configuration hash is stored in the cache.
+    """
+    import hashlib
+    url = 'https://feed.com/asn.txt'
+    content = b'AS1 ; US | ORG1\n'
+    params = {
+        'url': url, 'skip_unchanged_feeds': True,
+        'feed_url_to_config': {url: {'indicator_type': 'ASN', 'indicator': {'regex': '^AS[0-9]+'}}}
+    }
+    old_params = dict(params, feed_url_to_config={url: {'indicator_type': 'ASN', 'indicator': {'regex': '^AS'}}})
+    old_config_hash = Client(**old_params).get_feed_config_hash(url, {'indicator_type': None, 'tags': []})
+    mocker.patch.object(demisto, 'params', return_value=params)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value={'feeds_cache': {
+        url: {'etag': '"v1"', 'digest': hashlib.sha256(content).hexdigest(), 'size': len(content), 'indicators': 1,
+              'config': old_config_hash}
+    }})
+    mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'info')
+    feed = requests_mock.get(url, content=content, headers={'ETag': '"v1"'})
+
+    feed_main('great_feed_name')
+
+    assert 'If-None-Match' not in feed.last_request.headers
+    assert [indicator['value'] for indicator in demisto.createIndicators.call_args[0][0]] == ['AS1']
+    feeds_cache = demisto.setIntegrationContext.call_args[0][0]['feeds_cache']
+    assert feeds_cache[url]['config'] not in (None, old_config_hash)
+
+
+def test_feed_main_incremental_fetch(mocker, requests_mock, tmpdir):
+    """
+    Given
+    - A feed with incremental_fetch enabled, fetched three times where one line changed between the first
+      two fetches and one line was removed in the third.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure all the indicators are submitted on the first fetch and only the changed one on the second.
+    - Ensure the indicator removed in the third fetch is returned by the get-removed-indicators command.
+    """
+    url = 'https://feed.com/asn.txt'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'params', return_value={
+        'url': url, 'incremental_fetch': True, 'feed_url_to_config': {url: {
+            'indicator_type': 'ASN', 'indicator': {'regex': '^AS[0-9]+'},
+            'fields': [{'asndrop_org': {'regex': r'^.*\|\W+(.*)', 'transform': r'\1'}}]
+        }}
+    })
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'info')
+    mocker.patch('tempfile.gettempdir', return_value=str(tmpdir))
+
+    requests_mock.get(url, text='AS1 ; US | ORG1\nAS2 ; US | ORG2')
+    feed_main('great_feed_name')
+    assert [i['value'] for i in demisto.createIndicators.call_args[0][0]] == ['AS1', 'AS2']
+
+    requests_mock.get(url, text='AS1 ; US | ORG1\nAS2 ; US | NEW ORG2')
+    feed_main('great_feed_name')
+    assert demisto.createIndicators.call_count == 2
+    assert [i['value'] for i in demisto.createIndicators.call_args[0][0]] == ['AS2']
+    assert '1 new or changed indicators were submitted, 1 unchanged' in demisto.info.call_args[0][0]
+
+    requests_mock.get(url, text='AS2 ; US | NEW ORG2')
+    feed_main('great_feed_name')
+    assert demisto.createIndicators.call_count == 2
+
+    mocker.patch.object(demisto, 'command', return_value='get-removed-indicators')
+    mocker.patch.object(demisto, 'args', return_value={})
+    mocker.patch.object(demisto, 'results')
+    feed_main('great_feed_name')
+    assert demisto.results.call_args[0][0]['EntryContext'] == {
+        'FeedRemovedIndicator(val.Value == obj.Value && val.Source == obj.Source)': [
+            {'Value': 'AS1', 'Type': 'ASN', 'Source': url}
+        ]
+    }
@@ -0,0 +1,140 @@
+import socket
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+IP_VERSION_TO_FAMILY = {4: socket.AF_INET, 6: socket.AF_INET6}
+IP_VERSION_TO_BITS = {4: 32, 6: 128}
+
+
+def ip_to_int(ip: Any) -> Tuple[int, int]:
+    """Converts an IP to its version and integer value.
+
+    Args:
+        ip (Any): an IP string, or an IP object that supports int() and has a version (netaddr or ipaddress).
+
+    Returns:
+        tuple. the IP version (4 or 6) and the integer value of the IP.
+    """
+    if not isinstance(ip, str):
+        return ip.version, int(ip)
+    if ':' in ip:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+
+
+def int_to_ip(ip: int, version: int) -> str:
+    """Converts the integer value of an IP to its string representation.
+
+    Args:
+        ip (int): the integer value of the IP.
+        version (int): the IP version (4 or 6).
+
+    Returns:
+        str. the IP string.
+    """
+    return socket.inet_ntop(IP_VERSION_TO_FAMILY[version], ip.to_bytes(IP_VERSION_TO_BITS[version] // 8, 'big'))
+
+
+def ips_to_sorted_ints(ips: Iterable[Any]) -> Tuple[Dict[int, List[int]], List[str]]:
+    """Converts IPs to sorted lists of integers, one list per IP version.
+
+    Args:
+        ips (Iterable): IP strings or IP objects.
+
+    Returns:
+        tuple. a dict of IP version to a sorted list of integer IPs, and a list of the values that are not valid IPs.
+    """
+    version_to_ints = {4: [], 6: []}  # type: Dict[int, List[int]]
+    invalid_ips = []  # type: List[str]
+    for ip in ips:
+        try:
+            version, ip_int = ip_to_int(ip)
+        except (OSError, ValueError):
+            invalid_ips.append(str(ip))
+            continue
+        version_to_ints[version].append(ip_int)
+    for ip_ints in version_to_ints.values():
+        ip_ints.sort()
+    return version_to_ints, invalid_ips
+
+
+def sorted_ints_to_ranges(sorted_ips: List[int]) -> Iterator[Tuple[int, int]]:
+    """Sweeps sorted integer IPs into ranges of consecutive IPs. Duplicate IPs are merged.
+
+    Args:
+        sorted_ips (list): sorted integer IPs.
+
+    Returns:
+        Iterator. the (first, last) integer IPs of each range.
+    """
+    if not sorted_ips:
+        return
+    first = last = sorted_ips[0]
+    for ip in sorted_ips:
+        if ip <= last + 1:
+            last = max(last, ip)
+            continue
+        yield first, last
+        first = last = ip
+    yield first, last
+
+
+def range_to_cidrs(first: int, last: int, bits: int) -> Iterator[Tuple[int, int]]:
+    """Covers a range of integer IPs with the minimal number of CIDRs.
+
+    Args:
+        first (int): the first integer IP of the range.
+        last (int): the last integer IP of the range.
+        bits (int): the number of bits of the IP version (32 or 128).
+
+    Returns:
+        Iterator. the (network, prefix length) of each CIDR.
+    """
+    while first <= last:
+        # the largest block aligned on the first IP, shrunk until it fits in the range
+        size = (first & -first) or (1 << bits)
+        while size > last - first + 1:
+            size >>= 1
+        yield first, bits - size.bit_length() + 1
+        first += size
+
+
+def collapse_ips_to_ranges(ips: Iterable[Any]) -> List[str]:
+    """Collapses IPs to ranges of consecutive IPs (e.g. 1.1.1.1-1.1.1.3). Single IPs are returned as is.
+
+    Args:
+        ips (Iterable): IPv4 and IPv6 strings or IP objects.
+
+    Returns:
+        list. the IPv4 ranges, followed by the IPv6 ranges and the values that are not valid IPs.
+    """
+    version_to_ints, invalid_ips = ips_to_sorted_ints(ips)
+    collapsed = []  # type: List[str]
+    for version, ip_ints in version_to_ints.items():
+        for first, last in sorted_ints_to_ranges(ip_ints):
+            if first == last:
+                collapsed.append(int_to_ip(first, version))
+            else:
+                collapsed.append(f'{int_to_ip(first, version)}-{int_to_ip(last, version)}')
+    return collapsed + invalid_ips
+
+
+def collapse_ips_to_cidrs(ips: Iterable[Any]) -> List[str]:
+    """Collapses IPs to the minimal list of CIDRs that covers exactly the given IPs. Single IPs are returned as is.
+
+    Args:
+        ips (Iterable): IPv4 and IPv6 strings or IP objects.
+
+    Returns:
+        list. the IPv4 CIDRs, followed by the IPv6 CIDRs and the values that are not valid IPs.
+    """
+    version_to_ints, invalid_ips = ips_to_sorted_ints(ips)
+    collapsed = []  # type: List[str]
+    for version, ip_ints in version_to_ints.items():
+        bits = IP_VERSION_TO_BITS[version]
+        for first, last in sorted_ints_to_ranges(ip_ints):
+            for network, prefix in range_to_cidrs(first, last, bits):
+                if prefix == bits:
+                    collapsed.append(int_to_ip(network, version))
+                else:
+                    collapsed.append(f'{int_to_ip(network, version)}/{prefix}')
+    return collapsed + invalid_ips
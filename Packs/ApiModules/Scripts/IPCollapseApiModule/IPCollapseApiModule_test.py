@@ -0,0 +1,73 @@
+import ipaddress
+import random
+
+import pytest
+from netaddr import IPAddress, IPSet, iprange_to_cidrs
+from IPCollapseApiModule import collapse_ips_to_cidrs, collapse_ips_to_ranges, range_to_cidrs
+
+
+@pytest.mark.parametrize('ips, expected', [
+    ([], []),
+    (['1.1.1.1'], ['1.1.1.1']),
+    (['1.1.1.3', '1.1.1.1', '1.1.1.2', '1.1.1.2'], ['1.1.1.1-1.1.1.3']),
+    (['2.2.2.2', '1.1.1.1', '2001:db8::2', '2001:db8::1'], ['1.1.1.1', '2.2.2.2', '2001:db8::1-2001:db8::2']),
+    (['1.1.1.1', 'not an ip'], ['1.1.1.1', 'not an ip']),
+])
+def test_collapse_ips_to_ranges(ips, expected):
+    assert collapse_ips_to_ranges(ips) == expected
+
+
+@pytest.mark.parametrize('ips, expected', [
+    (['1.1.1.1', '1.1.1.2', '1.1.1.3'], ['1.1.1.1', '1.1.1.2/31']),
+    ([f'10.0.0.{i}' for i in range(256)], ['10.0.0.0/24']),
+    ([f'10.0.0.{i}' for i in range(1, 255)], ['10.0.0.1', '10.0.0.2/31', '10.0.0.4/30', '10.0.0.8/29', '10.0.0.16/28',
+                                              '10.0.0.32/27', '10.0.0.64/26', '10.0.0.128/26', '10.0.0.192/27',
+                                              '10.0.0.224/28', '10.0.0.240/29', '10.0.0.248/30', '10.0.0.252/31',
+                                              '10.0.0.254']),
+    ([IPAddress('2001:db8::'), IPAddress('2001:db8::1'), IPAddress('2001:db8::2')], ['2001:db8::/127', '2001:db8::2']),
+    ([ipaddress.ip_address('0.0.0.0'), ipaddress.ip_address('0.0.0.1')], ['0.0.0.0/31']),
+])
+def test_collapse_ips_to_cidrs(ips, expected):
+    assert collapse_ips_to_cidrs(ips) == expected
+
+
+@pytest.mark.parametrize('first, last, bits', [
+    (0, 2 ** 32 - 1, 32),
+    (0, 2 ** 128 - 1, 128),
+    (int(IPAddress('192.168.0.5')), int(IPAddress('192.168.3.250')), 32),
+    (int(IPAddress('2001:db8::ffff')), int(IPAddress('2001:db8::1:7')), 128),
+])
+def test_range_to_cidrs_matches_netaddr(first, last, bits):
+    """
+    Given
+    - A range of IPs.
+    When
+    - Covering the range with CIDRs.
+    Then
+    - Ensure the CIDRs are the same minimal cover netaddr computes.
+    """
+    version = 4 if bits == 32 else 6
+    expected = [(int(cidr.network), cidr.prefixlen)
+                for cidr in iprange_to_cidrs(IPAddress(first, version), IPAddress(last, version))]
+    assert list(range_to_cidrs(first, last, bits)) == expected
+
+
+def test_collapse_ips_covers_exactly_the_given_ips():
+    """
+    Given
+    - Random IPv4 and IPv6 addresses, clustered so that many of them are consecutive.
+    When
+    - Collapsing them to CIDRs and to ranges.
+    Then
+    - Ensure the result covers exactly the given IPs, with the minimal number of CIDRs.
+    """
+    random.seed(0)
+    ips = [f'10.0.{random.randint(0, 3)}.{random.randint(0, 255)}' for _ in range(800)]
+    ips += [f'2001:db8::{random.randint(0, 1023):x}' for _ in range(800)]
+    cidrs = collapse_ips_to_cidrs(ips)
+    ranges = collapse_ips_to_ranges(ips)
+    expected = IPSet(ips)
+
+    assert IPSet(cidrs) == expected
+    assert len(cidrs) == len(list(expected.iter_cidrs()))
+    assert sum(IPAddress(r.split('-')[-1]).value - IPAddress(r.split('-')[0]).value + 1 for r in ranges) == expected.size
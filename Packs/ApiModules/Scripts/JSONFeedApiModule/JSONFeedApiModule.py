@@ -1,14 +1,22 @@
 from CommonServerPython import *
 
 ''' IMPORTS '''
+import hashlib
+import threading
 import urllib3
 import jmespath
 import tldextract
-from typing import List, Dict, Union, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from typing import List, Dict, Union, Optional, Tuple
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
+DEFAULT_CONCURRENT_REQUESTS = 5
+# integration context key of the ETag, Last-Modified and content digest of each feed
+FEEDS_CACHE_KEY = 'feeds_cache'
+
 
 def auto_detect_indicator_type(indicator_value):
     """Infer the type of the indicator.
@@ -59,7 +67,9 @@ class Client:
     def __init__(self, url: str = '', credentials: dict = None,
                  feed_name_to_config: Dict[str, dict] = None, source_name: str = 'JSON',
                  extractor: str = '', indicator: str = 'indicator',
-                 insecure: bool = False, cert_file: str = None, key_file: str = None, headers: dict = None, **_):
+                 insecure: bool = False, cert_file: str = None, key_file: str = None, headers: dict = None,
+                 concurrent_requests: int = DEFAULT_CONCURRENT_REQUESTS, skip_unchanged_feeds: bool = False,
+                 incremental_fetch: bool = False, **_):
         """
         Implements class for miners of JSON feeds over http/https.
         :param url: URL of the feed.
@@ -70,6 +80,14 @@ class Client:
         :param source_name: feed source name
         If None no additional attributes will be extracted.
         :param insecure: if *False* feed HTTPS server certificate will be verified
+        :param concurrent_requests: The maximal number of feed URLs to fetch at the same time. Default: 5
+            (it has no effect on a feed with a single URL, so such feeds do not expose it as a parameter).
+        :param skip_unchanged_feeds: if *True* fetch-indicators sends conditional requests and skips the feeds
+        whose content did not change since the last fetch (HTTP 304 or an identical content digest).
+        A feed whose configuration changed since the last fetch is never skipped.
+        Should not be used with a feed expiration policy that expires indicators missing from the last fetch.
+        :param incremental_fetch: if *True* fetch-indicators submits only the indicators that were added or changed
+        since the last fetch, see ``FeedIndicatorsDiff``.
         Hidden parameters:
         :param: cert_file: client certificate
         :param: key_file: private key of the client certificate
@@ -117,48 +135,186 @@ class Client:
 
         self.cert = (cert_file, key_file) if cert_file and key_file else None
 
-    def build_iterator(self, **kwargs) -> List:
+        try:
+            self.concurrent_requests = max(int(concurrent_requests), 1)
+        except (ValueError, TypeError):
+            raise ValueError('Please provide an integer value for "Concurrent Requests"')
+        self._host_to_session: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+        self.skip_unchanged_feeds = argToBoolean(skip_unchanged_feeds)
+        self.feed_name_to_cache_info: Dict[str, dict] = {}
+        self.feed_name_to_new_cache_info: Dict[str, dict] = {}
+        self.unchanged_feed_names: List[str] = []
+        self.incremental_fetch = argToBoolean(incremental_fetch)
+
+    def get_session(self, url: str) -> requests.Session:
+        """Gets the session of the URL host, so requests to the same host reuse a single connection pool.
+        Args:
+            url(str): The URL to request.
+        Returns:
+            requests.Session. The session of the host.
+        """
+        host = urlparse(url).netloc
+        with self._sessions_lock:
+            session = self._host_to_session.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrent_requests)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._host_to_session[host] = session
+        return session
+
+    @staticmethod
+    def get_feed_config_hash(feed: dict, fetch_config: Optional[dict] = None) -> str:
+        """Gets a hash of the configuration that determines the indicators of a feed,
+        so a feed whose configuration changed is not skipped as unchanged.
+        Args:
+            feed(dict): The feed configuration.
+            fetch_config(dict): The configuration applied by the fetch, e.g. the default indicator type and tags.
+        Returns:
+            str. The hash of the configuration.
+        """
+        config = {'feed_config': feed, 'fetch_config': fetch_config}
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def fetch_feed(self, feed_name: str, feed: dict, use_cache: bool = False, config_hash: Optional[str] = None,
+                   **kwargs):
+        """Fetches a single feed and extracts its items.
+        Args:
+            feed_name(str): The name of the feed.
+            feed(dict): The feed configuration.
+            use_cache(bool): Whether to skip the feed if its content and configuration did not change since the last
+            fetch.
+            config_hash(str): The hash of the feed configuration, see ``get_feed_config_hash``.
+        Returns:
+            The items extracted from the feed by its extractor, or None if the content did not change.
+        """
+        url = feed.get('url', self.url)
+        headers = self.headers
+        cache_info = self.feed_name_to_cache_info.get(feed_name, {})
+        # a feed whose configuration changed is parsed again, even if its content did not change
+        if cache_info.get('config') != config_hash:
+            cache_info = {}
+        if use_cache:
+            headers = dict(self.headers or {})
+            if cache_info.get('etag'):
+                headers['If-None-Match'] = cache_info['etag']
+            if cache_info.get('last_modified'):
+                headers['If-Modified-Since'] = cache_info['last_modified']
+        r = self.get_session(url).get(
+            url=url,
+            verify=self.verify,
+            auth=self.auth,
+            cert=self.cert,
+            headers=headers,
+            **kwargs
+        )
+        if use_cache and r.status_code == 304:
+            return None
+
+        try:
+            r.raise_for_status()
+            if use_cache:
+                new_cache_info = {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'digest': hashlib.sha256(r.content).hexdigest(),
+                    'size': len(r.content),
+                    'config': config_hash
+                }
+                if new_cache_info['digest'] == cache_info.get('digest'):
+                    self.feed_name_to_new_cache_info[feed_name] = dict(cache_info, etag=new_cache_info['etag'],
+                                                                       last_modified=new_cache_info['last_modified'])
+                    return None
+                self.feed_name_to_new_cache_info[feed_name] = new_cache_info
+            data = r.json()
+            return jmespath.search(expression=feed.get('extractor'), data=data)
+
+        except ValueError as VE:
+            raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
+
+    def build_iterator(self, use_cache: bool = False, fetch_config: Optional[dict] = None, **kwargs) -> List:
+        """Fetches the feeds, up to ``concurrent_requests`` of them at the same time.
+        A feed that fails is skipped as long as at least one of the feeds succeeds.
+        Args:
+            use_cache(bool): Whether to skip the feeds whose content and configuration did not change since the last
+            fetch. The new state of the feeds is kept until ``save_feeds_cache`` is called.
+            fetch_config(dict): The configuration applied by the fetch, e.g. the default indicator type and tags.
+        """
         results = []
-        for feed_name, feed in self.feed_name_to_config.items():
-            r = requests.get(
-                url=feed.get('url', self.url),
-                verify=self.verify,
-                auth=self.auth,
-                cert=self.cert,
-                headers=self.headers,
-                **kwargs
-            )
-
-            try:
-                r.raise_for_status()
-                data = r.json()
-                result = jmespath.search(expression=feed.get('extractor'), data=data)
-                results.append({feed_name: result})
-
-            except ValueError as VE:
-                raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
-
+        errors = []
+        if use_cache:
+            self.feed_name_to_cache_info = demisto.getIntegrationContext().get(FEEDS_CACHE_KEY, {})
+            self.unchanged_feed_names = []
+        with ThreadPoolExecutor(max_workers=max(min(self.concurrent_requests, len(self.feed_name_to_config)), 1)) \
+                as executor:
+            future_to_feed_name = {executor.submit(self.fetch_feed, feed_name, feed, use_cache,
+                                                   self.get_feed_config_hash(feed, fetch_config), **kwargs): feed_name
+                                   for feed_name, feed in self.feed_name_to_config.items()}
+            # the feeds are handed to the parser in the order they arrive
+            for future in as_completed(future_to_feed_name):
+                feed_name = future_to_feed_name[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    demisto.error(f'Failed to fetch the {feed_name} feed: {e}')
+                    errors.append(e)
+                    continue
+                if use_cache and result is None:
+                    self.unchanged_feed_names.append(feed_name)
+                else:
+                    results.append({feed_name: result})
+
+        # a single unavailable feed should not fail the indicators of the other feeds
+        if errors and len(errors) == len(self.feed_name_to_config):
+            raise errors[0]
         return results
 
+    def save_feeds_cache(self):
+        """Stores the state of the feeds fetched with ``use_cache`` in the integration context,
+        and reports what was skipped.
+        Should be called only after the indicators were submitted, so a failed run is not skipped next time.
+        """
+        skipped_bytes = sum(self.feed_name_to_cache_info.get(feed_name, {}).get('size', 0)
+                            for feed_name in self.unchanged_feed_names)
+        skipped_indicators = sum(self.feed_name_to_cache_info.get(feed_name, {}).get('indicators', 0)
+                                 for feed_name in self.unchanged_feed_names)
+        demisto.info(f'{len(self.unchanged_feed_names)} unchanged feeds were skipped, '
+                     f'{skipped_bytes} bytes and {skipped_indicators} indicators were not processed again.')
+
+        self.feed_name_to_cache_info.update(self.feed_name_to_new_cache_info)
+        integration_context = demisto.getIntegrationContext()
+        integration_context[FEEDS_CACHE_KEY] = self.feed_name_to_cache_info
+        demisto.setIntegrationContext(integration_context)
+        self.feed_name_to_new_cache_info = {}
+
 
 def test_module(client, params) -> str:
     client.build_iterator()
     return 'ok'
 
 
-def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list, **kwargs) -> Union[Dict, List[Dict]]:
+def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list,
+                             indicators_diff: FeedIndicatorsDiff = None, **kwargs) -> Union[Dict, List[Dict]]:
     """
     Fetches the indicators from client.
     :param client: Client of a JSON Feed
     :param indicator_type: the default indicator type
     :param feedTags: the indicator tags
+    :param indicators_diff: if given, only the indicators that were added or changed since the last fetch are returned
     """
     indicators = []
-    for result in client.build_iterator(**kwargs):
+    for result in client.build_iterator(fetch_config={'indicator_type': indicator_type, 'tags': feedTags}, **kwargs):
         for service_name, items in result.items():
+            if indicators_diff is not None:
+                # a feed with no indicators is added as well, so its removed indicators are found
+                indicators_diff.add_source(service_name)
             feed_config = client.feed_name_to_config.get(service_name, {})
             indicator_field = feed_config.get('indicator') if feed_config.get('indicator') else 'indicator'
             indicator_type = feed_config.get('indicator_type', indicator_type)
+            indicators_count = 0
             for item in items:
                 mapping = feed_config.get('mapping')
 
@@ -184,11 +340,31 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
 
                 indicator['rawJSON'] = item
 
-                indicators.append(indicator)
+                indicators_count += 1
+                if indicators_diff is None or indicators_diff.is_new_or_changed(service_name, indicator):
+                    indicators.append(indicator)
+            if service_name in client.feed_name_to_new_cache_info:
+                client.feed_name_to_new_cache_info[service_name]['indicators'] = indicators_count
 
     return indicators
 
 
+def get_removed_indicators_command(client: Client, args) -> Tuple[str, dict, list]:
+    """
+    Gets the indicators that were removed from the feeds in their last fetch, see ``FeedIndicatorsDiff``.
+    :param client: Client of a JSON Feed
+    :param args: the command arguments
+    """
+    if not client.incremental_fetch:
+        return 'The removed indicators are tracked only when incremental fetch is enabled.', {}, []
+    limit = int(args.get('limit', 50))
+    removed = [{'Value': indicator['value'], 'Type': indicator['type'], 'Source': indicator['source']}
+               for indicator in FeedIndicatorsDiff().get_removed_indicators()[:limit]]
+    hr = tableToMarkdown('Indicators removed from the feed in the last fetch', removed,
+                         headers=['Value', 'Type', 'Source'])
+    return hr, {'FeedRemovedIndicator(val.Value == obj.Value && val.Source == obj.Source)': removed}, removed
+
+
 def extract_all_fields_from_indicator(indicator, indicator_key):
     """Flattens the JSON object to create one dictionary of values
 
@@ -241,9 +417,17 @@ def feed_main(params, feed_name, prefix):
             return_outputs(test_module(client, params))
 
         elif command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, indicator_type, feedTags)
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            indicators_diff = FeedIndicatorsDiff() if client.incremental_fetch else None
+            indicators = fetch_indicators_command(client, indicator_type, feedTags, indicators_diff=indicators_diff,
+                                                  use_cache=client.skip_unchanged_feeds)
+            create_indicators_in_batches(indicators)
+            if client.skip_unchanged_feeds:
+                client.save_feeds_cache()
+            if indicators_diff is not None:
+                for source, counts in indicators_diff.save().items():
+                    demisto.info(f'{source} - {counts["new_or_changed"]} new or changed indicators were submitted, '
+                                 f'{counts["unchanged"]} unchanged indicators were skipped '
+                                 f'and {counts["removed"]} indicators were removed since the last fetch.')
 
         elif command == f'{prefix}get-indicators':
             # dummy command for testing
@@ -252,6 +436,9 @@ def feed_main(params, feed_name, prefix):
             hr = tableToMarkdown('Indicators', indicators, headers=['value', 'type', 'rawJSON'])
             return_outputs(hr, {}, indicators)
 
+        elif command == f'{prefix}get-removed-indicators':
+            return_outputs(*get_removed_indicators_command(client, demisto.args()))
+
     except Exception as err:
         err_msg = f'Error in {feed_name} integration [{err}]'
         return_error(err_msg)
@@ -1,4 +1,4 @@
-from JSONFeedApiModule import Client, fetch_indicators_command, jmespath
+from JSONFeedApiModule import Client, fetch_indicators_command, feed_main, jmespath
 from CommonServerPython import *
 import requests_mock
 
@@ -118,3 +118,126 @@ def test_list_of_indicators_with_no_json_object():
         assert indicators[0].get('value') == '1.1.1.1'
         assert indicators[0].get('type') == 'IP'
         assert indicators[1].get('rawJSON') == {'indicator': '2.2.2.2'}
+
+
+def test_build_iterator_isolates_failed_feeds(mocker):
+    """
+    Given
+    - Two feeds on the same host, one of them returns an error.
+
+    When
+    - Building the iterator with concurrent requests.
+
+    Then
+    - Ensure the items of the valid feed are returned, and the failed feed is only logged.
+    - Ensure the feeds of the same host share a single session.
+    """
+    feed_name_to_config = {
+        'AMAZON': {
+            'url': 'https://ip-ranges.amazonaws.com/ip-ranges.json',
+            'extractor': "prefixes[?service=='AMAZON']",
+            'indicator': 'ip_prefix'
+        },
+        'EC2': {
+            'url': 'https://ip-ranges.amazonaws.com/broken.json',
+            'extractor': "prefixes[?service=='EC2']",
+            'indicator': 'ip_prefix'
+        }
+    }
+    mocker.patch.object(demisto, 'error')
+    with requests_mock.Mocker() as m:
+        m.get('https://ip-ranges.amazonaws.com/ip-ranges.json',
+              json={'prefixes': [{'ip_prefix': '1.1.1.0/24', 'service': 'AMAZON'}]})
+        m.get('https://ip-ranges.amazonaws.com/broken.json', status_code=500)
+        client = Client(feed_name_to_config=feed_name_to_config, concurrent_requests=2)
+        results = client.build_iterator()
+
+    assert results == [{'AMAZON': [{'ip_prefix': '1.1.1.0/24', 'service': 'AMAZON'}]}]
+    assert demisto.error.call_count == 1
+    assert len(client._host_to_session) == 1
+
+
+def test_fetch_indicators_skip_unchanged_feeds(mocker):
+    """
+    Given
+    - Three feeds: one with the same content digest and configuration as the last fetch,
+      one with the same content digest but a new configuration, and one with new content.
+
+    When
+    - Fetching indicators with the cache and saving it afterwards.
+
+    Then
+    - Ensure only the indicators of the changed feeds are returned.
+    - Ensure the indicators count and ETag of the changed feed are stored in the integration context.
+    """
+    import hashlib
+    same_content = json.dumps({'prefixes': [{'ip_prefix': '1.1.1.0/24'}]})
+    digest = hashlib.sha256(same_content.encode()).hexdigest()
+    feed_name_to_config = {
+        'SAME': {'url': 'https://feed.com/same.json', 'extractor': 'prefixes', 'indicator': 'ip_prefix'},
+        'NEW_CONFIG': {'url': 'https://feed.com/new_config.json', 'extractor': 'prefixes', 'indicator': 'ip_prefix',
+                       'indicator_type': 'CIDR'},
+        'NEW': {'url': 'https://feed.com/new.json', 'extractor': 'prefixes', 'indicator': 'ip_prefix'}
+    }
+    fetch_config = {'indicator_type': 'CIDR', 'tags': []}
+    old_config = dict(feed_name_to_config['NEW_CONFIG'], indicator_type='IP')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value={'feeds_cache': {
+        'SAME': {'digest': digest, 'size': len(same_content), 'indicators': 1,
+                 'config': Client.get_feed_config_hash(feed_name_to_config['SAME'], fetch_config)},
+        'NEW_CONFIG': {'digest': digest, 'size': len(same_content), 'indicators': 1,
+                       'config': Client.get_feed_config_hash(old_config, fetch_config)}
+    }})
+    mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch.object(demisto, 'info')
+    with requests_mock.Mocker() as m:
+        m.get('https://feed.com/same.json', text=same_content)
+        m.get('https://feed.com/new_config.json', text=same_content)
+        m.get('https://feed.com/new.json', json={'prefixes': [{'ip_prefix': '2.2.2.0/24'}]}, headers={'ETag': '"2"'})
+        client = Client(feed_name_to_config=feed_name_to_config, skip_unchanged_feeds=True)
+        indicators = fetch_indicators_command(client, 'CIDR', [], use_cache=True)
+        client.save_feeds_cache()
+
+    assert sorted(indicator['value'] for indicator in indicators) == ['1.1.1.0/24', '2.2.2.0/24']
+    feeds_cache = demisto.setIntegrationContext.call_args[0][0]['feeds_cache']
+    assert feeds_cache['NEW']['etag'] == '"2"'
+    assert feeds_cache['NEW']['indicators'] == 1
+    assert '1 unchanged feeds were skipped' in demisto.info.call_args[0][0]
+
+
+def test_feed_main_skip_unchanged_feeds(mocker):
+    """
+    Given
+    - A feed with skip_unchanged_feeds enabled, and 2 feeds: one answering 304 and one with new content.
+
+    When
+    - Running fetch-indicators through feed_main.
+
+    Then
+    - Ensure a conditional request is sent with the cached ETag.
+    - Ensure only the indicators of the changed feed are submitted, and the cache is saved.
+    """
+    feed_name_to_config = {
+        'NOT_MODIFIED': {'url': 'https://feed.com/not_modified.json', 'extractor': 'prefixes',
+                         'indicator': 'ip_prefix'},
+        'NEW': {'url': 'https://feed.com/new.json', 'extractor': 'prefixes', 'indicator': 'ip_prefix'}
+    }
+    params = {'feed_name_to_config': feed_name_to_config, 'indicator_type': 'CIDR', 'skip_unchanged_feeds': True}
+    fetch_config = {'indicator_type': 'CIDR', 'tags': []}
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value={'feeds_cache': {
+        'NOT_MODIFIED': {'etag': '"v1"', 'digest': 'a', 'size': 10, 'indicators': 3,
+                         'config': Client.get_feed_config_hash(feed_name_to_config['NOT_MODIFIED'], fetch_config)}
+    }})
+    mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'info')
+    with requests_mock.Mocker() as m:
+        not_modified = m.get('https://feed.com/not_modified.json', status_code=304)
+        m.get('https://feed.com/new.json', json={'prefixes': [{'ip_prefix': '2.2.2.0/24'}]}, headers={'ETag': '"2"'})
+        feed_main(params, 'JSON Feed', 'json')
+
+    assert not_modified.last_request.headers['If-None-Match'] == '"v1"'
+    assert [indicator['value'] for indicator in demisto.createIndicators.call_args[0][0]] == ['2.2.2.0/24']
+    feeds_cache = demisto.setIntegrationContext.call_args[0][0]['feeds_cache']
+    assert feeds_cache['NEW']['etag'] == '"2"'
+    assert feeds_cache['NOT_MODIFIED']['indicators'] == 3
@@ -6,28 +6,121 @@ Note that adding code to CommonServerUserPython can override functions in Common
 from __future__ import print_function
 
 import base64
+import binascii
+import bisect
+import hashlib
+import heapq
 import json
 import logging
 import os
 import re
+import shutil
 import socket
 import sys
+import tempfile
+import threading
 import time
 import traceback
-import xml.etree.cElementTree as ET
+from array import array
 from collections import OrderedDict
+from itertools import chain, islice
 from datetime import datetime, timedelta
 from abc import abstractmethod
 
 import demistomock as demisto
 
-# imports something that can be missed from docker image
+
+class _LazyModule(object):
+    """
+    Stands in for a module (or a module attribute) that is imported on first use.
+    Importing ``requests`` takes most of the import time of CommonServerPython, and many scripts never use it.
+
+    :type name: ``str``
+    :param name: The name of the module to import.
+
+    :type attribute: ``str``
+    :param attribute: The name of the module attribute to stand in for, if any.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, name, attribute=None):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_attribute', attribute)
+        object.__setattr__(self, '_target', None)
+
+    def _load(self):
+        target = object.__getattribute__(self, '_target')
+        if target is None:
+            import importlib
+            target = importlib.import_module(object.__getattribute__(self, '_name'))
+            attribute = object.__getattribute__(self, '_attribute')
+            if attribute:
+                target = getattr(target, attribute)
+            object.__setattr__(self, '_target', target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        return repr(self._load())
+
+
+def _is_module_available(name):
+    """
+    Checks whether a module can be imported, without importing it.
+
+    :type name: ``str``
+    :param name: The name of the module.
+
+    :return: True if the module can be imported, False otherwise.
+    :rtype: ``bool``
+    """
+    if name in sys.modules:
+        return True
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        # Python 2
+        import imp
+        try:
+            imp.find_module(name)
+            return True
+        except ImportError:
+            return False
+    return find_spec(name) is not None
+
+
 try:
+    from typing import TYPE_CHECKING
+except ImportError:
+    TYPE_CHECKING = False
+
+if TYPE_CHECKING:
+    # type checkers see the modules that the lazy modules stand in for
+    import xml.etree.cElementTree as ET
     import requests
     from requests.adapters import HTTPAdapter
     from urllib3.util import Retry
-except Exception:
-    pass
+else:
+    ET = _LazyModule('xml.etree.cElementTree')
+
+    # imports something that can be missed from docker image
+    if _is_module_available('requests'):
+        requests = _LazyModule('requests')
+        HTTPAdapter = _LazyModule('requests.adapters', 'HTTPAdapter')
+        Retry = _LazyModule('urllib3.util', 'Retry')
 
 CONTENT_RELEASE_VERSION = '0.0.0'
 CONTENT_BRANCH_NAME = 'master'
@@ -878,8 +971,22 @@ class IntegrationLogger(object):
     def __init__(self):
         self.messages = []  # type: list
         self.write_buf = []  # type: list
-        self.replace_strs = []  # type: list
+        self._replace_strs = []  # type: list
+        # the sensitive params are registered on the first log, so scripts that do not log never walk them
+        self._sensitive_params_registered = False
         self.buffering = True
+
+    @property
+    def replace_strs(self):
+        if not self._sensitive_params_registered:
+            self._sensitive_params_registered = True
+            self.add_sensitive_params()
+        return self._replace_strs
+
+    def add_sensitive_params(self):
+        """
+        Add the values of the sensitive integration params to the replaced strings.
+        """
         # if for some reason you don't want to auto add credentials.password to replace strings
         # set the os env COMMON_SERVER_NO_AUTO_REPLACE_STRS. Either in CommonServerUserPython, or docker env
         if (not os.getenv('COMMON_SERVER_NO_AUTO_REPLACE_STRS') and hasattr(demisto, 'getParam')):
@@ -926,7 +1033,7 @@ class IntegrationLogger(object):
             Meant for avoiding passwords and so forth in the log.
         '''
         to_add = [self.encode(a) for a in args if a]
-        self.replace_strs.extend(to_add)
+        self._replace_strs.extend(to_add)
 
     def set_buffering(self, state):
         """
@@ -1188,15 +1295,16 @@ def appendContext(key, data, dedup=False):
         demisto.setContext(key, data)
 
 
-def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=False, metadata=None):
+def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=False, metadata=None, max_rows=None):
     """
        Converts a demisto table in JSON form to a Markdown table
 
        :type name: ``str``
        :param name: The name of the table (required)
 
-       :type t: ``dict`` or ``list``
-       :param t: The JSON table - List of dictionaries with the same keys or a single dictionary (required)
+       :type t: ``dict`` or ``list`` or ``iterator``
+       :param t: The JSON table - List of dictionaries with the same keys or a single dictionary (required).
+            A generator of dictionaries is rendered row by row, without building the list of rows.
 
        :type headers: ``list`` or ``string``
        :keyword headers: A list of headers to be presented in the output table (by order). If string will be passed
@@ -1211,77 +1319,105 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
        :type metadata: ``str``
        :param metadata: Metadata about the table contents
 
+       :type max_rows: ``int``
+       :param max_rows: The maximal number of rows to present. The number of the other rows is noted below the table.
+            Default will present all the rows.
+
        :return: A string representation of the markdown table
        :rtype: ``str``
     """
 
-    mdResult = ''
+    md_parts = []
     if name:
-        mdResult = '### ' + name + '\n'
+        md_parts.append('### ' + name + '\n')
 
     if metadata:
-        mdResult += metadata + '\n'
+        md_parts.append(metadata + '\n')
 
-    if not t or len(t) == 0:
-        mdResult += '**No entries.**\n'
-        return mdResult
+    if hasattr(t, '__next__') or hasattr(t, 'next'):
+        # an iterator is peeked for its first row, and rendered as it is consumed
+        try:
+            first_row = next(t)
+        except StopIteration:
+            md_parts.append('**No entries.**\n')
+            return ''.join(md_parts)
+        rows = chain([first_row], t)
+    else:
+        if not t or len(t) == 0:
+            md_parts.append('**No entries.**\n')
+            return ''.join(md_parts)
 
-    if not isinstance(t, list):
-        t = [t]
+        if not isinstance(t, list):
+            t = [t]
+        first_row = t[0]
+        rows = t
 
     if headers and isinstance(headers, STRING_TYPES):
         headers = [headers]
 
-    if not isinstance(t[0], dict):
+    if not isinstance(first_row, dict):
         # the table cotains only simple objects (strings, numbers)
         # should be only one header
         if headers and len(headers) > 0:
-            header = headers[0]
-            t = map(lambda item: dict((h, item) for h in [header]), t)
+            simple_header = headers[0]
+            rows = ({simple_header: item} for item in rows)
         else:
             raise Exception("Missing headers param for tableToMarkdown. Example: headers=['Some Header']")
 
     # in case of headers was not provided (backward compatibility)
     if not headers:
-        headers = list(t[0].keys())
-        headers.sort()
+        headers = sorted(first_row.keys())
+
+    hidden_rows_count = 0
+    all_rows = None
+    if max_rows is not None:
+        if isinstance(rows, list):
+            hidden_rows_count = max(len(rows) - max_rows, 0)
+            rows = rows[:max_rows]
+        else:
+            all_rows = iter(rows)
+            rows = islice(all_rows, max_rows)
 
     if removeNull:
-        headers_aux = headers[:]
-        for header in headers_aux:
-            if all(obj.get(header) in ('', None, [], {}) for obj in t):
-                headers.remove(header)
+        # a column stops being checked at its first value, so only the empty columns are read to the end
+        rows = list(rows)
+        headers = [header for header in headers
+                   if not all(row.get(header) in ('', None, [], {}) for row in rows)]
 
-    if t and len(headers) > 0:
-        newHeaders = []
+    if len(headers) > 0:
         if headerTransform is None:  # noqa
-            headerTransform = lambda s: s  # noqa
-        for header in headers:
-            newHeaders.append(headerTransform(header))
-        mdResult += '|'
-        if len(newHeaders) == 1:
-            mdResult += newHeaders[0]
+            newHeaders = headers
         else:
-            mdResult += '|'.join(newHeaders)
-        mdResult += '|\n'
-        sep = '---'
-        mdResult += '|' + '|'.join([sep] * len(headers)) + '|\n'
-        for entry in t:
-            vals = [stringEscapeMD((formatCell(entry.get(h, ''), False) if entry.get(h) is not None else ''),
-                                   True, True) for h in headers]
+            newHeaders = [headerTransform(header) for header in headers]
+        md_parts.append('|' + '|'.join(newHeaders) + '|\n')
+        md_parts.append('|' + '|'.join(['---'] * len(headers)) + '|\n')
+        for entry in rows:
+            vals = []
+            for header in headers:
+                value = entry.get(header)
+                if value is None:
+                    vals.append('')
+                    continue
+                if not isinstance(value, STRING_TYPES):
+                    value = str(value) if type(value) is int else formatCell(value, False)
+                # the minimal escaping of stringEscapeMD, with the line endings as line breaks
+                vals.append(value.replace('\r\n', '<br>').replace('\r', '<br>').replace('\n', '<br>').replace('|', '\\|'))
             # this pipe is optional
-            mdResult += '| '
             try:
-                mdResult += ' | '.join(vals)
+                md_parts.append('| ' + ' | '.join(vals) + ' |\n')
             except UnicodeDecodeError:
                 vals = [str(v) for v in vals]
-                mdResult += ' | '.join(vals)
-            mdResult += ' |\n'
+                md_parts.append('| ' + ' | '.join(vals) + ' |\n')
+
+        if all_rows is not None:
+            hidden_rows_count = sum(1 for _ in all_rows)
+        if hidden_rows_count:
+            md_parts.append('\n**{} more rows are not shown.**\n'.format(hidden_rows_count))
 
     else:
-        mdResult += '**No entries.**\n'
+        md_parts.append('**No entries.**\n')
 
-    return mdResult
+    return ''.join(md_parts)
 
 
 tblToMd = tableToMarkdown
@@ -1607,12 +1743,13 @@ def elem_to_internal(elem, strip_ns=1, strip=1):
     return {elem_tag: d}
 
 
-def internal_to_elem(pfsh, factory=ET.Element):
+def internal_to_elem(pfsh, factory=None):
     """Convert an internal dictionary (not JSON!) into an Element.
     Whatever Element implementation we could import will be
     used by default; if you want to use something else, pass the
     Element class as the factory parameter.
     """
+    factory = factory or ET.Element
 
     attribs = OrderedDict()  # type: dict
     text = None
@@ -1658,7 +1795,7 @@ def elem2json(elem, options, strip_ns=1, strip=1):
         return json.dumps(elem_to_internal(elem, strip_ns=strip_ns, strip=strip))
 
 
-def json2elem(json_data, factory=ET.Element):
+def json2elem(json_data, factory=None):
     """Convert a JSON string into an Element.
     Whatever Element implementation we could import will be used by
     default; if you want to use something else, pass the Element class
@@ -1678,11 +1815,232 @@ def xml2json(xmlstring, options={}, strip_ns=1, strip=1):
        :return: The converted JSON
        :rtype: ``dict`` or ``list``
     """
-    elem = ET.fromstring(xmlstring)
-    return elem2json(elem, options, strip_ns=strip_ns, strip=strip)
+    if 'pretty' in options:
+        return json.dumps(xml2dict(xmlstring, strip_ns=strip_ns, strip=strip), indent=4, separators=(',', ': '))
+    return json.dumps(xml2dict(xmlstring, strip_ns=strip_ns, strip=strip))
+
 
+class _XMLDictBuilder(object):
+    """
+    An ``XMLParser`` target that builds the dicts of ``elem_to_internal`` straight from the parser events,
+    without building an element tree on the way.
+
+    :type strip_ns: ``bool``
+    :param strip_ns: Whether to strip the namespaces from the tags.
+
+    :type strip: ``bool``
+    :param strip: Whether to strip the whitespace around the texts.
+
+    :type stream_tag: ``str``
+    :param stream_tag:
+        The tag of the elements to collect in ``streamed`` instead of in their parents, optionally preceded by
+        the tags of their ancestors, for example 'rules/entry'. Matching elements that are nested in
+        a matching element are kept in it.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    # the dicts keep the order of the elements, as the JSON of xml2json always has
+    DICT_TYPE = dict if sys.version_info >= (3, 7) else OrderedDict
+
+    def __init__(self, strip_ns=1, strip=1, stream_tag=None):
+        self.strip_ns = strip_ns
+        self.strip = strip
+        self.stream_path = tuple(stream_tag.split('/')) if stream_tag else None
+        self.streamed = []  # type: list
+        self._stripped_tags = {}  # type: dict
+        # the open elements, as [tag, dict, text, the last closed child, whether the element is streamed]
+        self._stack = []  # type: list
+        self._data = []  # type: list
+        self._stream_depth = 0
+        self._root = None  # type: ignore
+
+    def start(self, tag, attrib):
+        if self._data:
+            self._flush()
+        try:
+            tag = self._stripped_tags[tag]
+        except KeyError:
+            stripped_tag = strip_tag(tag) if self.strip_ns else tag
+            self._stripped_tags[tag] = stripped_tag
+            tag = stripped_tag
+        d = self.DICT_TYPE()
+        for key, value in attrib.items():
+            d['@' + key] = value
+        is_streamed = self.stream_path is not None and self._is_stream_path(tag)
+        if is_streamed:
+            self._stream_depth += 1
+        self._stack.append([tag, d, None, None, is_streamed])
+
+    def data(self, data):
+        self._data.append(data)
+
+    def end(self, tag):
+        if self._data:
+            self._flush()
+        stack = self._stack
+        tag, d, text, _, is_streamed = stack.pop()
+        if text and self.strip:
+            # ignore leading and trailing whitespace
+            text = text.strip()
+        if d:
+            # use #text element if other attributes exist
+            if text:
+                d['#text'] = text
+            value = d
+        else:
+            # text is the value if no attributes
+            value = text or None
+        if is_streamed:
+            self._stream_depth -= 1
+        if not stack:
+            self._root = (tag, value, is_streamed)
+            return
+        parent = stack[-1]
+        # kept for the tail of the element, which is read after it is closed
+        parent[3] = (tag, d, text, is_streamed)
+        if is_streamed and not self._stream_depth:
+            self.streamed.append(value)
+            return
+        parent_d = parent[1]
+        try:
+            existing_value = parent_d[tag]
+        except KeyError:
+            # add a new non-list entry
+            parent_d[tag] = value
+            return
+        if isinstance(existing_value, list):
+            # add to existing list for this tag
+            existing_value.append(value)
+        else:
+            # turn existing entry into a list
+            parent_d[tag] = [existing_value, value]
+
+    def close(self):
+        if self._root is None:
+            return None
+        tag, value, is_streamed = self._root
+        if is_streamed:
+            self.streamed.append(value)
+            return None
+        return {tag: value}
+
+    def _is_stream_path(self, tag):
+        stream_path = self.stream_path
+        if tag != stream_path[-1] or len(stream_path) > len(self._stack) + 1:
+            return False
+        for i in range(2, len(stream_path) + 1):
+            if self._stack[-i + 1][0] != stream_path[-i]:
+                return False
+        return True
+
+    def _flush(self):
+        """The text read since the last tag is the tail of the last closed child, or else the text of the element"""
+        data = ''.join(self._data)
+        self._data = []
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame[3] is None:
+            frame[2] = data
+            return
+        tail = data.strip() if self.strip else data
+        child_tag, child_d, child_text, is_streamed = frame[3]
+        # tails are rare, so the value of the child is fixed here rather than held until its tail is read
+        if not tail or (is_streamed and not self._stream_depth):
+            return
+        child_d.pop('#text', None)
+        child_d['#tail'] = tail
+        if child_text:
+            child_d['#text'] = child_text
+        existing_value = frame[1][child_tag]
+        if isinstance(existing_value, list):
+            existing_value[-1] = child_d
+        else:
+            frame[1][child_tag] = child_d
+
+
+def xml2dict(xml, strip_ns=1, strip=1):
+    """
+       Convert XML into a dict in one pass, without the element tree and the JSON string of
+       ``json.loads(xml2json(xml))``, which it is equal to.
+
+       :type xml: ``str`` or ``bytes`` or ``file``
+       :param xml: The XML to be converted (required)
+
+       :type strip_ns: ``bool``
+       :param strip_ns: Whether to strip the namespaces from the tags
+
+       :type strip: ``bool``
+       :param strip: Whether to strip the whitespace around the texts
+
+       :return: The converted dict
+       :rtype: ``dict``
+    """
+    builder = _XMLDictBuilder(strip_ns=strip_ns, strip=strip)
+    parser = ET.XMLParser(target=builder)
+    for chunk in _xml_chunks(xml):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def xml2dict_stream(xml, tag, strip_ns=1, strip=1, chunk_size=65536):
+    """
+       Convert the repeated elements of large XML (for example, the <entry> elements of a config export)
+       into dicts, and yield them one at a time as they are parsed.
+       The other elements of the XML are not returned.
+
+       :type xml: ``str`` or ``bytes`` or ``file`` or ``iterable``
+       :param xml: The XML to be converted, or chunks of it, for example ``requests.Response.iter_content()`` (required)
+
+       :type tag: ``str``
+       :param tag:
+           The tag of the elements to yield (required).
+           Elements with this tag that are nested in such an element are kept in it.
+
+       :type strip_ns: ``bool``
+       :param strip_ns: Whether to strip the namespaces from the tags
+
+       :type strip: ``bool``
+       :param strip: Whether to strip the whitespace around the texts
+
+       :type chunk_size: ``int``
+       :param chunk_size: The number of characters to parse at a time
+
+       :return: The dicts of the elements, which are the values of their tag in ``xml2dict``
+       :rtype: ``iterator``
+    """
+    builder = _XMLDictBuilder(strip_ns=strip_ns, strip=strip, stream_tag=tag)
+    parser = ET.XMLParser(target=builder)
+    for chunk in _xml_chunks(xml, chunk_size):
+        parser.feed(chunk)
+        if builder.streamed:
+            streamed, builder.streamed = builder.streamed, []
+            for value in streamed:
+                yield value
+    parser.close()
+    for value in builder.streamed:
+        yield value
+
+
+def _xml_chunks(xml, chunk_size=None):
+    """Splits XML into chunks to feed a parser. A string is a single chunk, unless a chunk size is given."""
+    if hasattr(xml, 'read'):
+        read_size = chunk_size or 65536
+        for chunk in iter(lambda: xml.read(read_size), xml.read(0)):
+            yield chunk
+    elif isinstance(xml, (bytes, bytearray) + STRING_TYPES):
+        if not chunk_size:
+            yield xml
+            return
+        for i in range(0, len(xml), chunk_size):
+            yield xml[i:i + chunk_size]
+    else:
+        for chunk in xml:
+            yield chunk
 
-def json2xml(json_data, factory=ET.Element):
+
+def json2xml(json_data, factory=None):
     """Convert a JSON string into an XML string.
     Whatever Element implementation we could import will be used by
     default; if you want to use something else, pass the Element class
@@ -1780,6 +2138,98 @@ def is_ip_valid(s, accept_v6_ips=False):
         return True
 
 
+class CidrIndex(object):
+    """
+    An index of IPv4 and IPv6 CIDR ranges, which tells whether IP addresses are in any of the ranges.
+    The ranges are converted to integer intervals, which are sorted and merged once,
+    so each lookup is a binary search (O(log n) in the number of ranges) instead of a test against every range.
+    A range without a prefix length is a single address, and host bits are ignored (10.1.2.3/8 is 10.0.0.0/8).
+
+    :type cidrs: ``list``
+    :param cidrs: The CIDR ranges, e.g. ['10.0.0.0/8', '2001:db8::/32'].
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    FAMILY_TO_BITS = {socket.AF_INET: 32, socket.AF_INET6: 128}
+
+    def __init__(self, cidrs=()):
+        family_to_intervals = {family: [] for family in self.FAMILY_TO_BITS}  # type: dict
+        for cidr in cidrs:
+            family, first, last = self._parse_cidr(cidr)
+            family_to_intervals[family].append((first, last))
+
+        # per family, the sorted first addresses of the merged ranges and the last address of each range
+        self._starts = {}  # type: dict
+        self._ends = {}  # type: dict
+        for family, intervals in family_to_intervals.items():
+            intervals.sort()
+            starts = []  # type: list
+            ends = []  # type: list
+            for first, last in intervals:
+                if ends and first <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], last)
+                else:
+                    starts.append(first)
+                    ends.append(last)
+            self._starts[family] = starts
+            self._ends[family] = ends
+
+    @staticmethod
+    def _parse_ip(ip):
+        ip = ip.strip()
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        try:
+            packed = socket.inet_pton(family, ip)
+        except (socket.error, ValueError):
+            raise ValueError('"{}" is not a valid IP address'.format(ip))
+        return family, int(binascii.hexlify(packed), 16)
+
+    @classmethod
+    def _parse_cidr(cls, cidr):
+        address, _, prefix = cidr.strip().partition('/')
+        family, ip = cls._parse_ip(address)
+        bits = cls.FAMILY_TO_BITS[family]
+        if not prefix:
+            prefix = str(bits)
+        if not prefix.isdigit() or int(prefix) > bits:
+            raise ValueError('"{}" is not a valid CIDR range'.format(cidr))
+        host_mask = (1 << (bits - int(prefix))) - 1
+        first = ip & ~host_mask
+        return family, first, first | host_mask
+
+    def contains(self, ip):
+        """
+        Checks whether an IP address is in any of the ranges of the index.
+
+        :type ip: ``str``
+        :param ip: The IPv4 or IPv6 address to check.
+
+        :return: True if the address is in one of the ranges, False otherwise.
+            Raises a ValueError if the address is not valid.
+        :rtype: ``bool``
+        """
+        family, value = self._parse_ip(ip)
+        starts = self._starts[family]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[family][i]
+
+    def contains_many(self, ips):
+        """
+        Checks for each of the given IP addresses whether it is in any of the ranges of the index.
+
+        :type ips: ``list``
+        :param ips: The IPv4 or IPv6 addresses to check.
+
+        :return: A list of the result of ``contains`` for each address, in the order of the addresses.
+        :rtype: ``list``
+        """
+        return [self.contains(ip) for ip in ips]
+
+    def __contains__(self, ip):
+        return self.contains(ip)
+
+
 class Common(object):
     class Indicator(object):
         """
@@ -3278,8 +3728,184 @@ H || val.SSDeep && val.SSDeep == obj.SSDeep)': {'Malicious': {'Vendor': 'Vendor'
                                .format(indicator_type, INDICATOR_TYPE_TO_CONTEXT_KEY.keys()))
 
 
-# Will add only if 'requests' module imported
-if 'requests' in sys.modules:
+def iter_json_items(chunks, chunk_decoder=None):
+    """
+    Parses a JSON array, or a stream of JSON values (for example NDJSON), incrementally from chunks of text,
+    and yields the items one by one, so that a large response is never held in memory as a whole.
+
+    :type chunks: ``iterable``
+    :param chunks: The chunks of text (``str`` or ``bytes``), for example ``requests.Response.iter_content()``.
+
+    :type chunk_decoder: ``codecs.IncrementalDecoder``
+    :param chunk_decoder: The decoder of ``bytes`` chunks. Default is UTF-8.
+
+    :return: The items of the array, or the values of the stream.
+    :rtype: ``iterator``
+    """
+    import codecs
+    decoder = json.JSONDecoder()
+    chunk_decoder = chunk_decoder or codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = u''
+    position = 0
+    is_array = None
+    exhausted = False
+
+    while True:
+        # skips the whitespace and separators between the items
+        while position < len(buffer) and (buffer[position].isspace() or (is_array and buffer[position] == ',')):
+            position += 1
+        if position < len(buffer):
+            if is_array is None:
+                is_array = buffer[position] == '['
+                if is_array:
+                    position += 1
+                continue
+            if is_array and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or exhausted:
+                    yield item
+                    position = end
+                    continue
+            except ValueError:
+                if exhausted:
+                    raise
+        elif exhausted:
+            if is_array:
+                raise ValueError('The JSON array is not closed')
+            return
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            chunk = chunk_decoder.decode(b'', final=True)
+        elif isinstance(chunk, bytes):
+            chunk = chunk_decoder.decode(chunk)
+        # drops the parsed items from the buffer
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+class RateLimiter(object):
+    """
+    A thread safe token bucket that limits the rate of requests per host.
+    Hosts that answer with ``Retry-After`` or with an exhausted ``X-RateLimit-Remaining`` are blocked
+    until the time they asked for, instead of being sent requests that are bound to fail.
+
+    :type rate: ``float``
+    :param rate: The number of requests per second to allow per host.
+
+    :type burst: ``int``
+    :param burst: The number of requests that can be sent at once before the rate applies. Default is 1.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('The rate limit must be positive, got {}'.format(rate))
+        self.interval = 1.0 / rate
+        self.burst_tolerance = (max(int(burst or 1), 1) - 1) * self.interval
+        self._lock = threading.Lock()
+        self._theoretical_arrival_times = {}  # type: ignore
+        self._blocked_until = {}  # type: ignore
+
+    def acquire(self, host):
+        """
+        Waits until a request can be sent to the host, and takes its token.
+
+        :type host: ``str``
+        :param host: The host the request is sent to.
+
+        :return: The number of seconds waited.
+        :rtype: ``float``
+        """
+        with self._lock:
+            now = time.time()
+            not_before = max(now, self._blocked_until.get(host, 0))
+            theoretical_arrival_time = max(self._theoretical_arrival_times.get(host, 0), not_before)
+            wait = max(not_before, theoretical_arrival_time - self.burst_tolerance) - now
+            self._theoretical_arrival_times[host] = theoretical_arrival_time + self.interval
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0
+
+    def block(self, host, seconds):
+        """
+        Stops sending requests to the host for the given number of seconds.
+
+        :type host: ``str``
+        :param host: The host to block.
+
+        :type seconds: ``float``
+        :param seconds: The number of seconds to block the host for.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._blocked_until[host] = max(self._blocked_until.get(host, 0), time.time() + seconds)
+
+    def update(self, host, response):
+        """
+        Blocks the host by the ``Retry-After`` and ``X-RateLimit-*`` headers of its response, if any.
+
+        :type host: ``str``
+        :param host: The host the response came from.
+
+        :type response: ``requests.Response``
+        :param response: The response of the host.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        headers = response.headers
+        if response.status_code in self.THROTTLE_STATUS_CODES and headers.get('Retry-After'):
+            self.block(host, self.parse_retry_after(headers['Retry-After']))
+            return
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None:
+            try:
+                remaining, reset = float(remaining), float(reset)
+            except ValueError:
+                return
+            if remaining <= 0:
+                # some APIs send the reset as an epoch time, and others as the number of seconds until the reset
+                self.block(host, reset - time.time() if reset > 1e9 else reset)
+
+    @staticmethod
+    def parse_retry_after(retry_after):
+        """
+        Parses a ``Retry-After`` header, which is either a number of seconds or an HTTP date.
+
+        :type retry_after: ``str``
+        :param retry_after: The value of the header.
+
+        :return: The number of seconds to wait, 0 if the header cannot be parsed.
+        :rtype: ``float``
+        """
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        from email.utils import parsedate_tz, mktime_tz
+        parsed_date = parsedate_tz(retry_after)
+        if not parsed_date:
+            return 0
+        return max(mktime_tz(parsed_date) - time.time(), 0)
+
+
+# Will add only if 'requests' module is available
+if _is_module_available('requests'):
     class BaseClient(object):
         """Client to use in integrations with powerful _http_request
         :type base_url: ``str``
@@ -3306,11 +3932,28 @@ if 'requests' in sys.modules:
             The request authorization, for example: (username, password).
             Can be None.
 
+        :type pool_connections: ``int``
+        :param pool_connections: The number of hosts to keep connection pools for.
+
+        :type pool_maxsize: ``int``
+        :param pool_maxsize:
+            The number of connections to keep open per host.
+            Raise it when sending requests to the same host from several threads.
+
+        :type rate_limit: ``float``
+        :param rate_limit:
+            The number of requests per second to send per host. Hosts that ask to wait with a ``Retry-After``
+            or an ``X-RateLimit-*`` header are also waited for. If None, requests are not throttled.
+
+        :type rate_limit_burst: ``int``
+        :param rate_limit_burst: The number of requests that can be sent at once before the rate limit applies.
+
         :return: No data returned
         :rtype: ``None``
         """
 
-        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None):
+        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None,
+                     pool_connections=10, pool_maxsize=10, rate_limit=None, rate_limit_burst=None):
             self._base_url = base_url
             self._verify = verify
             self._ok_codes = ok_codes
@@ -3319,6 +3962,20 @@ if 'requests' in sys.modules:
             self._session = requests.Session()
             if not proxy:
                 self._session.trust_env = False
+            self._pool_connections = pool_connections
+            self._pool_maxsize = pool_maxsize
+            self._adapters = {}  # type: ignore
+            self._mounted_adapter_key = None
+            self._rate_limiter = RateLimiter(rate_limit, rate_limit_burst) if rate_limit else None
+            self._counters_lock = threading.Lock()
+            self.counters = {
+                'requests': 0,
+                'retries': 0,
+                'throttled_waits': 0,
+                'throttled_seconds': 0.0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+            }
 
         def _implement_retry(self, retries=0,
                              status_list_to_retry=None,
@@ -3362,24 +4019,88 @@ if 'requests' in sys.modules:
                 if status falls in ``status_forcelist`` range and retries have
                 been exhausted.
             """
+            # an adapter holds the connection pools, so one is kept per retry config instead of one per request
+            adapter_key = (retries, tuple(status_list_to_retry or ()), backoff_factor, raise_on_redirect, raise_on_status)
+            if adapter_key == self._mounted_adapter_key:
+                return
             try:
-                retry = Retry(
-                    total=retries,
-                    read=retries,
-                    connect=retries,
-                    backoff_factor=backoff_factor,
-                    status=retries,
-                    status_forcelist=status_list_to_retry,
-                    method_whitelist=frozenset(['GET', 'POST', 'PUT']),
-                    raise_on_status=raise_on_status,
-                    raise_on_redirect=raise_on_redirect
-                )
-                adapter = HTTPAdapter(max_retries=retry)
+                adapter = self._adapters.get(adapter_key)
+                if adapter is None:
+                    retry = Retry(
+                        total=retries,
+                        read=retries,
+                        connect=retries,
+                        backoff_factor=backoff_factor,
+                        status=retries,
+                        status_forcelist=status_list_to_retry,
+                        method_whitelist=frozenset(['GET', 'POST', 'PUT']),
+                        raise_on_status=raise_on_status,
+                        raise_on_redirect=raise_on_redirect
+                    )
+                    adapter = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize,
+                                          max_retries=retry)
+                    self._adapters[adapter_key] = adapter
                 self._session.mount('http://', adapter)
                 self._session.mount('https://', adapter)
+                self._mounted_adapter_key = adapter_key
             except NameError:
                 pass
 
+        def _throttle(self, address):
+            """
+            Waits until a request can be sent to the host of the address, by the rate limit and by what
+            the host asked for in former responses.
+
+            :type address: ``str``
+            :param address: The address the request is sent to.
+
+            :return: The host of the address, or an empty string if requests are not throttled.
+            :rtype: ``str``
+            """
+            if not self._rate_limiter:
+                return ''
+            try:
+                from urllib.parse import urlparse
+            except ImportError:
+                # Python 2
+                from urlparse import urlparse  # type: ignore
+            host = urlparse(address).netloc
+            waited = self._rate_limiter.acquire(host)
+            if waited:
+                with self._counters_lock:
+                    self.counters['throttled_waits'] += 1
+                    self.counters['throttled_seconds'] += waited
+            return host
+
+        def _count_response(self, host, res, stream=False):
+            """
+            Updates the counters and the rate limiter by a response.
+
+            :type host: ``str``
+            :param host: The host the response came from.
+
+            :type res: ``requests.Response``
+            :param res: The response.
+
+            :type stream: ``bool``
+            :param stream: Whether the response body is streamed, in which case its size is not counted.
+
+            :return: No data returned
+            :rtype: ``None``
+            """
+            retries = getattr(getattr(res, 'raw', None), 'retries', None)
+            body = getattr(res.request, 'body', None)
+            with self._counters_lock:
+                self.counters['requests'] += 1
+                if retries is not None and getattr(retries, 'history', None):
+                    self.counters['retries'] += len(retries.history)
+                if body and hasattr(body, '__len__'):
+                    self.counters['bytes_sent'] += len(body)
+                if not stream:
+                    self.counters['bytes_received'] += len(res.content or b'')
+            if self._rate_limiter:
+                self._rate_limiter.update(host, res)
+
         def _http_request(self, method, url_suffix, full_url=None, headers=None, auth=None, json_data=None,
                           params=None, data=None, files=None, timeout=10, resp_type='json', ok_codes=None,
                           return_empty_response = False, retries=0, status_list_to_retry=None,
@@ -3427,8 +4148,10 @@ if 'requests' in sys.modules:
             :type resp_type: ``str``
             :param resp_type:
                 Determines which data format to return from the HTTP request. The default
-                is 'json'. Other options are 'text', 'content', 'xml' or 'response'. Use 'response'
-                 to return the full response object.
+                is 'json'. Other options are 'text', 'content', 'xml' or 'response'. Use 'xml'
+                to return the parsed ``ElementTree.Element`` and 'response' to return the full response object.
+                To stream a large response, use 'response' with ``stream=True``, or see ``_stream_json_items``,
+                ``_download_file`` and ``_paginate``.
 
             :type ok_codes: ``tuple``
             :param ok_codes:
@@ -3477,6 +4200,7 @@ if 'requests' in sys.modules:
                 headers = headers if headers else self._headers
                 auth = auth if auth else self._auth
                 self._implement_retry(retries, status_list_to_retry, backoff_factor, raise_on_redirect, raise_on_status)
+                host = self._throttle(address)
                 # Execute
                 res = self._session.request(
                     method,
@@ -3491,6 +4215,7 @@ if 'requests' in sys.modules:
                     timeout=timeout,
                     **kwargs
                 )
+                self._count_response(host, res, kwargs.get('stream', False))
                 # Handle error responses gracefully
                 if not self._is_status_code_valid(res, ok_codes):
                     err_msg = 'Error in API call [{}] - {}' \
@@ -3517,11 +4242,15 @@ if 'requests' in sys.modules:
                     if resp_type == 'content':
                         return res.content
                     if resp_type == 'xml':
-                        ET.parse(res.text)
+                        return ET.fromstring(res.content)
                     return res
                 except ValueError as exception:
                     raise DemistoException('Failed to parse json object from response: {}'
                                            .format(res.content), exception)
+                except SyntaxError as exception:
+                    # ElementTree.ParseError
+                    raise DemistoException('Failed to parse xml object from response: {}'
+                                           .format(res.content), exception)
             except requests.exceptions.ConnectTimeout as exception:
                 err_msg = 'Connection Timeout Error - potential reasons might be that the Server URL parameter' \
                           ' is incorrect or that the Server is not accessible from your host.'
@@ -3551,6 +4280,251 @@ if 'requests' in sys.modules:
                 err_msg = 'Max Retries Error- Request attempts with {} retries failed. \n{}'.format(retries, reason)
                 raise DemistoException(err_msg, exception)
 
+        def _bulk_http_request(self, request_specs, max_workers=10, **kwargs):
+            """
+            Sends several requests concurrently, with the retries, error handling and rate limit of ``_http_request``.
+
+            :type request_specs: ``list``
+            :param request_specs:
+                The ``_http_request`` arguments of each request, for example:
+                [{'method': 'GET', 'url_suffix': 'ip/1.1.1.1'}, {'method': 'GET', 'url_suffix': 'ip/8.8.8.8'}]
+
+            :type max_workers: ``int``
+            :param max_workers:
+                The number of requests to send at once. Connections above the ``pool_maxsize`` of the client
+                are not kept open, so it should not be higher than it.
+
+            :type kwargs: ``dict``
+            :param kwargs:
+                The ``_http_request`` arguments that are common to all of the requests, for example resp_type.
+                The retry arguments must be passed here rather than per request, as all the requests share one adapter.
+
+            :return:
+                The results of the requests, in the order of ``request_specs``.
+                A request that failed has the exception it raised as its result.
+            :rtype: ``list``
+            """
+            def send_request(request_spec):
+                request_kwargs = dict(kwargs)
+                request_kwargs.update(request_spec)
+                try:
+                    return self._http_request(**request_kwargs)
+                except Exception as exception:
+                    return exception
+
+            request_specs = list(request_specs)
+            if max_workers <= 1 or len(request_specs) <= 1:
+                return [send_request(request_spec) for request_spec in request_specs]
+
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(max_workers, len(request_specs)))
+            try:
+                return pool.map(send_request, request_specs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        def _stream_json_items(self, method, url_suffix, chunk_size=65536, **kwargs):
+            """
+            Sends a request and yields the items of its JSON array or NDJSON response as they arrive,
+            without loading the whole response into memory.
+
+            :type method: ``str``
+            :param method: The HTTP method, for example: GET, POST, and so on.
+
+            :type url_suffix: ``str``
+            :param url_suffix: The API endpoint.
+
+            :type chunk_size: ``int``
+            :param chunk_size: The number of bytes to read from the response at a time.
+
+            :type kwargs: ``dict``
+            :param kwargs: The other arguments of ``_http_request``, for example params.
+
+            :return: The items of the response.
+            :rtype: ``iterator``
+            """
+            import codecs
+            res = self._http_request(method, url_suffix, resp_type='response', stream=True, **kwargs)
+            try:
+                chunk_decoder = codecs.getincrementaldecoder(res.encoding or 'utf-8')()
+                for item in iter_json_items(self._count_chunks(res.iter_content(chunk_size)), chunk_decoder):
+                    yield item
+            except ValueError as exception:
+                raise DemistoException('Failed to parse json object from response', exception)
+            finally:
+                res.close()
+
+        def _download_file(self, method, url_suffix, path=None, chunk_size=1048576, **kwargs):
+            """
+            Sends a request and writes its response to a file chunk by chunk, for artifacts too large to hold in memory.
+
+            :type method: ``str``
+            :param method: The HTTP method, for example: GET, POST, and so on.
+
+            :type url_suffix: ``str``
+            :param url_suffix: The API endpoint.
+
+            :type path: ``str``
+            :param path: The path of the file to write. If None, a temporary file is created.
+
+            :type chunk_size: ``int``
+            :param chunk_size: The number of bytes to read from the response at a time.
+
+            :type kwargs: ``dict``
+            :param kwargs: The other arguments of ``_http_request``, for example params.
+
+            :return: The path of the file.
+            :rtype: ``str``
+            """
+            res = self._http_request(method, url_suffix, resp_type='response', stream=True, **kwargs)
+            try:
+                if path is None:
+                    import tempfile
+                    file_descriptor, path = tempfile.mkstemp()
+                    output = os.fdopen(file_descriptor, 'wb')
+                else:
+                    output = open(path, 'wb')
+                with output:
+                    for chunk in self._count_chunks(res.iter_content(chunk_size)):
+                        output.write(chunk)
+            finally:
+                res.close()
+            return path
+
+        def _count_chunks(self, chunks):
+            """
+            Counts the bytes of a streamed response, as they are read.
+
+            :type chunks: ``iterable``
+            :param chunks: The chunks of the response.
+
+            :return: The chunks of the response.
+            :rtype: ``iterator``
+            """
+            for chunk in chunks:
+                with self._counters_lock:
+                    self.counters['bytes_received'] += len(chunk)
+                yield chunk
+
+        def _paginate(self, method, url_suffix, pagination, items_path=None, next_cursor_path=None,
+                      cursor_param='cursor', offset_param='offset', page_param='page', page_size_param='limit',
+                      page_size=None, first_page=1, limit=None, params=None, **kwargs):
+            """
+            Yields the items of a paginated API page by page, fetching the next page only when the items
+            of the former page have been consumed.
+
+            :type method: ``str``
+            :param method: The HTTP method, for example: GET, POST, and so on.
+
+            :type url_suffix: ``str``
+            :param url_suffix: The API endpoint of the first page.
+
+            :type pagination: ``str``
+            :param pagination:
+                How the API is paginated:
+                'cursor' - each page holds the cursor of the next page at ``next_cursor_path``, which is sent as the
+                ``cursor_param`` parameter.
+                'link' - each page links to the next page in its ``Link`` header.
+                'offset' - the pages are requested by the ``offset_param`` and ``page_size_param`` parameters.
+                'page' - the pages are requested by the ``page_param`` and ``page_size_param`` parameters.
+
+            :type items_path: ``str``
+            :param items_path:
+                The dot separated path of the items in a page, for example 'data.items'.
+                If None, the page is the list of items.
+
+            :type next_cursor_path: ``str``
+            :param next_cursor_path: The dot separated path of the cursor of the next page. Used by 'cursor'.
+
+            :type cursor_param: ``str``
+            :param cursor_param: The name of the cursor parameter. Used by 'cursor'.
+
+            :type offset_param: ``str``
+            :param offset_param: The name of the offset parameter. Used by 'offset'.
+
+            :type page_param: ``str``
+            :param page_param: The name of the page number parameter. Used by 'page'.
+
+            :type page_size_param: ``str``
+            :param page_size_param: The name of the page size parameter.
+
+            :type page_size: ``int``
+            :param page_size:
+                The number of items per page. A page with less items is the last one.
+                Required by 'offset', optional for the others.
+
+            :type first_page: ``int``
+            :param first_page: The number of the first page. Used by 'page'.
+
+            :type limit: ``int``
+            :param limit: The maximal number of items to yield. If None, all the items are yielded.
+
+            :type params: ``dict``
+            :param params: The URL parameters of the first page, which are kept for the next pages.
+
+            :type kwargs: ``dict``
+            :param kwargs: The other arguments of ``_http_request``, for example headers.
+
+            :return: The items of the pages.
+            :rtype: ``iterator``
+            """
+            if pagination not in ('cursor', 'link', 'offset', 'page'):
+                raise ValueError('Unknown pagination: {}'.format(pagination))
+            if pagination == 'offset' and not page_size:
+                raise ValueError('Offset pagination requires a page size')
+
+            def get_path(obj, path):
+                for key in path.split('.') if path else []:
+                    obj = obj.get(key) if isinstance(obj, dict) else None
+                return obj
+
+            params = dict(params or {})
+            if page_size:
+                params[page_size_param] = page_size
+            if pagination == 'offset':
+                params[offset_param] = params.get(offset_param, 0)
+            elif pagination == 'page':
+                params[page_param] = first_page
+
+            yielded = 0
+            full_url = kwargs.pop('full_url', None)
+            while True:
+                res = self._http_request(method, url_suffix, full_url=full_url, params=params, resp_type='response',
+                                         **kwargs)
+                try:
+                    page = res.json()
+                except ValueError as exception:
+                    raise DemistoException('Failed to parse json object from response: {}'.format(res.content),
+                                           exception)
+                items = get_path(page, items_path) or []
+                for item in items:
+                    if limit is not None and yielded >= limit:
+                        return
+                    yield item
+                    yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+                if pagination == 'cursor':
+                    cursor = get_path(page, next_cursor_path)
+                    if not cursor or not items:
+                        return
+                    params[cursor_param] = cursor
+                elif pagination == 'link':
+                    next_link = res.links.get('next', {}).get('url')
+                    if not next_link:
+                        return
+                    # the link of the next page holds all of its parameters
+                    full_url, params = next_link, None
+                else:
+                    if not items or (page_size and len(items) < page_size):
+                        return
+                    if pagination == 'offset':
+                        params[offset_param] += len(items)
+                    else:
+                        params[page_param] += 1
+
 
         def _is_status_code_valid(self, response, ok_codes=None):
             """If the status code is OK, return 'True'.
@@ -3575,6 +4549,8 @@ if 'requests' in sys.modules:
 
 def batch(iterable, batch_size=1):
     """Gets an iterable and yields slices of it.
+    Lists, tuples and strings are sliced, and any other iterable (e.g. a generator) is consumed lazily,
+    so only the current batch is copied and held in memory.
 
     :type iterable: ``list``
     :param iterable: list or other iterable object.
@@ -3585,12 +4561,488 @@ def batch(iterable, batch_size=1):
     :rtype: ``list``
     :return:: Iterable slices of given
     """
-    current_batch = iterable[:batch_size]
-    not_batched = iterable[batch_size:]
+    if isinstance(iterable, (list, tuple) + STRING_TYPES):
+        for start in range(0, len(iterable), batch_size):
+            yield iterable[start:start + batch_size]
+        return
+
+    iterator = iter(iterable)
+    current_batch = list(islice(iterator, batch_size))
     while current_batch:
         yield current_batch
-        current_batch = not_batched[:batch_size]
-        not_batched = not_batched[batch_size:]
+        current_batch = list(islice(iterator, batch_size))
+
+
+DEFAULT_SUBMIT_BATCH_SIZE = 2000
+DEFAULT_SUBMIT_BATCH_BYTES = 10 * 1024 * 1024
+
+
+def submit_in_batches(items, submit, batch_size=DEFAULT_SUBMIT_BATCH_SIZE, max_batch_bytes=DEFAULT_SUBMIT_BATCH_BYTES,
+                      pipeline=False, sample_every=10):
+    """
+    Submits items (e.g. indicators or incidents) in batches, and reports the throughput in the debug log.
+    A batch is closed when it has batch_size items, or when its serialized size reaches max_batch_bytes,
+    so feeds with large items (e.g. a big rawJSON) send smaller batches.
+    The size is estimated by serializing a sample of the items, so the items are not all serialized twice.
+
+    :type items: ``iterable``
+    :param items: The items to submit. A generator is consumed lazily, one batch at a time.
+
+    :type submit: ``function``
+    :param submit: The function which submits a batch (list) of items, for example ``demisto.createIndicators``.
+
+    :type batch_size: ``int``
+    :param batch_size: The maximal number of items in a batch.
+
+    :type max_batch_bytes: ``int``
+    :param max_batch_bytes: The maximal (estimated) serialized size of a batch, in bytes.
+
+    :type pipeline: ``bool``
+    :param pipeline: Whether to submit each batch on a worker thread while the next batch is being collected.
+        Demisto calls are not thread safe, so the items iterable must not call demisto functions while it is consumed.
+
+    :type sample_every: ``int``
+    :param sample_every: Serialize one of every sample_every items to estimate the size of the batches.
+        Use 1 to serialize all the items.
+
+    :return: The number of items, batches and (estimated) bytes submitted, the elapsed seconds,
+        the seconds spent in submit, and the items per second.
+    :rtype: ``dict``
+    """
+    stats = {'items': 0, 'batches': 0, 'bytes': 0, 'seconds': 0.0, 'submit_seconds': 0.0, 'items_per_second': 0.0}
+    start_time = time.time()
+    pending = {}  # type: dict
+
+    def submit_batch(items_batch):
+        submit_start_time = time.time()
+        try:
+            submit(items_batch)
+        except Exception as e:
+            pending['error'] = e
+        stats['submit_seconds'] += time.time() - submit_start_time
+
+    def wait_for_pending():
+        worker = pending.pop('worker', None)
+        if worker:
+            worker.join()
+        if 'error' in pending:
+            raise pending.pop('error')
+
+    def flush(items_batch, items_batch_bytes):
+        stats['items'] += len(items_batch)
+        stats['batches'] += 1
+        stats['bytes'] += int(items_batch_bytes)
+        if not pipeline:
+            submit_batch(items_batch)
+            wait_for_pending()
+            return
+        # only one batch is submitted at a time, so the batches keep their order
+        wait_for_pending()
+        worker = threading.Thread(target=submit_batch, args=(items_batch,))
+        worker.daemon = True
+        worker.start()
+        pending['worker'] = worker
+
+    sampled_bytes = 0
+    sampled_items = 0
+    items_batch = []  # type: list
+    items_batch_bytes = 0.0
+    try:
+        for index, item in enumerate(items):
+            if index % sample_every == 0:
+                item_bytes = len(json.dumps(item, default=str))
+                sampled_bytes += item_bytes
+                sampled_items += 1
+                items_batch_bytes += item_bytes
+            else:
+                items_batch_bytes += float(sampled_bytes) / sampled_items
+            items_batch.append(item)
+            if len(items_batch) >= batch_size or items_batch_bytes >= max_batch_bytes:
+                flush(items_batch, items_batch_bytes)
+                items_batch = []
+                items_batch_bytes = 0.0
+        if items_batch:
+            flush(items_batch, items_batch_bytes)
+    finally:
+        worker = pending.get('worker')
+        if worker:
+            worker.join()
+    wait_for_pending()
+
+    stats['seconds'] = time.time() - start_time
+    if stats['seconds'] > 0:
+        stats['items_per_second'] = stats['items'] / stats['seconds']
+    demisto.debug('Submitted {} items in {} batches ({} bytes) in {:.2f} seconds ({:.2f} in submit), '
+                  '{:.0f} items per second'.format(stats['items'], stats['batches'], stats['bytes'], stats['seconds'],
+                                                   stats['submit_seconds'], stats['items_per_second']))
+    return stats
+
+
+def create_indicators_in_batches(indicators, batch_size=DEFAULT_SUBMIT_BATCH_SIZE,
+                                 max_batch_bytes=DEFAULT_SUBMIT_BATCH_BYTES, pipeline=False):
+    """
+    Creates indicators with ``demisto.createIndicators``, in batches of limited size.
+    See ``submit_in_batches`` for the arguments.
+
+    :type indicators: ``iterable``
+    :param indicators: The indicators to create. A generator is consumed lazily, one batch at a time.
+
+    :return: The submission statistics, see ``submit_in_batches``.
+    :rtype: ``dict``
+    """
+    return submit_in_batches(indicators, demisto.createIndicators, batch_size=batch_size,
+                             max_batch_bytes=max_batch_bytes, pipeline=pipeline)
+
+
+def create_incidents_in_batches(incidents, batch_size=DEFAULT_SUBMIT_BATCH_SIZE,
+                                max_batch_bytes=DEFAULT_SUBMIT_BATCH_BYTES, pipeline=False, **kwargs):
+    """
+    Creates incidents with ``demisto.createIncidents``, in batches of limited size.
+    See ``submit_in_batches`` for the arguments.
+
+    :type incidents: ``iterable``
+    :param incidents: The incidents to create. A generator is consumed lazily, one batch at a time.
+
+    :type kwargs: ``dict``
+    :param kwargs: Additional arguments to pass to ``demisto.createIncidents`` (e.g. userID).
+
+    :return: The submission statistics, see ``submit_in_batches``.
+    :rtype: ``dict``
+    """
+    return submit_in_batches(incidents, lambda incidents_batch: demisto.createIncidents(incidents_batch, **kwargs),
+                             batch_size=batch_size, max_batch_bytes=max_batch_bytes, pipeline=pipeline)
+
+
+class IndicatorsSearcher(object):
+    """
+    Iterates the indicators of a query, page by page, using ``demisto.searchIndicators``.
+    Only one page is held in memory at a time, so large queries can be streamed instead of buffered.
+    The searcher is a cursor: ``page`` is the next page to fetch, so a search can be resumed from it.
+
+    :type query: ``str``
+    :param query: The indicators query.
+
+    :type page: ``int``
+    :param page: The page to start from.
+
+    :type page_size: ``int``
+    :param page_size: The number of indicators to fetch in each search.
+
+    :type limit: ``int``
+    :param limit: The maximum number of indicators to yield. If not set, all the indicators of the query are yielded.
+
+    :type fields: ``list``
+    :param fields: The indicator fields to keep (e.g. ['value', 'indicator_type']). If not set, all the fields are kept.
+
+    :type prefetch: ``bool``
+    :param prefetch: Whether to fetch the next page on a worker thread while the current page is being processed.
+        Demisto calls are not thread safe, so the caller must not call other demisto functions while iterating.
+
+    :type search_args: ``dict``
+    :param search_args: Additional arguments to pass to ``demisto.searchIndicators`` (e.g. fromdate, todate).
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, query='', page=0, page_size=200, limit=None, fields=None, prefetch=False, **search_args):
+        self.query = query
+        self.page = page
+        self.page_size = page_size
+        self.limit = limit
+        self.fields = fields
+        self.prefetch = prefetch
+        self.search_args = search_args
+        self.total_yielded = 0
+        self._exhausted = False
+
+    def _search_page(self, page):
+        iocs = demisto.searchIndicators(query=self.query, page=page, size=self.page_size,
+                                        **self.search_args).get('iocs') or []
+        if self.fields:
+            iocs = [{field: ioc[field] for field in self.fields if field in ioc} for ioc in iocs]
+        return iocs
+
+    def _start_search(self, page):
+        """
+        Starts fetching a page, on a worker thread if prefetch is set.
+
+        :return: A function which returns the indicators of the page, and raises the error of the search if it failed.
+        :rtype: ``function``
+        """
+        if not self.prefetch:
+            return lambda: self._search_page(page)
+
+        result = {}  # type: dict
+
+        def search():
+            try:
+                result['iocs'] = self._search_page(page)
+            except Exception as e:
+                result['error'] = e
+
+        worker = threading.Thread(target=search)
+        worker.daemon = True
+        worker.start()
+
+        def get_result():
+            worker.join()
+            if 'error' in result:
+                raise result['error']
+            return result['iocs']
+
+        return get_result
+
+    def __iter__(self):
+        if self._exhausted or (self.limit is not None and self.total_yielded >= self.limit):
+            return
+        next_page = self._start_search(self.page)
+        while True:
+            iocs = next_page()
+            self.page += 1
+            # a partial page is the last page of the query
+            self._exhausted = len(iocs) < self.page_size
+            if self.limit is not None:
+                iocs = iocs[:self.limit - self.total_yielded]
+            more = not self._exhausted and (self.limit is None or self.total_yielded + len(iocs) < self.limit)
+            if more:
+                next_page = self._start_search(self.page)
+            for ioc in iocs:
+                self.total_yielded += 1
+                yield ioc
+            if not more:
+                return
+
+    @property
+    def exhausted(self):
+        """
+        Whether all the indicators of the query were fetched.
+
+        :return: True if the last page of the query was fetched.
+        :rtype: ``bool``
+        """
+        return self._exhausted
+
+
+class FeedIndicatorsDiff(object):
+    """
+    Detects which indicators of a feed were added, changed or removed since the last fetch,
+    so a feed can submit only the indicators that are new or changed.
+
+    The state of every source (e.g. feed URL) is kept in files on disk: a sorted array of 64-bit hashes of
+    the submitted indicators (value, type, fields and rawJSON), the types and values of the indicators,
+    and the indicators that were removed in the last fetch of the source.
+    The store has a stable path per integration instance, and only that path is kept in the integration context,
+    so the context size does not depend on the feed size.
+    An indicator is new or changed if its hash is missing from the previous fetch,
+    and it was removed if its type and value are missing from the current fetch.
+    The hashes are sorted in chunks and the values are streamed from disk, so memory stays small
+    for millions of indicators.
+    Sources that were not seen in the current fetch (e.g. failed or unchanged URLs) keep their previous state.
+    If the store is missing (e.g. the integration moved to a new container) or the integration context was reset,
+    all the indicators are new.
+
+    :type integration_context_key: ``str``
+    :param integration_context_key: The integration context key to store the path of the store under.
+
+    :type store_root: ``str``
+    :param store_root: The directory to create the store in. Default is the temp directory.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    TYPECODE = 'Q' if IS_PY3 else 'L'
+    SORT_CHUNK_SIZE = 1000000
+
+    def __init__(self, integration_context_key='indicators_fingerprints', store_root=None):
+        self._integration_context_key = integration_context_key
+        store_name = u'{}\x00{}'.format(demisto.integrationInstance(), integration_context_key)
+        self.store_path = os.path.join(store_root or tempfile.gettempdir(), 'feed_indicators_diff',
+                                       hashlib.sha256(store_name.encode('utf-8')).hexdigest()[:32])
+        # a reset integration context means a full fetch, so the store of an earlier context is not used
+        reference = demisto.getIntegrationContext().get(integration_context_key)
+        self._has_previous = isinstance(reference, dict) and reference.get('store_path') == self.store_path
+        self._previous = {}  # type: dict
+        self._current = {}  # type: dict
+        self.source_to_counts = {}  # type: dict
+        self.source_to_removed = {}  # type: dict
+
+    @staticmethod
+    def _hash64(text):
+        # not used for security, only as a fast and stable 64-bit hash
+        return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:16], 16)  # nosec
+
+    @classmethod
+    def _key(cls, indicator_type, value):
+        return cls._hash64(u'{}\x00{}'.format(indicator_type, value))
+
+    @classmethod
+    def _sort(cls, hashes):
+        chunks = [array(cls.TYPECODE, sorted(hashes[i:i + cls.SORT_CHUNK_SIZE]))
+                  for i in range(0, len(hashes), cls.SORT_CHUNK_SIZE)]
+        if len(chunks) == 1:
+            return chunks[0]
+        return array(cls.TYPECODE, heapq.merge(*chunks))
+
+    @staticmethod
+    def _contains(sorted_hashes, value):
+        i = bisect.bisect_left(sorted_hashes, value)
+        return i != len(sorted_hashes) and sorted_hashes[i] == value
+
+    def _source_path(self, source, extension):
+        name = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.store_path, name + extension)
+
+    def _load_fingerprints(self, source):
+        fingerprints = array(self.TYPECODE)
+        path = self._source_path(source, '.fingerprints')
+        if self._has_previous and os.path.exists(path):
+            with open(path, 'rb') as f:
+                fingerprints.fromfile(f, os.path.getsize(path) // fingerprints.itemsize)
+        return fingerprints
+
+    def _save_fingerprints(self, source, sorted_fingerprints):
+        path = self._source_path(source, '.fingerprints')
+        with open(path + '.tmp', 'wb') as f:
+            sorted_fingerprints.tofile(f)
+        os.rename(path + '.tmp', path)
+
+    def _find_removed(self, source, sorted_keys):
+        # the values of the previous fetch are streamed from disk, in the order they were fetched
+        removed = []  # type: list
+        path = self._source_path(source, '.indicators')
+        if not self._has_previous or not os.path.exists(path):
+            return removed
+        removed_keys = set()
+        with open(path, 'rb') as f:
+            for line in f:
+                indicator_type, value = json.loads(line.decode('utf-8'))
+                key = self._key(indicator_type, value)
+                if key not in removed_keys and not self._contains(sorted_keys, key):
+                    removed_keys.add(key)
+                    removed.append({'type': indicator_type, 'value': value})
+        return removed
+
+    def _save_removed(self, source, removed):
+        path = self._source_path(source, '.removed')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(json.dumps({'source': source, 'indicators': removed}).encode('utf-8'))
+        os.rename(path + '.tmp', path)
+
+    def add_source(self, source):
+        """
+        Records a source of the current fetch. A source is recorded by its first indicator as well,
+        but a source with no indicators has to be added, so its removed indicators are found on ``save``.
+
+        :type source: ``str``
+        :param source: The source, for example the feed URL.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        if source in self._current:
+            return
+        if not self._has_previous and not self._current and os.path.isdir(self.store_path):
+            # the store of an earlier integration context is replaced by this fetch
+            shutil.rmtree(self.store_path, ignore_errors=True)
+        if not os.path.isdir(self.store_path):
+            os.makedirs(self.store_path)
+        # the values are written to disk as they are fetched, and replace the previous ones on save
+        values_file = open(self._source_path(source, '.indicators.tmp'), 'wb')
+        self._current[source] = (array(self.TYPECODE), array(self.TYPECODE), values_file)
+        self._previous[source] = self._load_fingerprints(source)
+        self.source_to_counts.setdefault(source, {'new_or_changed': 0, 'unchanged': 0, 'removed': 0})
+
+    def get_removed_indicators(self):
+        """
+        Gets the indicators that were removed from each source in its last saved fetch.
+
+        :return: The removed indicators, as dicts with the ``source``, ``type`` and ``value`` of each indicator.
+        :rtype: ``list``
+        """
+        removed = []  # type: list
+        if not self._has_previous or not os.path.isdir(self.store_path):
+            return removed
+        for name in sorted(os.listdir(self.store_path)):
+            if name.endswith('.removed'):
+                with open(os.path.join(self.store_path, name), 'rb') as f:
+                    state = json.loads(f.read().decode('utf-8'))
+                removed.extend(dict(indicator, source=state['source']) for indicator in state['indicators'])
+        return removed
+
+    def is_new_or_changed(self, source, indicator):
+        """
+        Records an indicator of the current fetch, and checks whether it should be submitted.
+
+        :type source: ``str``
+        :param source: The source of the indicator, for example the feed URL.
+
+        :type indicator: ``dict``
+        :param indicator: The indicator, as sent to ``demisto.createIndicators``.
+
+        :return: True if the indicator is new or changed since the last fetch.
+        :rtype: ``bool``
+        """
+        self.add_source(source)
+        fingerprints, keys, values_file = self._current[source]
+        counts = self.source_to_counts[source]
+        fingerprint = self._hash64(json.dumps(indicator, sort_keys=True, default=str))
+        fingerprints.append(fingerprint)
+        indicator_type, value = indicator.get('type'), indicator.get('value')
+        keys.append(self._key(indicator_type, value))
+        values_file.write(json.dumps([indicator_type, value]).encode('utf-8') + b'\n')
+
+        if self._contains(self._previous[source], fingerprint):
+            counts['unchanged'] += 1
+            return False
+        counts['new_or_changed'] += 1
+        return True
+
+    def filter_indicators(self, source, indicators):
+        """
+        Yields only the new or changed indicators of a source.
+
+        :type source: ``str``
+        :param source: The source of the indicators, for example the feed URL.
+
+        :type indicators: ``iterable``
+        :param indicators: The indicators of the source.
+
+        :return: The new or changed indicators.
+        :rtype: ``generator``
+        """
+        for indicator in indicators:
+            if self.is_new_or_changed(source, indicator):
+                yield indicator
+
+    def save(self):
+        """
+        Stores the state of the current fetch on disk, and the path of the store in the integration context.
+        Should be called only after the indicators were submitted, so a failed fetch is submitted again next time.
+        The indicators that were removed from each source are kept in ``source_to_removed``,
+        as a list of dicts with the ``type`` and ``value`` of each indicator, and in the store,
+        see ``get_removed_indicators``.
+
+        :return: The counts of the new or changed, unchanged and removed indicators of each source.
+        :rtype: ``dict``
+        """
+        for source, (fingerprints, keys, values_file) in self._current.items():
+            values_file.close()
+            fingerprints = self._sort(fingerprints)
+            removed = self._find_removed(source, self._sort(keys))
+            self.source_to_removed[source] = removed
+            self.source_to_counts[source]['removed'] = len(removed)
+            self._save_removed(source, removed)
+            self._save_fingerprints(source, fingerprints)
+            os.rename(values_file.name, self._source_path(source, '.indicators'))
+            self._previous[source] = fingerprints
+        self._current = {}
+
+        integration_context = demisto.getIntegrationContext()
+        integration_context[self._integration_context_key] = {'store_path': self.store_path}
+        demisto.setIntegrationContext(integration_context)
+        self._has_previous = True
+        return self.source_to_counts
 
 
 class DemistoException(Exception):
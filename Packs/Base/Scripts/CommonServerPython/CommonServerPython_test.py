@@ -5,6 +5,8 @@ import json
 import re
 import os
 import sys
+import threading
+import time
 import requests
 from pytest import raises, mark
 import pytest
@@ -15,7 +17,8 @@ from CommonServerPython import xml2json, json2xml, entryTypes, formats, tableToM
     IntegrationLogger, parse_date_string, IS_PY3, DebugLogger, b64_encode, parse_date_range, return_outputs, \
     argToBoolean, ipv4Regex, ipv4cidrRegex, ipv6cidrRegex, ipv6Regex, batch, FeedIndicatorType, \
     encode_string_results, safe_load_json, remove_empty_elements, aws_table_to_markdown, is_demisto_version_ge, \
-    appendContext
+    appendContext, FeedIndicatorsDiff, IndicatorsSearcher, submit_in_batches, create_indicators_in_batches, \
+    CidrIndex
 
 try:
     from StringIO import StringIO
@@ -66,6 +69,90 @@ def test_xml():
     assert xmlActual == xml, "expected:\n{}\nto equal:\n{}".format(xml, xmlActual)
 
 
+XML_WITH_TAILS_AND_NAMESPACES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<ns:response xmlns:ns="urn:example" status="success">
+    <ns:result total="2">
+        <entry name="a">first<!-- comment -->text<member>1</member>tail of member</entry>
+        <entry name="b"><member>2</member><member>3</member></entry>
+        <empty/>
+        <text-only>  text  </text-only>
+    </ns:result>
+    tail of result
+</ns:response>"""
+
+
+@pytest.mark.parametrize('strip_ns, strip', [(1, 1), (0, 1), (1, 0), (0, 0)])
+def test_xml2dict_equals_xml2json(strip_ns, strip):
+    """
+        Given
+        - XML with attributes, namespaces, repeated elements, tails, comments and empty elements
+
+        When
+        - Converting it to a dict
+
+        Then
+        - Ensure the dict is equal to the loaded JSON of the former xml2json implementation
+    """
+    import xml.etree.ElementTree as ElementTree
+    from CommonServerPython import xml2dict, elem2json
+    expected = json.loads(elem2json(ElementTree.fromstring(XML_WITH_TAILS_AND_NAMESPACES), {},
+                                    strip_ns=strip_ns, strip=strip))
+    assert xml2dict(XML_WITH_TAILS_AND_NAMESPACES, strip_ns=strip_ns, strip=strip) == expected
+    assert json.loads(xml2json(XML_WITH_TAILS_AND_NAMESPACES, strip_ns=strip_ns, strip=strip)) == expected
+    assert xml2dict(XML_WITH_TAILS_AND_NAMESPACES.decode('utf-8').split('\n', 1)[1], strip_ns, strip) == expected
+
+
+def test_xml2dict():
+    from CommonServerPython import xml2dict
+    assert xml2dict(XML_WITH_TAILS_AND_NAMESPACES) == {'response': {
+        '@status': 'success',
+        'result': {
+            '@total': '2',
+            'entry': [
+                {'@name': 'a', 'member': {'#tail': 'tail of member', '#text': '1'}, '#text': 'firsttext'},
+                {'@name': 'b', 'member': ['2', '3']}
+            ],
+            'empty': None,
+            'text-only': 'text',
+            '#tail': 'tail of result'
+        }
+    }}
+
+
+def test_xml2dict_file(tmpdir):
+    from CommonServerPython import xml2dict
+    xml_file = tmpdir.join('response.xml')
+    xml_file.write_binary(XML_WITH_TAILS_AND_NAMESPACES)
+    with open(str(xml_file), 'rb') as xml:
+        assert xml2dict(xml) == xml2dict(XML_WITH_TAILS_AND_NAMESPACES)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 10, 65536])
+def test_xml2dict_stream(chunk_size):
+    """
+        Given
+        - XML with repeated <entry> elements, some of them with nested <entry> elements
+
+        When
+        - Streaming the <entry> elements, and the <entry> elements of the <rules> element
+
+        Then
+        - Ensure only the outermost matching elements are yielded, as xml2dict converts them
+    """
+    from CommonServerPython import xml2dict_stream
+    xml = '<response><result><entry name="dg"><rules>{}</rules></entry>' \
+          '<entry name="other"/></result></response>'.format(
+              ''.join('<entry name="rule-{0}"><member><entry>{0}</entry></member></entry>'.format(i) for i in range(5)))
+    rules = [{'@name': 'rule-{}'.format(i), 'member': {'entry': str(i)}} for i in range(5)]
+
+    entries = list(xml2dict_stream(xml, 'entry', chunk_size=chunk_size))
+    assert [entry['@name'] for entry in entries] == ['dg', 'other']
+    assert entries[0]['rules']['entry'] == rules
+
+    assert list(xml2dict_stream(xml, 'rules/entry', chunk_size=chunk_size)) == rules
+    assert list(xml2dict_stream([xml.encode('utf-8')], 'result/entry/rules/entry')) == rules
+
+
 def toEntry(table):
     return {
 
@@ -189,6 +276,53 @@ def test_is_ip_valid():
     assert not is_ip_valid(invalid_not_ip_with_ip_structure)
 
 
+CIDR_INDEX_RANGES = ['10.0.0.0/8', '192.168.1.0/24', '192.168.2.0/24', '172.16.5.4', '172.20.1.1/12',
+                     '2001:db8::/32', 'fe80::1/128']
+
+
+@pytest.mark.parametrize('ip, expected', [
+    ('10.0.0.0', True),
+    ('10.255.255.255', True),
+    ('11.0.0.0', False),
+    ('9.255.255.255', False),
+    ('192.168.1.200', True),
+    ('192.168.2.0', True),
+    ('192.168.3.0', False),
+    ('172.16.5.4', True),
+    ('172.16.5.5', True),  # 172.20.1.1/12 is 172.16.0.0/12
+    ('172.32.0.0', False),
+    ('0.0.0.0', False),
+    ('2001:db8:1::5', True),
+    ('2001:db9::', False),
+    ('fe80::1', True),
+    ('fe80::2', False),
+    ('::ffff:10.0.0.1', False),
+])
+def test_cidr_index_contains(ip, expected):
+    cidr_index = CidrIndex(CIDR_INDEX_RANGES)
+    assert cidr_index.contains(ip) is expected
+    assert (ip in cidr_index) is expected
+
+
+def test_cidr_index_contains_many():
+    cidr_index = CidrIndex(CIDR_INDEX_RANGES)
+    assert cidr_index.contains_many(['10.1.1.1', '8.8.8.8', '2001:db8::1']) == [True, False, True]
+    assert CidrIndex([]).contains_many(['10.1.1.1', '::1']) == [False, False]
+    assert CidrIndex(['0.0.0.0/0']).contains_many(['1.2.3.4', '::1']) == [True, False]
+
+
+@pytest.mark.parametrize('cidrs, ip', [
+    (['10.0.0.0/33'], '10.0.0.1'),
+    (['10.0.0.0/a'], '10.0.0.1'),
+    (['10.0.0/8'], '10.0.0.1'),
+    (['10.0.0.0/8'], 'Demisto'),
+    (['10.0.0.0/8'], '10.0.0.256'),
+])
+def test_cidr_index_invalid(cidrs, ip):
+    with raises(ValueError):
+        CidrIndex(cidrs).contains(ip)
+
+
 def test_tbl_to_md_list_values():
     # list values
     data = copy.deepcopy(DATA)
@@ -343,6 +477,47 @@ def test_tbl_to_md_header_with_special_character():
     assert table_with_character == expected_string_with_special_character
 
 
+def test_tbl_to_md_generator():
+    # a generator is rendered as the list of its rows
+    table = tableToMarkdown('tableToMarkdown test', (row for row in DATA))
+    assert table == tableToMarkdown('tableToMarkdown test', DATA)
+
+    table = tableToMarkdown('tableToMarkdown test', (row for row in DATA), headers=['header_2'], removeNull=True)
+    assert table == tableToMarkdown('tableToMarkdown test', DATA, headers=['header_2'], removeNull=True)
+
+    assert tableToMarkdown('tableToMarkdown test', iter([])) == '### tableToMarkdown test\n**No entries.**\n'
+
+
+@pytest.mark.parametrize('make_table', [list, iter])
+def test_tbl_to_md_max_rows(make_table):
+    table = tableToMarkdown('tableToMarkdown test', make_table(DATA), max_rows=2)
+    expected_table = '''### tableToMarkdown test
+|header_1|header_2|header_3|
+|---|---|---|
+| a1 | b1 | c1 |
+| a2 | b2 | c2 |
+
+**1 more rows are not shown.**
+'''
+    assert table == expected_table
+    assert tableToMarkdown('tableToMarkdown test', make_table(DATA), max_rows=3) == \
+        tableToMarkdown('tableToMarkdown test', DATA)
+
+
+def test_tbl_to_md_remove_null_of_shown_rows():
+    # the columns that are empty in the shown rows are removed
+    data = [{'header_1': 'a1', 'header_2': ''}, {'header_1': 'a2', 'header_2': 'b2'}]
+    table = tableToMarkdown('tableToMarkdown test', data, removeNull=True, max_rows=1)
+    expected_table = '''### tableToMarkdown test
+|header_1|
+|---|
+| a1 |
+
+**1 more rows are not shown.**
+'''
+    assert table == expected_table
+
+
 def test_flatten_cell():
     # sanity
     utf8_to_flatten = b'abcdefghijklmnopqrstuvwxyz1234567890!'.decode('utf8')
@@ -640,6 +815,34 @@ def test_logger_replace_strs(mocker):
     assert ilog.messages[0] == '<XX_REPLACED> is <XX_REPLACED> and b64: <XX_REPLACED>'
 
 
+def test_logger_replace_strs_deferred(mocker):
+    params = mocker.patch.object(demisto, 'params', return_value={
+        'credentials': {'identifier': 'user', 'password': 'my_password'},
+    })
+    ilog = IntegrationLogger()
+    assert not params.called
+    ilog('the password is my_password')
+    assert ilog.messages[0] == 'the password is <XX_REPLACED>'
+    assert params.called
+
+
+def test_lazy_modules_are_not_imported():
+    """
+    Given
+        - CommonServerPython imported in a new interpreter
+    When
+        - requests and ElementTree are not used
+    Then
+        - they are not imported, and are imported on first use
+    """
+    import subprocess
+    code = ("import sys; import CommonServerPython as csp; "
+            "print('requests' in sys.modules, 'xml.etree.ElementTree' in sys.modules); "
+            "print(csp.requests.Session is sys.modules['requests'].Session, csp.json2xml({'a': 'b'}))")
+    output = subprocess.check_output([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    assert output.decode('utf-8').splitlines() == ['False False', "True b'<a>b</a>'" if IS_PY3 else 'True <a>b</a>']
+
+
 def test_is_mac_address():
     from CommonServerPython import is_mac_address
 
@@ -1403,6 +1606,327 @@ class TestBaseClient:
         response.status_code = 400
         assert not self.client._is_status_code_valid(response)
 
+    def test_adapter_per_retry_config(self, requests_mock):
+        """
+            Given
+            - A base client with pool size settings
+
+            When
+            - Making several requests with the same retry config, and then with another retry config
+
+            Then
+            - Ensure one adapter is created per retry config, with the pool size settings
+        """
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/', pool_maxsize=20)
+        requests_mock.get('http://example.com/api/v2/event', text=json.dumps(self.text))
+        client._http_request('get', 'event')
+        adapter = client._session.get_adapter('http://example.com')
+        client._http_request('get', 'event')
+        assert client._session.get_adapter('http://example.com') is adapter
+        assert adapter._pool_maxsize == 20
+
+        client._http_request('get', 'event', retries=2)
+        assert client._session.get_adapter('http://example.com') is not adapter
+        client._http_request('get', 'event')
+        assert client._session.get_adapter('http://example.com') is adapter
+        assert len(client._adapters) == 2
+
+    def test_http_request_counters(self, requests_mock):
+        """
+            Given
+            - A base client
+
+            When
+            - Making requests
+
+            Then
+            - Ensure the requests and the bytes sent and received are counted
+        """
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.post('http://example.com/api/v2/event', text=json.dumps(self.text))
+        client._http_request('post', 'event', data='12345')
+        client._http_request('post', 'event', data='12345')
+        assert client.counters['requests'] == 2
+        assert client.counters['bytes_sent'] == 10
+        assert client.counters['bytes_received'] == 2 * len(json.dumps(self.text))
+        assert client.counters['throttled_waits'] == 0
+
+    def test_http_request_rate_limit_retry_after(self, mocker, requests_mock):
+        """
+            Given
+            - A rate limited base client
+
+            When
+            - The server answers with 429 and a Retry-After header
+
+            Then
+            - Ensure the next request to the server waits for the Retry-After time
+        """
+        import CommonServerPython
+        client = CommonServerPython.BaseClient('http://example.com/api/v2/', rate_limit=100, rate_limit_burst=10)
+        sleep = mocker.patch.object(CommonServerPython.time, 'sleep')
+        requests_mock.get('http://example.com/api/v2/event', [
+            {'status_code': 429, 'headers': {'Retry-After': '30'}},
+            {'text': json.dumps(self.text)},
+        ])
+        with raises(CommonServerPython.DemistoException):
+            client._http_request('get', 'event')
+        assert not sleep.called
+
+        assert client._http_request('get', 'event') == self.text
+        assert 29 < sleep.call_args[0][0] <= 30
+        assert client.counters['throttled_waits'] == 1
+
+    def test_bulk_http_request(self, requests_mock):
+        """
+            Given
+            - A base client
+
+            When
+            - Sending several requests in bulk, where one of them fails
+
+            Then
+            - Ensure the results are in the order of the requests
+            - Ensure the failed request has the exception as its result, and does not fail the others
+        """
+        from CommonServerPython import BaseClient, DemistoException
+        client = BaseClient('http://example.com/api/v2/')
+        for i in range(20):
+            requests_mock.get('http://example.com/api/v2/ip/{}'.format(i), json={'ip': i})
+        requests_mock.get('http://example.com/api/v2/ip/7', status_code=404)
+
+        results = client._bulk_http_request([{'method': 'GET', 'url_suffix': 'ip/{}'.format(i)} for i in range(20)],
+                                            max_workers=5)
+        assert isinstance(results[7], DemistoException)
+        assert [result['ip'] for result in results if not isinstance(result, Exception)] == [
+            i for i in range(20) if i != 7]
+        assert client.counters['requests'] == 20
+
+    def test_bulk_http_request_concurrency(self, mocker):
+        """
+            Given
+            - A base client
+
+            When
+            - Sending slow requests in bulk
+
+            Then
+            - Ensure the requests are sent concurrently, and no more than max_workers at once
+            - Ensure the common arguments are passed to all of the requests
+        """
+        from CommonServerPython import BaseClient
+        lock = threading.Lock()
+        in_flight = {'now': 0, 'max': 0}
+
+        def slow_request(method, url_suffix, **kwargs):
+            with lock:
+                in_flight['now'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            time.sleep(0.05)
+            with lock:
+                in_flight['now'] -= 1
+            return method, url_suffix, kwargs
+
+        client = BaseClient('http://example.com/api/v2/')
+        mocker.patch.object(client, '_http_request', side_effect=slow_request)
+        results = client._bulk_http_request([{'method': 'GET', 'url_suffix': str(i)} for i in range(12)],
+                                            max_workers=4, resp_type='text')
+        assert results == [('GET', str(i), {'resp_type': 'text'}) for i in range(12)]
+        assert in_flight['max'] == 4
+
+    def test_http_request_xml(self, requests_mock):
+        from CommonServerPython import DemistoException
+        requests_mock.get('http://example.com/api/v2/event', text='<root><event id="1"/></root>')
+        root = self.client._http_request('get', 'event', resp_type='xml')
+        assert root.find('event').get('id') == '1'
+
+        requests_mock.get('http://example.com/api/v2/event', text='<root>')
+        with raises(DemistoException, match='Failed to parse xml object'):
+            self.client._http_request('get', 'event', resp_type='xml')
+
+    @pytest.mark.parametrize('body', [
+        json.dumps([{'id': i} for i in range(100)]),
+        '\n'.join(json.dumps({'id': i}) for i in range(100)) + '\n',
+    ])
+    def test_stream_json_items(self, requests_mock, body):
+        """
+            Given
+            - A JSON array response, or an NDJSON response
+
+            When
+            - Streaming the items of the response in small chunks
+
+            Then
+            - Ensure all of the items are yielded in order
+            - Ensure the bytes of the response are counted
+        """
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/export', text=body)
+        items = client._stream_json_items('GET', 'export', chunk_size=7)
+        assert [item['id'] for item in items] == list(range(100))
+        assert client.counters['bytes_received'] == len(body)
+
+    def test_stream_json_items_invalid(self, requests_mock):
+        from CommonServerPython import BaseClient, DemistoException
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/export', text='[{"id": 1}, {"id": ')
+        items = client._stream_json_items('GET', 'export')
+        assert next(items) == {'id': 1}
+        with raises(DemistoException, match='Failed to parse json object'):
+            next(items)
+
+    def test_download_file(self, requests_mock, tmpdir):
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        content = os.urandom(100000)
+        requests_mock.get('http://example.com/api/v2/artifact', content=content)
+
+        path = client._download_file('GET', 'artifact', chunk_size=4096)
+        try:
+            with open(path, 'rb') as downloaded_file:
+                assert downloaded_file.read() == content
+        finally:
+            os.remove(path)
+
+        path = str(tmpdir.join('artifact'))
+        assert client._download_file('GET', 'artifact', path=path) == path
+        assert tmpdir.join('artifact').read_binary() == content
+
+    def test_paginate_cursor(self, requests_mock):
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/events', [
+            {'json': {'data': {'events': [1, 2]}, 'next': 'a'}},
+            {'json': {'data': {'events': [3]}, 'next': 'b'}},
+            {'json': {'data': {'events': [4]}}},
+        ])
+        items = client._paginate('GET', 'events', 'cursor', items_path='data.events', next_cursor_path='next',
+                                 params={'type': 'alert'})
+        assert list(items) == [1, 2, 3, 4]
+        assert [request.qs for request in requests_mock.request_history] == [
+            {'type': ['alert']}, {'type': ['alert'], 'cursor': ['a']}, {'type': ['alert'], 'cursor': ['b']}]
+
+    def test_paginate_link(self, requests_mock):
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/events', json=[1, 2],
+                          headers={'Link': '<http://example.com/api/v2/events?after=2>; rel="next"'})
+        requests_mock.get('http://example.com/api/v2/events?after=2', json=[3])
+        assert list(client._paginate('GET', 'events', 'link')) == [1, 2, 3]
+
+    def test_paginate_offset(self, requests_mock):
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/events', [
+            {'json': {'items': [1, 2]}},
+            {'json': {'items': [3, 4]}},
+            {'json': {'items': [5]}},
+        ])
+        items = client._paginate('GET', 'events', 'offset', items_path='items', page_size=2)
+        assert list(items) == [1, 2, 3, 4, 5]
+        assert [request.qs['offset'] for request in requests_mock.request_history] == [['0'], ['2'], ['4']]
+
+    def test_paginate_page_is_lazy(self, requests_mock):
+        """
+            Given
+            - A page number paginated API
+
+            When
+            - Consuming a limited number of items
+
+            Then
+            - Ensure only the pages of the consumed items are requested
+        """
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/')
+        requests_mock.get('http://example.com/api/v2/events', json=[1, 2, 3])
+        items = client._paginate('GET', 'events', 'page', page_param='p', page_size=3, limit=5)
+        assert next(items) == 1
+        assert requests_mock.call_count == 1
+        assert list(items) == [2, 3, 1, 2]
+        assert [request.qs['p'] for request in requests_mock.request_history] == [['1'], ['2']]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1000])
+def test_iter_json_items(chunk_size):
+    from CommonServerPython import iter_json_items
+    items = [{'id': 1, 'name': u'\u05d0"b'}, 12345, 'text', [1.5, None, True], {}]
+    for body in (json.dumps(items), '\n'.join(json.dumps(item) for item in items)):
+        body = body.encode('utf-8')
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        assert list(iter_json_items(chunks)) == items
+
+
+def test_iter_json_items_unclosed_array():
+    from CommonServerPython import iter_json_items
+    with raises(ValueError):
+        list(iter_json_items(['[1, 2']))
+
+
+class TestRateLimiter:
+    @staticmethod
+    def response(status_code=200, headers=None):
+        from requests import Response
+        response = Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        return response
+
+    def test_burst_then_rate(self, mocker):
+        """
+            Given
+            - A rate limiter of 2 requests per second, with a burst of 3
+
+            When
+            - Acquiring 5 requests at once
+
+            Then
+            - Ensure the first 3 requests do not wait, and the next ones are spaced by the rate
+            - Ensure other hosts are not limited
+        """
+        import CommonServerPython
+        mocker.patch.object(CommonServerPython.time, 'time', return_value=1000.0)
+        mocker.patch.object(CommonServerPython.time, 'sleep')
+        limiter = CommonServerPython.RateLimiter(2, 3)
+        waits = [limiter.acquire('example.com') for _ in range(5)]
+        assert waits == [0, 0, 0, 0.5, 1.0]
+        assert limiter.acquire('other.com') == 0
+
+    def test_invalid_rate(self):
+        from CommonServerPython import RateLimiter
+        with raises(ValueError):
+            RateLimiter(0)
+
+    @pytest.mark.parametrize('status_code, headers, expected_wait', [
+        (429, {'Retry-After': '10'}, 10),
+        (503, {'Retry-After': 'Thu, 01 Jan 1970 00:16:50 GMT'}, 10),
+        (200, {'Retry-After': '10'}, 0),
+        (200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '10'}, 10),
+        (200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1000000010'}, 10),
+        (200, {'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '10'}, 0),
+    ])
+    def test_update_by_headers(self, mocker, status_code, headers, expected_wait):
+        """
+            Given
+            - A rate limiter
+
+            When
+            - A host answers with rate limit headers
+
+            Then
+            - Ensure the next request to the host waits for the time the host asked for
+        """
+        import CommonServerPython
+        now = 1000000000.0 if 'X-RateLimit-Reset' in headers else 1000.0
+        mocker.patch.object(CommonServerPython.time, 'time', return_value=now)
+        mocker.patch.object(CommonServerPython.time, 'sleep')
+        limiter = CommonServerPython.RateLimiter(1000, 10)
+        limiter.update('example.com', self.response(status_code, headers))
+        assert limiter.acquire('example.com') == pytest.approx(expected_wait)
+
 
 def test_parse_date_string():
     # test unconverted data remains: Z
@@ -1589,14 +2113,93 @@ batch_params = [
     ([1, 2, 3], 5, [[1, 2, 3]]),
     # out of index in end with batches
     ([1, 2, 3, 4, 5], 2, [[1, 2], [3, 4], [5]]),
-    ([1] * 100, 2, [[1, 1]] * 50)
+    ([1] * 100, 2, [[1, 1]] * 50),
+    # generator case
+    ((i for i in range(1, 6)), 2, [[1, 2], [3, 4], [5]]),
+    (iter([]), 2, []),
 ]
 
 
 @pytest.mark.parametrize('iterable, sz, expected', batch_params)
 def test_batch(iterable, sz, expected):
-    for i, item in enumerate(batch(iterable, sz)):
-        assert expected[i] == item
+    assert list(batch(iterable, sz)) == expected
+
+
+def test_batch_is_lazy():
+    def endless():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    batches = batch(endless(), batch_size=3)
+    assert next(batches) == [0, 1, 2]
+    assert next(batches) == [3, 4, 5]
+
+
+class TestSubmitInBatches:
+    @staticmethod
+    def indicators(count, raw_size=10):
+        return ({'value': str(i), 'type': 'IP', 'rawJSON': {'data': 'a' * raw_size}} for i in range(count))
+
+    @pytest.mark.parametrize('pipeline', [False, True])
+    def test_batch_size(self, pipeline):
+        submitted = []
+        stats = submit_in_batches(self.indicators(5), submitted.append, batch_size=2, pipeline=pipeline)
+        assert [[indicator['value'] for indicator in items_batch] for items_batch in submitted] == \
+            [['0', '1'], ['2', '3'], ['4']]
+        assert stats['items'] == 5
+        assert stats['batches'] == 3
+        assert stats['bytes'] > 0
+
+    def test_max_batch_bytes(self):
+        # every indicator is serialized to about 1000 bytes
+        submitted = []
+        stats = submit_in_batches(self.indicators(100, raw_size=1000), submitted.append, batch_size=2000,
+                                  max_batch_bytes=10000)
+        assert [len(items_batch) for items_batch in submitted] == [10] * 10
+        assert stats['batches'] == 10
+
+        submitted = []
+        submit_in_batches(self.indicators(100, raw_size=1000), submitted.append, max_batch_bytes=10000, sample_every=1)
+        assert [len(items_batch) for items_batch in submitted] == [10] * 10
+
+    @pytest.mark.parametrize('pipeline', [False, True])
+    def test_submit_error(self, pipeline):
+        submitted = []
+
+        def submit(items_batch):
+            if submitted:
+                raise ValueError('failed to submit')
+            submitted.append(items_batch)
+
+        with pytest.raises(ValueError, match='failed to submit'):
+            submit_in_batches(self.indicators(10), submit, batch_size=2, pipeline=pipeline)
+        assert len(submitted) == 1
+
+    def test_pipeline(self):
+        # the next batch is collected while the previous one is submitted
+        events = []
+
+        def items():
+            for i in range(4):
+                events.append(('collect', i))
+                yield i
+
+        def submit(items_batch):
+            time.sleep(0.1)
+            events.append(('submit', items_batch))
+
+        submit_in_batches(items(), submit, batch_size=2, pipeline=True)
+        assert events.index(('collect', 2)) < events.index(('submit', [0, 1]))
+        assert events[-1] == ('submit', [2, 3])
+
+    def test_create_indicators_in_batches(self, mocker):
+        mocker.patch.object(demisto, 'createIndicators')
+        stats = create_indicators_in_batches(self.indicators(4500))
+        assert demisto.createIndicators.call_count == 3
+        assert [len(call[0][0]) for call in demisto.createIndicators.call_args_list] == [2000, 2000, 500]
+        assert stats['items'] == 4500
 
 
 regexes_test = [
@@ -1768,3 +2371,190 @@ def test_append_context(mocker, context_mock, data_mock, key, expected_answer):
         with raises(TypeError) as e:
             appendContext(key, data_mock)
             assert expected_answer in e.value
+
+
+def test_feed_indicators_diff(mocker, tmpdir):
+    """
+    Given
+    - A first fetch of 3 indicators, and a second fetch where one indicator changed, one was removed
+      and one was added.
+
+    When
+    - Filtering the indicators of each fetch with FeedIndicatorsDiff and saving it in between.
+
+    Then
+    - Ensure all the indicators are submitted in the first fetch.
+    - Ensure only the changed and added indicators are submitted in the second fetch, and the removal is returned.
+    - Ensure a source that was not fetched again keeps its fingerprints.
+    - Ensure only the stable path of the store is kept in the integration context.
+    """
+    integration_context = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    first_fetch = [
+        {'value': '1.1.1.1', 'type': 'IP', 'rawJSON': {'score': 1}},
+        {'value': '2.2.2.2', 'type': 'IP', 'rawJSON': {'score': 1}},
+        {'value': '3.3.3.3', 'type': 'IP', 'rawJSON': {'score': 1}},
+    ]
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    assert list(indicators_diff.filter_indicators('url1', first_fetch)) == first_fetch
+    assert list(indicators_diff.filter_indicators('url2', first_fetch[:1])) == first_fetch[:1]
+    indicators_diff.save()
+    assert integration_context == {'indicators_fingerprints': {'store_path': indicators_diff.store_path}}
+    assert indicators_diff.store_path.startswith(str(tmpdir))
+
+    second_fetch = [
+        {'value': '1.1.1.1', 'type': 'IP', 'rawJSON': {'score': 1}},
+        {'value': '2.2.2.2', 'type': 'IP', 'rawJSON': {'score': 3}},
+        {'value': '4.4.4.4', 'type': 'IP', 'rawJSON': {'score': 1}},
+    ]
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    assert indicators_diff.store_path == integration_context['indicators_fingerprints']['store_path']
+    assert list(indicators_diff.filter_indicators('url1', second_fetch)) == second_fetch[1:]
+    counts = indicators_diff.save()
+    assert counts == {'url1': {'new_or_changed': 2, 'unchanged': 1, 'removed': 1}}
+    assert indicators_diff.source_to_removed == {'url1': [{'type': 'IP', 'value': '3.3.3.3'}]}
+
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    assert indicators_diff.get_removed_indicators() == [{'source': 'url1', 'type': 'IP', 'value': '3.3.3.3'}]
+    assert not indicators_diff.is_new_or_changed('url2', first_fetch[0])
+    assert not indicators_diff.is_new_or_changed('url1', second_fetch[2])
+
+
+def test_feed_indicators_diff_empty_source(mocker, tmpdir):
+    """
+    Given
+    - A source that returned indicators in the first fetch, and no indicators in the second fetch.
+
+    When
+    - Adding the source explicitly in the second fetch and saving.
+
+    Then
+    - Ensure all the indicators of the first fetch are returned as removed.
+    """
+    integration_context = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    indicators = [{'value': '1.1.1.1', 'type': 'IP'}, {'value': '2.2.2.2', 'type': 'IP'}]
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    list(indicators_diff.filter_indicators('url1', indicators))
+    indicators_diff.save()
+
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    indicators_diff.add_source('url1')
+    assert indicators_diff.save() == {'url1': {'new_or_changed': 0, 'unchanged': 0, 'removed': 2}}
+    assert indicators_diff.source_to_removed == {'url1': [{'type': 'IP', 'value': '1.1.1.1'},
+                                                          {'type': 'IP', 'value': '2.2.2.2'}]}
+
+
+def test_feed_indicators_diff_reset_context(mocker, tmpdir):
+    """
+    Given
+    - A store of a previous fetch, and an integration context that was reset since.
+
+    When
+    - Filtering indicators with FeedIndicatorsDiff.
+
+    Then
+    - Ensure all the indicators are submitted and none is reported as removed.
+    """
+    integration_context = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    indicators = [{'value': '1.1.1.1', 'type': 'IP'}]
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    list(indicators_diff.filter_indicators('url1', indicators + [{'value': '2.2.2.2', 'type': 'IP'}]))
+    indicators_diff.save()
+    integration_context.clear()
+
+    indicators_diff = FeedIndicatorsDiff(store_root=str(tmpdir))
+    assert indicators_diff.get_removed_indicators() == []
+    assert list(indicators_diff.filter_indicators('url1', indicators)) == indicators
+    assert indicators_diff.save() == {'url1': {'new_or_changed': 1, 'unchanged': 0, 'removed': 0}}
+    assert indicators_diff.source_to_removed == {'url1': []}
+
+
+def test_feed_indicators_diff_sort_chunks():
+    from array import array
+    hashes = array(FeedIndicatorsDiff.TYPECODE, [5, 2 ** 64 - 1, 3, 0, 9, 7, 2 ** 63])
+    FeedIndicatorsDiff.SORT_CHUNK_SIZE = 3
+    try:
+        assert list(FeedIndicatorsDiff._sort(hashes)) == sorted(hashes)
+    finally:
+        FeedIndicatorsDiff.SORT_CHUNK_SIZE = 1000000
+
+
+def mock_search_indicators(total):
+    def search_indicators(query='', page=0, size=100, **kwargs):
+        values = range(page * size, min((page + 1) * size, total))
+        return {'iocs': [{'value': str(i), 'indicator_type': 'IP', 'score': 1} for i in values], 'total': total}
+    return search_indicators
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+@pytest.mark.parametrize('total, limit, expected_searches', [
+    (0, None, 1),
+    (25, None, 3),
+    (30, None, 4),
+    (25, 12, 2),
+    (25, 30, 3),
+])
+def test_indicators_searcher(mocker, prefetch, total, limit, expected_searches):
+    """
+    Given
+    - A query with a total amount of indicators.
+    When
+    - Iterating the indicators with IndicatorsSearcher, with or without a limit and prefetching.
+    Then
+    - Ensure all the indicators up to the limit are yielded, in order, and no unneeded page is searched.
+    """
+    search_indicators = mocker.patch.object(demisto, 'searchIndicators', side_effect=mock_search_indicators(total))
+    searcher = IndicatorsSearcher(query='type:IP', page_size=10, limit=limit, prefetch=prefetch)
+    values = [ioc['value'] for ioc in searcher]
+
+    expected_amount = total if limit is None else min(total, limit)
+    assert values == [str(i) for i in range(expected_amount)]
+    assert search_indicators.call_count == expected_searches
+    assert search_indicators.call_args[1]['query'] == 'type:IP'
+
+
+def test_indicators_searcher_cursor_and_fields(mocker):
+    """
+    Given
+    - A query with 25 indicators.
+    When
+    - Iterating the indicators with a projection, and resuming the iteration from the searcher's cursor.
+    Then
+    - Ensure only the requested fields are kept, and the resumed search continues from the next page.
+    """
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=mock_search_indicators(25))
+    searcher = IndicatorsSearcher(page_size=10, limit=10, fields=['value'])
+    assert list(searcher) == [{'value': str(i)} for i in range(10)]
+    assert searcher.page == 1
+    assert not searcher.exhausted
+
+    resumed = IndicatorsSearcher(page=searcher.page, page_size=10, fields=['value'])
+    assert [ioc['value'] for ioc in resumed] == [str(i) for i in range(10, 25)]
+    assert resumed.exhausted
+
+
+def test_indicators_searcher_prefetch_error(mocker):
+    """
+    Given
+    - A query whose second page fails to be searched.
+    When
+    - Iterating the indicators with prefetching.
+    Then
+    - Ensure the indicators of the first page are yielded, and the error is raised in the iterating thread.
+    """
+    def search_indicators(query='', page=0, size=100, **kwargs):
+        if page:
+            raise ValueError('search failed')
+        return {'iocs': [{'value': str(i)} for i in range(size)]}
+
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    values = []
+    with pytest.raises(ValueError, match='search failed'):
+        for ioc in IndicatorsSearcher(page_size=10, prefetch=True):
+            values.append(ioc['value'])
+    assert len(values) == 10
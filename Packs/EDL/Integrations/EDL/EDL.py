@@ -4,14 +4,18 @@ from CommonServerUserPython import *
 
 
 import re
+import gzip
+import gevent
+import hashlib
 from copy import deepcopy
 from base64 import b64decode
 from multiprocessing import Process
 from gevent.pywsgi import WSGIServer
+from gevent.lock import BoundedSemaphore
 from tempfile import NamedTemporaryFile
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
-from typing import Callable, List, Any, Dict, cast, Tuple
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Any, Dict, Optional, cast, Tuple
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 
 
@@ -24,6 +28,8 @@ class Handler:
 ''' GLOBAL VARIABLES '''
 INTEGRATION_NAME: str = 'EDL'
 PAGE_SIZE: int = 200
+# the indicator fields the EDL is built from
+INDICATOR_FIELDS: List[str] = ['value', 'indicator_type']
 DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-edl')
 EDL_VALUES_KEY: str = 'dmst_edl_values'
@@ -40,6 +46,46 @@ DONT_COLLAPSE = "Don't Collapse"
 COLLAPSE_TO_CIDR = "To CIDRS"
 COLLAPSE_TO_RANGES = "To Ranges"
 
+# how long to wait before retrying a failed background refresh, in seconds
+REFRESH_RETRY_INTERVAL: int = 60
+
+
+class EDLSnapshot:
+    """
+    The EDL values served to the clients, with their ETag and gzip compressed form computed once per refresh
+
+    Parameters:
+        values (str): The EDL values
+        last_run (int): The timestamp (in milliseconds) in which the values were created
+    """
+
+    def __init__(self, values: str, last_run: int):
+        self.values = values
+        self.last_run = last_run
+        data = values.encode('utf-8')
+        self.etag = hashlib.sha1(data).hexdigest()  # nosec - used only to detect changes
+        self.gzip_values = gzip.compress(data)
+
+
+class EDLCache:
+    """
+    Holds the snapshot the long running server serves. The snapshot is replaced only when a refresh succeeds,
+    so the clients are always served the last good values.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[EDLSnapshot] = None
+        # held while the first snapshot is built, so the requests and the refresh loop build it only once
+        self.lock = BoundedSemaphore()
+
+    def update(self, values: str, last_run: int) -> EDLSnapshot:
+        if not self.snapshot or self.snapshot.last_run != last_run:
+            self.snapshot = EDLSnapshot(values, last_run)
+        return self.snapshot
+
+
+EDL_CACHE: EDLCache = EDLCache()
+
 ''' HELPER FUNCTIONS '''
 
 
@@ -90,19 +136,15 @@ def refresh_edl_context(indicator_query: str, limit: int = 0, collapse_ips: str
     Returns: List(IoCs in output format)
     """
     now = datetime.now()
-    offset = 0
     # poll indicators into edl from demisto
-    iocs = find_indicators_to_limit(indicator_query, limit, offset, panos_compatible, url_port_stripping)
+    indicators = iterate_indicators(indicator_query, panos_compatible, url_port_stripping)
+    iocs = list(islice(indicators, limit))
     out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, collapse_ips=collapse_ips)
 
     if collapse_ips != DONT_COLLAPSE:
         while actual_indicator_amount < limit:
-            # from where to start the new poll and how many results should be fetched
-            new_offset = len(iocs) + offset + actual_indicator_amount - 1
-            new_limit = limit - actual_indicator_amount
-
-            # poll additional indicators into list from demisto
-            new_iocs = find_indicators_to_limit(indicator_query, new_limit, new_offset)
+            # collapsing freed some room - continue the same search for the missing amount of indicators
+            new_iocs = list(islice(indicators, limit - actual_indicator_amount))
 
             # in case no additional indicators exist - exit
             if len(new_iocs) == 0:
@@ -119,6 +161,64 @@ def refresh_edl_context(indicator_query: str, limit: int = 0, collapse_ips: str
     return out_dict[EDL_VALUES_KEY]
 
 
+def iterate_indicators(indicator_query: str, panos_compatible: bool = True, url_port_stripping: bool = False,
+                       page: int = 0, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Lazily iterates the formatted indicators of a query, fetching a page from demisto.searchIndicators at a time
+
+    Parameters:
+        indicator_query (str): Query that determines which indicators to include in
+            the EDL (Cortex XSOAR indicator query syntax)
+        panos_compatible (bool): Whether to make the indicators PANOS compatible or not
+        url_port_stripping (bool): Whether to strip the port from URL indicators (if a port is present) or not
+        page (int): The page to start the search from
+        limit (int): The maximum number of indicators to fetch, None for all of them
+
+    Returns:
+        Iterator: The formatted IoCs
+    """
+    searcher = IndicatorsSearcher(query=indicator_query, page=page, page_size=PAGE_SIZE, limit=limit,
+                                  fields=INDICATOR_FIELDS)
+    return format_indicators(searcher, panos_compatible, url_port_stripping)
+
+
+def format_indicators(iocs: Iterable[dict], panos_compatible: bool = True,
+                      url_port_stripping: bool = False) -> Iterator[dict]:
+    """
+    Formats the values of the indicators for the EDL
+
+    Parameters:
+        iocs (Iterable): The IoCs to format
+        panos_compatible (bool): Whether to make the indicators PANOS compatible or not
+        url_port_stripping (bool): Whether to strip the port from URL indicators (if a port is present) or not
+
+    Returns:
+        Iterator: The formatted IoCs
+    """
+    for index, ioc in enumerate(iocs, 1):
+        if panos_compatible or url_port_stripping:
+            ioc_value = ioc.get('value', '')
+            if url_port_stripping:
+                ioc_value = _PORT_RE.sub(_URL_WITHOUT_PORT, ioc_value)
+            if panos_compatible:
+                # protocol stripping
+                ioc_value = _PROTOCOL_RE.sub('', ioc_value)
+                # mix of text and wildcard in domain field handling
+                ioc_value = _INVALID_TOKEN_RE.sub('*', ioc_value)
+                # for PAN-OS *.domain.com does not match domain.com
+                # we should provide both
+                # this could generate more than num entries according to PAGE_SIZE
+                if ioc_value.startswith('*.'):
+                    ioc_object_copy = deepcopy(ioc)
+                    ioc_object_copy['value'] = ioc_value.lstrip('*.')
+                    yield ioc_object_copy
+            ioc['value'] = ioc_value
+        yield ioc
+        if index % PAGE_SIZE == 0:
+            # let the server handle requests between the pages when refreshing in the background
+            gevent.sleep(0)
+
+
 def find_indicators_to_limit(indicator_query: str, limit: int, offset: int = 0,
                              panos_compatible: bool = True, url_port_stripping: bool = False) -> list:
     """
@@ -146,7 +246,7 @@ def find_indicators_to_limit(indicator_query: str, limit: int, offset: int = 0,
         offset_in_page = 0
 
     # the second returned variable is the next page - it is implemented for a future use of repolling
-    iocs, _ = find_indicators_to_limit_loop(indicator_query, limit, next_page=next_page,
+    iocs, _ = find_indicators_to_limit_loop(indicator_query, limit + offset_in_page, next_page=next_page,
                                             panos_compatible=panos_compatible,
                                             url_port_stripping=url_port_stripping)
 
@@ -161,7 +261,7 @@ def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetche
                                   next_page: int = 0, last_found_len: int = PAGE_SIZE,
                                   panos_compatible: bool = True, url_port_stripping: bool = False):
     """
-    Finds indicators using while loop with demisto.searchIndicators, and returns result and last page
+    Finds indicators using demisto.searchIndicators page by page, and returns result and last page
 
     Parameters:
         indicator_query (str): Query that determines which indicators to include in
@@ -176,105 +276,14 @@ def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetche
     Returns:
         (tuple): The iocs and the last page
     """
-    iocs: List[dict] = []
     if not last_found_len:
         last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        formatted_iocs = []
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs', [])
-        if panos_compatible or url_port_stripping:
-            for ioc in fetched_iocs:
-                ioc_value = ioc.get('value', '')
-                if url_port_stripping:
-                    ioc_value = _PORT_RE.sub(_URL_WITHOUT_PORT, ioc_value)
-                if panos_compatible:
-                    # protocol stripping
-                    ioc_value = _PROTOCOL_RE.sub('', ioc_value)
-                    # mix of text and wildcard in domain field handling
-                    ioc_value = _INVALID_TOKEN_RE.sub('*', ioc_value)
-                    # for PAN-OS *.domain.com does not match domain.com
-                    # we should provide both
-                    # this could generate more than num entries according to PAGE_SIZE
-                    if ioc_value.startswith('*.'):
-                        ioc_object_copy = deepcopy(ioc)
-                        ioc_object_copy['value'] = ioc_value.lstrip('*.')
-                        formatted_iocs.append(ioc_object_copy)
-                ioc['value'] = ioc_value
-                formatted_iocs.append(ioc)
-            iocs.extend(formatted_iocs)
-        else:
-            iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs, next_page
-
-
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges.
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of Ranges.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
-
-    return ip_ranges
+    if last_found_len != PAGE_SIZE or not limit or total_fetched >= limit:
+        return [], next_page
+    searcher = IndicatorsSearcher(query=indicator_query, page=next_page, page_size=PAGE_SIZE,
+                                  limit=limit - total_fetched, fields=INDICATOR_FIELDS)
+    iocs = list(format_indicators(searcher, panos_compatible, url_port_stripping))
+    return iocs, searcher.page
 
 
 def ips_to_ranges(ips: list, collapse_ips):
@@ -287,30 +296,11 @@ def ips_to_ranges(ips: list, collapse_ips):
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
     if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
+        return collapse_ips_to_ranges(ips)
 
     else:
-        return ip_groups_to_cidrs(ips_range_groups)
+        return collapse_ips_to_cidrs(ips)
 
 
 def create_values_for_returned_dict(iocs: list, collapse_ips: str = DONT_COLLAPSE) -> Tuple[dict, int]:
@@ -325,10 +315,10 @@ def create_values_for_returned_dict(iocs: list, collapse_ips: str = DONT_COLLAPS
         type = ioc.get('indicator_type')
         if value:
             if collapse_ips != DONT_COLLAPSE and type == 'IP':
-                ipv4_formatted_indicators.append(IPAddress(value))
+                ipv4_formatted_indicators.append(value)
 
             elif collapse_ips != DONT_COLLAPSE and type == 'IPv6':
-                ipv6_formatted_indicators.append(IPAddress(value))
+                ipv6_formatted_indicators.append(value)
 
             else:
                 formatted_indicators.append(value)
@@ -344,39 +334,83 @@ def create_values_for_returned_dict(iocs: list, collapse_ips: str = DONT_COLLAPS
     return {EDL_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
-def get_edl_ioc_values(on_demand, limit, indicator_query='', last_run=None, cache_refresh_rate=None,
-                       collapse_ips: str = DONT_COLLAPSE, panos_compatible: bool = True,
-                       url_port_stripping: bool = False) -> str:
+def refresh_edl_snapshot(params: dict) -> EDLSnapshot:
     """
-    Get the ioc list to return in the edl
+    Refreshes the EDL values and replaces the served snapshot with them
+
+    Parameters:
+        params (dict): The integration parameters
+
+    Returns:
+        EDLSnapshot: The new snapshot
     """
-    # on_demand ignores cache
-    if on_demand:
-        values_str = get_ioc_values_str_from_context()
-    else:
-        if last_run:
-            cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
-            if last_run <= cache_time:
-                values_str = refresh_edl_context(indicator_query, limit=limit,
-                                                 panos_compatible=panos_compatible,
-                                                 url_port_stripping=url_port_stripping,
-                                                 collapse_ips=collapse_ips)
-            else:
-                values_str = get_ioc_values_str_from_context()
-        else:
-            values_str = refresh_edl_context(indicator_query, limit=limit,
-                                             panos_compatible=panos_compatible,
-                                             url_port_stripping=url_port_stripping,
-                                             collapse_ips=collapse_ips)
-    return values_str
+    values = refresh_edl_context(params.get('indicators_query'),
+                                 limit=try_parse_integer(params.get('edl_size'), EDL_LIMIT_ERR_MSG),
+                                 panos_compatible=params.get('panos_compatible', False),
+                                 url_port_stripping=params.get('url_port_stripping', False),
+                                 collapse_ips=params.get('collapse_ips'))
+    return EDL_CACHE.update(values, demisto.getIntegrationContext().get('last_run'))
+
+
+def get_edl_snapshot(params: dict) -> EDLSnapshot:
+    """
+    Returns the snapshot to serve. The snapshot is refreshed in the background by refresh_edl_loop,
+    so a request waits for a refresh only if no values were ever created.
 
+    Parameters:
+        params (dict): The integration parameters
 
-def get_ioc_values_str_from_context() -> str:
+    Returns:
+        EDLSnapshot: The snapshot to serve
     """
-    Extracts output values from cache
+    if params.get('on_demand'):
+        # on_demand values are updated by the edl-update command, so the integration context is checked for them
+        integration_context = demisto.getIntegrationContext()
+        return EDL_CACHE.update(integration_context.get(EDL_VALUES_KEY, ''), integration_context.get('last_run'))
+
+    if not EDL_CACHE.snapshot:
+        with EDL_CACHE.lock:
+            # the snapshot may have been built while waiting for the lock
+            if not EDL_CACHE.snapshot:
+                integration_context = demisto.getIntegrationContext()
+                last_run = integration_context.get('last_run')
+                if not last_run:
+                    return refresh_edl_snapshot(params)
+                return EDL_CACHE.update(integration_context.get(EDL_VALUES_KEY, ''), last_run)
+    return EDL_CACHE.snapshot
+
+
+def refresh_edl_if_stale(params: dict) -> float:
     """
-    cache_dict = demisto.getIntegrationContext()
-    return cache_dict.get(EDL_VALUES_KEY, '')
+    Refreshes the EDL snapshot if it is older than the refresh rate
+
+    Parameters:
+        params (dict): The integration parameters
+
+    Returns:
+        float: The amount of seconds until the snapshot should be refreshed again
+    """
+    cache_time, _ = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+    snapshot = get_edl_snapshot(params)
+    if not snapshot.last_run or snapshot.last_run <= cache_time:
+        snapshot = refresh_edl_snapshot(params)
+    return max((snapshot.last_run - cache_time) / 1000, 1)
+
+
+def refresh_edl_loop(params: dict):
+    """
+    Refreshes the EDL in the background. If a refresh fails, the clients keep getting the last good snapshot.
+
+    Parameters:
+        params (dict): The integration parameters
+    """
+    while True:
+        try:
+            seconds_to_next_refresh = refresh_edl_if_stale(params)
+        except Exception as e:
+            demisto.error(f'Failed to refresh the EDL: {str(e)}')
+            seconds_to_next_refresh = REFRESH_RETRY_INTERVAL
+        gevent.sleep(seconds_to_next_refresh)
 
 
 def try_parse_integer(int_to_parse: Any, err_msg: str) -> int:
@@ -431,20 +465,20 @@ def route_edl_values() -> Response:
             err_msg: str = 'Basic authentication failed. Make sure you are using the right credentials.'
             demisto.debug(err_msg)
             return Response(err_msg, status=401)
-    panos_compatible: bool = params.get('panos_compatible', False)
-    url_port_stripping: bool = params.get('url_port_stripping', False)
-
-    values = get_edl_ioc_values(
-        on_demand=params.get('on_demand'),
-        limit=try_parse_integer(params.get('edl_size'), EDL_LIMIT_ERR_MSG),
-        last_run=demisto.getIntegrationContext().get('last_run'),
-        indicator_query=params.get('indicators_query'),
-        cache_refresh_rate=params.get('cache_refresh_rate'),
-        panos_compatible=panos_compatible,
-        url_port_stripping=url_port_stripping,
-        collapse_ips=params.get('collapse_ips')
-    )
-    return Response(values, status=200, mimetype='text/plain')
+
+    snapshot = get_edl_snapshot(params)
+    # the quality values are taken into account, so 'gzip;q=0' means the client does not accept gzip
+    use_gzip = request.accept_encodings['gzip'] > 0
+    # the compressed values are a different representation, so they get a different entity tag
+    etag = f'{snapshot.etag}-gzip' if use_gzip else snapshot.etag
+    headers = {'ETag': f'"{etag}"', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return Response(snapshot.gzip_values, status=200, mimetype='text/plain', headers=headers)
+    return Response(snapshot.values, status=200, mimetype='text/plain', headers=headers)
 
 
 ''' COMMAND FUNCTIONS '''
@@ -518,6 +552,8 @@ def run_long_running(params, is_test=False):
             demisto.debug('Starting HTTP Server')
 
         server = WSGIServer(('0.0.0.0', port), APP, **ssl_args, log=DEMISTO_LOGGER)
+        if not is_test and not params.get('on_demand'):
+            gevent.spawn(refresh_edl_loop, params)
         if is_test:
             server_process = Process(target=server.serve_forever)
             server_process.start()
@@ -589,5 +625,7 @@ def main():
         return_error(err_msg)
 
 
+from IPCollapseApiModule import *  # noqa: E402
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
@@ -11,57 +11,115 @@ IOC_RES_LEN = 38
 
 @pytest.mark.helper_commands
 class TestHelperFunctions:
-    @pytest.mark.get_edl_ioc_values
-    def test_get_edl_ioc_values_1(self, mocker):
+    @pytest.mark.get_edl_snapshot
+    def test_get_edl_snapshot_1(self, mocker):
         """Test on_demand"""
-        from EDL import get_edl_ioc_values
-        with open('EDL_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value=iocs_text_dict)
-            ioc_list = get_edl_ioc_values(
-                on_demand=True,
-                limit=50
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
-
-    @pytest.mark.get_edl_ioc_values
-    def test_get_edl_ioc_values_2(self, mocker):
-        """Test update by not on_demand with no refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383899, 1578383899))
         import EDL as edl
-        with open('EDL_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value=iocs_text_dict)
-            mocker.patch.object(edl, 'refresh_edl_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            ioc_list = edl.get_edl_ioc_values(
-                on_demand=False,
-                limit=50,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
-
-    @pytest.mark.get_edl_ioc_values
-    def test_get_edl_ioc_values_3(self, mocker):
-        """Test update by not on_demand with refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(demisto, 'getIntegrationContext',
+                            return_value={edl.EDL_VALUES_KEY: '1.1.1.1', 'last_run': 1578383898000})
+        refresh = mocker.patch.object(edl, 'refresh_edl_context')
+        assert edl.get_edl_snapshot({'on_demand': True}).values == '1.1.1.1'
+
+        # the edl-update command updated the values
+        demisto.getIntegrationContext.return_value = {edl.EDL_VALUES_KEY: '2.2.2.2', 'last_run': 1578383899000}
+        assert edl.get_edl_snapshot({'on_demand': True}).values == '2.2.2.2'
+        assert not refresh.called
+
+    @pytest.mark.get_edl_snapshot
+    def test_get_edl_snapshot_2(self, mocker):
+        """Test not on_demand serves the last snapshot without refreshing it, even if it is stale"""
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383899000, 1578383899000))
+        mocker.patch.object(demisto, 'getIntegrationContext',
+                            return_value={edl.EDL_VALUES_KEY: '1.1.1.1', 'last_run': 1578383898000})
+        refresh = mocker.patch.object(edl, 'refresh_edl_context')
+        params = {'cache_refresh_rate': '1 minute', 'edl_size': 50}
+        assert edl.get_edl_snapshot(params).values == '1.1.1.1'
+        assert edl.get_edl_snapshot(params).values == '1.1.1.1'
+        assert demisto.getIntegrationContext.call_count == 1
+        assert not refresh.called
+
+    @pytest.mark.get_edl_snapshot
+    def test_get_edl_snapshot_3(self, mocker):
+        """Test not on_demand waits for a refresh only if no values were ever created"""
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
+        mocker.patch.object(edl, 'refresh_edl_context', return_value='1.1.1.1')
+        assert edl.get_edl_snapshot({'cache_refresh_rate': '1 minute', 'edl_size': 50}).values == '1.1.1.1'
+
+    @pytest.mark.get_edl_snapshot
+    def test_get_edl_snapshot_4(self, mocker):
+        """Test not on_demand builds the first snapshot once, when it is requested while it is being built"""
+        import gevent
         import EDL as edl
-        with open('EDL_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value=iocs_text_dict)
-            mocker.patch.object(edl, 'refresh_edl_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            ioc_list = edl.get_edl_ioc_values(
-                on_demand=False,
-                limit=50,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
+
+        def refresh_edl_context(*args, **kwargs):
+            gevent.sleep(0.01)
+            return '1.1.1.1'
+
+        refresh = mocker.patch.object(edl, 'refresh_edl_context', side_effect=refresh_edl_context)
+        params = {'cache_refresh_rate': '1 minute', 'edl_size': 50}
+        greenlets = [gevent.spawn(edl.get_edl_snapshot, params) for _ in range(2)]
+        gevent.joinall(greenlets)
+        assert [greenlet.value.values for greenlet in greenlets] == ['1.1.1.1', '1.1.1.1']
+        assert refresh.call_count == 1
+
+    @pytest.mark.refresh_edl_if_stale
+    def test_refresh_edl_if_stale(self, mocker):
+        """Test the background refresh replaces the snapshot only when it is stale"""
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(demisto, 'getIntegrationContext',
+                            return_value={edl.EDL_VALUES_KEY: '1.1.1.1', 'last_run': 1578383898000})
+        refresh = mocker.patch.object(edl, 'refresh_edl_context', return_value='2.2.2.2')
+        params = {'cache_refresh_rate': '1 minute', 'edl_size': 50}
+
+        # the snapshot was created 30 seconds after the cache time
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383868000, 1578383928000))
+        assert edl.refresh_edl_if_stale(params) == 30
+        assert not refresh.called
+
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383898000, 1578383958000))
+        demisto.getIntegrationContext.return_value = {edl.EDL_VALUES_KEY: '2.2.2.2', 'last_run': 1578383958000}
+        assert edl.refresh_edl_if_stale(params) == 60
+        assert refresh.call_count == 1
+        assert edl.EDL_CACHE.snapshot.values == '2.2.2.2'
+
+    @pytest.mark.route_edl_values
+    def test_route_edl_values_etag_and_gzip(self, mocker):
+        """Test the values are served with an ETag, compressed on request, and not sent again when unchanged"""
+        import gzip
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_CACHE', edl.EDLCache())
+        mocker.patch.object(demisto, 'params', return_value={'on_demand': True})
+        mocker.patch.object(demisto, 'getIntegrationContext',
+                            return_value={edl.EDL_VALUES_KEY: '1.1.1.1\n2.2.2.2', 'last_run': 1578383898000})
+        client = edl.APP.test_client()
+
+        response = client.get('/')
+        assert response.status_code == 200
+        assert response.data == b'1.1.1.1\n2.2.2.2'
+        etag = response.headers['ETag']
+        assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+        response = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == b'1.1.1.1\n2.2.2.2'
+        assert response.headers['ETag'] != etag
+
+        response = client.get('/', headers={'Accept-Encoding': 'gzip;q=0, deflate'})
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == b'1.1.1.1\n2.2.2.2'
+
+        demisto.getIntegrationContext.return_value = {edl.EDL_VALUES_KEY: '3.3.3.3', 'last_run': 1578383899000}
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.data == b'3.3.3.3'
 
     @pytest.mark.list_to_str
     def test_list_to_str_1(self):
@@ -122,12 +180,28 @@ class TestHelperFunctions:
         import EDL as edl
         with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(edl, 'find_indicators_to_limit', return_value=iocs_json)
-            edl_vals = edl.refresh_edl_context(indicator_query='')
+            mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            edl_vals = edl.refresh_edl_context(indicator_query='', limit=len(iocs_json), panos_compatible=False,
+                                               url_port_stripping=False)
             for ioc in iocs_json:
                 ip = ioc.get('value')
                 assert ip in edl_vals
 
+    @pytest.mark.refresh_edl_context
+    def test_refresh_edl_context_collapse_continues_search(self, mocker):
+        """Test collapsing IPs continues the same search instead of re-polling from the first page"""
+        import EDL as edl
+        pages = [
+            {'iocs': [{'value': '1.1.1.{}'.format(i), 'indicator_type': 'IP'} for i in range(1, 4)]},
+            {'iocs': [{'value': 'demisto.com', 'indicator_type': 'Domain'}]},
+            {'iocs': []},
+        ]
+        search = mocker.patch.object(demisto, 'searchIndicators', side_effect=pages)
+        mocker.patch.object(edl, 'PAGE_SIZE', 3)
+        edl_vals = edl.refresh_edl_context(indicator_query='', limit=3, collapse_ips=edl.COLLAPSE_TO_RANGES)
+        assert edl_vals == 'demisto.com\n1.1.1.1-1.1.1.3'
+        assert [call[1]['page'] for call in search.call_args_list] == [0, 1]
+
     @pytest.mark.find_indicators_to_limit
     def test_find_indicators_to_limit_1(self, mocker):
         """Test find indicators limit"""
@@ -4,15 +4,16 @@ from CommonServerUserPython import *
 
 import re
 import json
+import mmap
 import traceback
+from array import array
 from base64 import b64decode
 from multiprocessing import Process
 from gevent.pywsgi import WSGIServer
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp, mkstemp
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
-from typing import Callable, List, Any, cast, Dict, Tuple
+from typing import Callable, Iterable, List, Any, Optional, cast, Dict, Tuple
 
 
 class Handler:
@@ -101,38 +102,12 @@ class RequestArguments:
             if len(category_attribute_list) != 1 or '' not in category_attribute_list:
                 self.category_attribute = category_attribute_list
 
-    def is_request_change(self, last_update_data):
-        if self.limit != last_update_data.get('last_limit'):
-            return True
-
-        elif self.offset != last_update_data.get('last_offset'):
-            return True
-
-        elif self.out_format != last_update_data.get('last_format'):
-            return True
-
-        elif self.mwg_type != last_update_data.get('mwg_type'):
-            return True
-
-        elif self.drop_invalids != last_update_data.get('drop_invalids'):
-            return True
-
-        elif self.strip_port != last_update_data.get('strip_port'):
-            return True
-
-        elif self.category_default != last_update_data.get('category_default'):
-            return True
-
-        elif self.category_attribute != last_update_data.get('category_attribute'):
-            return True
-
-        elif self.collapse_ips != last_update_data.get('collapse_ips'):
-            return True
-
-        elif self.csv_text != last_update_data.get('csv_text'):
-            return True
-
-        return False
+    def render_key(self) -> tuple:
+        """
+        The arguments that affect the rendering of the output - requests with the same key share a rendered output
+        """
+        return (self.out_format, self.mwg_type, self.strip_port, self.drop_invalids, self.category_default,
+                tuple(self.category_attribute), self.collapse_ips)
 
 
 ''' HELPER FUNCTIONS '''
@@ -185,8 +160,8 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
 
     # re-polling in case formatting or ip collapse caused a lack in results
     while actual_indicator_amount < request_args.limit:
-        # from where to start the new poll and how many results should be fetched
-        new_offset = len(iocs) + request_args.offset + actual_indicator_amount - 1
+        # continue the poll right after the fetched indicators, for the missing amount of results
+        new_offset = request_args.offset + len(iocs)
         new_limit = request_args.limit - actual_indicator_amount
 
         # poll additional indicators into list from demisto
@@ -205,21 +180,7 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
         if request_args.out_format == FORMAT_CSV:
             actual_indicator_amount = actual_indicator_amount - 1
 
-    if request_args.out_format == FORMAT_JSON:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON
-
-    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
-        if request_args.csv_text:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
-
-        else:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_CSV
-
-    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON_SEQ
-
-    else:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
+    out_dict[CTX_MIMETYPE_KEY] = get_format_mimetype(request_args)
 
     demisto.setIntegrationContext({
         "last_output": out_dict,
@@ -240,6 +201,22 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
     return out_dict[CTX_VALUES_KEY]
 
 
+def get_format_mimetype(request_args: RequestArguments) -> str:
+    """
+    Returns the mimetype of the requested output format
+    """
+    if request_args.out_format == FORMAT_JSON:
+        return MIMETYPE_JSON
+
+    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
+        return MIMETYPE_TEXT if request_args.csv_text else MIMETYPE_CSV
+
+    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
+        return MIMETYPE_JSON_SEQ
+
+    return MIMETYPE_TEXT
+
+
 def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) -> list:
     """
     Finds indicators using demisto.searchIndicators
@@ -255,7 +232,7 @@ def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) ->
         next_page = 0
         offset_in_page = 0
 
-    iocs, _ = find_indicators_with_limit_loop(indicator_query, limit, next_page=next_page)
+    iocs, _ = find_indicators_with_limit_loop(indicator_query, limit + offset_in_page, next_page=next_page)
 
     # if offset in page is bigger than the amount of results returned return empty list
     if len(iocs) <= offset_in_page:
@@ -267,85 +244,16 @@ def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) ->
 def find_indicators_with_limit_loop(indicator_query: str, limit: int, total_fetched: int = 0, next_page: int = 0,
                                     last_found_len: int = PAGE_SIZE):
     """
-    Finds indicators using while loop with demisto.searchIndicators, and returns result and last page
+    Finds indicators using demisto.searchIndicators page by page, and returns result and last page
     """
-    iocs: List[dict] = []
     if not last_found_len:
         last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs, next_page
-
-
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of Ranges.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
-
-    return ip_ranges
+    if last_found_len != PAGE_SIZE or not limit or total_fetched >= limit:
+        return [], next_page
+    searcher = IndicatorsSearcher(query=indicator_query, page=next_page, page_size=PAGE_SIZE,
+                                  limit=limit - total_fetched)
+    iocs = list(searcher)
+    return iocs, searcher.page
 
 
 def ips_to_ranges(ips: list, collapse_ips):
@@ -358,36 +266,11 @@ def ips_to_ranges(ips: list, collapse_ips):
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            if len(ips_range_groups) == 0:
-                ips_range_groups.append([ip])
-                continue
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
-    for group in ips_range_groups:
-        sorted(group)
-
     if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
+        return collapse_ips_to_ranges(ips)
 
     else:
-        return ip_groups_to_cidrs(ips_range_groups)
+        return collapse_ips_to_cidrs(ips)
 
 
 def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
@@ -465,11 +348,11 @@ def add_indicator_to_category(indicator, category, category_dict):
     return category_dict
 
 
-def create_proxysg_out_format(iocs: list, category_attribute: list, category_default='bc_category'):
-    formatted_indicators = ''
+def get_proxysg_categories(iocs: list, category_attribute: list, category_default='bc_category') -> dict:
+    """
+    Groups the URL and Domain indicators by their ProxySG category
+    """
     category_dict = {}  # type:Dict
-    num_of_returned_indicators = 0
-
     for indicator in iocs:
         if indicator.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
             indicator_proxysg_category = indicator.get('proxysgcategory')
@@ -484,6 +367,14 @@ def create_proxysg_out_format(iocs: list, category_attribute: list, category_def
                 # if ProxySG Category is not set or does not exist in the category_attribute list
                 category_dict = add_indicator_to_category(indicator.get('value'), category_default, category_dict)
 
+    return category_dict
+
+
+def create_proxysg_out_format(iocs: list, category_attribute: list, category_default='bc_category'):
+    formatted_indicators = ''
+    num_of_returned_indicators = 0
+    category_dict = get_proxysg_categories(iocs, category_attribute, category_default)
+
     for category, indicator_list in category_dict.items():
         sub_output_string = f"define category {category}\n"
         sub_output_string += list_to_str(indicator_list, '\n')
@@ -558,10 +449,10 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
             if value:
                 if request_args.out_format in [FORMAT_TEXT, FORMAT_CSV]:
                     if type == 'IP' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv4_formatted_indicators.append(IPAddress(value))
+                        ipv4_formatted_indicators.append(value)
 
                     elif type == 'IPv6' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv6_formatted_indicators.append(IPAddress(value))
+                        ipv6_formatted_indicators.append(value)
 
                     else:
                         formatted_indicators.append(value)
@@ -589,61 +480,231 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
-def get_outbound_mimetype() -> str:
+class RenderedOutput:
+    """
+    An output format rendered once for an indicators snapshot.
+    Each entry of the output (e.g. a line of a text list) is written to a file, and requests are served by slicing
+    a memory map of the file with a line-offset index, instead of formatting the indicators again.
+
+    :type path: ``str``
+    :param path: The path of the file to write the entries to.
+
+    :type out_format: ``str``
+    :param out_format: The output format.
+
+    :type header: ``str``
+    :param header: A header to add before the entries of every slice (e.g. the CSV headers).
+
+    :type entries: ``Iterable[Tuple[str, str]]``
+    :param entries: The (group, entry) pairs of the output. The group is the ProxySG category, empty otherwise.
+    """
+
+    def __init__(self, path: str, out_format: str, header: str, entries: Iterable[Tuple[str, str]]):
+        self.path = path
+        self.out_format = out_format
+        self.header = header
+        self.offsets = array('Q', [0])
+        self.groups = []  # type: List[Tuple[int, str]]
+        with open(path, 'wb') as output_file:
+            for group, entry in entries:
+                if group and (not self.groups or self.groups[-1][1] != group):
+                    self.groups.append((len(self), group))
+                data = entry.encode('utf-8') + b'\n'
+                output_file.write(data)
+                self.offsets.append(self.offsets[-1] + len(data))
+        self._file = open(path, 'rb')
+        # an empty file cannot be memory mapped
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def read(self, start: int, end: int) -> str:
+        """
+        Returns the entries between the given indexes, separated by new lines
+        """
+        if not self._mmap or start >= end:
+            return ''
+        return self._mmap[self.offsets[start]:self.offsets[end] - 1].decode('utf-8')
+
+    def slice(self, offset: int, limit: int) -> str:
+        """
+        Returns the output of the entries in the requested window, in the same format they were rendered in
+        """
+        end = min(offset + limit, len(self))
+        if offset >= end:
+            return ''
+
+        if self.out_format in [FORMAT_JSON, FORMAT_XSOAR_JSON]:
+            # json entries never contain a raw new line, so it is safe to replace the separators
+            return '[' + self.read(offset, end).replace('\n', ', ') + ']'
+
+        if self.out_format == FORMAT_PROXYSG:
+            formatted_indicators = ''
+            for i, (group_start, category) in enumerate(self.groups):
+                group_end = self.groups[i + 1][0] if i + 1 < len(self.groups) else len(self)
+                group_start, group_end = max(group_start, offset), min(group_end, end)
+                if group_start < group_end:
+                    formatted_indicators += f"define category {category}\n{self.read(group_start, group_end)}\nend\n"
+            return formatted_indicators
+
+        return self.header + self.read(offset, end)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+        os.remove(self.path)
+
+
+def create_output_entries(iocs: list, request_args: RequestArguments) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Formats the indicators in the requested format, and splits the result to a header and (group, entry) pairs
+    """
+    # formatting json pops the value of the indicators, so the snapshot is not changed
+    iocs = [dict(ioc) for ioc in iocs]
+    if request_args.out_format == FORMAT_JSON:
+        return '', [('', json.dumps(json_format_single_indicator(ioc))) for ioc in iocs]
+
+    if request_args.out_format == FORMAT_XSOAR_JSON:
+        return '', [('', json.dumps(ioc)) for ioc in iocs]
+
+    if request_args.out_format == FORMAT_PROXYSG:
+        category_dict = get_proxysg_categories(iocs, request_args.category_attribute, request_args.category_default)
+        if not category_dict:
+            raise Exception(CTX_NO_URLS_IN_PROXYSG_FORMAT)
+        return '', [(category, value) for category, values in category_dict.items() for value in values]
+
+    out_dict, _ = create_values_for_returned_dict(iocs, request_args)
+    lines = out_dict[CTX_VALUES_KEY].split('\n') if out_dict[CTX_VALUES_KEY] else []
+    header = ''
+    if lines and request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV, FORMAT_MWG]:
+        header = lines.pop(0) + '\n'
+    return header, [('', line) for line in lines]
+
+
+class OutputStore:
+    """
+    Holds the current indicators snapshot, and the outputs rendered from it.
+    Every output format is rendered once per snapshot, and requests with a different limit or offset are served
+    by slicing the rendered output, so neither formatting nor the integration context are involved per request.
+    """
+
+    def __init__(self):
+        self.directory = ''
+        self.snapshot_id = None  # type: Any
+        self.query = None  # type: Optional[str]
+        self.iocs = []  # type: List[dict]
+        self.exhausted = False
+        self.outputs = {}  # type: Dict[tuple, RenderedOutput]
+
+    def clear_outputs(self):
+        for output in self.outputs.values():
+            output.close()
+        self.outputs = {}
+
+    def reset(self, snapshot_id: Any, query: Optional[str], iocs: List[dict], exhausted: bool):
+        """
+        Replaces the indicators snapshot and drops the outputs rendered from the previous one
+        """
+        self.clear_outputs()
+        self.snapshot_id = snapshot_id
+        self.query = query
+        self.iocs = iocs
+        self.exhausted = exhausted
+
+    def fetch(self, query: str, size: int):
+        """
+        Replaces the indicators snapshot with the first indicators of the query
+        """
+        iocs = find_indicators_with_limit(query, size, 0)
+        self.reset(date_to_timestamp(datetime.now()), query, iocs, len(iocs) < size)
+
+    def extend(self, size: int):
+        """
+        Adds the next indicators of the query to the snapshot
+        """
+        iocs = find_indicators_with_limit(cast(str, self.query), size, len(self.iocs))
+        self.clear_outputs()
+        self.iocs.extend(iocs)
+        self.exhausted = len(iocs) < size
+
+    def is_expired(self, query: str, cache_refresh_rate: str) -> bool:
+        if self.snapshot_id is None or query != self.query:
+            return True
+        cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+        return self.snapshot_id <= cache_time
+
+    def get_output(self, request_args: RequestArguments) -> RenderedOutput:
+        """
+        Returns the output rendered for the request arguments, and renders it if this is the first request for it
+        """
+        key = request_args.render_key()
+        if key not in self.outputs:
+            if not self.directory:
+                self.directory = mkdtemp(prefix='export_iocs_')
+            file_descriptor, path = mkstemp(dir=self.directory)
+            os.close(file_descriptor)
+            header, entries = create_output_entries(self.iocs, request_args)
+            self.outputs[key] = RenderedOutput(path, request_args.out_format, header, entries)
+        return self.outputs[key]
+
+    def get_values(self, request_args: RequestArguments) -> str:
+        """
+        Returns the requested window of the output. If formatting or ip collapsing left less entries than requested,
+        the next indicators of the query are added to the snapshot, as long as there are any.
+        """
+        requested_size = request_args.offset + request_args.limit
+        output = self.get_output(request_args)
+        while len(output) < requested_size and not self.exhausted:
+            self.extend(max(requested_size - len(output), len(self.iocs)))
+            output = self.get_output(request_args)
+        return output.slice(request_args.offset, request_args.limit)
+
+
+OUTPUT_STORE = OutputStore()
+
+
+def get_outbound_mimetype(request_args: Optional[RequestArguments] = None) -> str:
     """Returns the mimetype of the export_iocs"""
+    if request_args:
+        return get_format_mimetype(request_args)
     ctx = demisto.getIntegrationContext().get('last_output', {})
     return ctx.get(CTX_MIMETYPE_KEY, 'text/plain')
 
 
 def get_outbound_ioc_values(on_demand, request_args: RequestArguments,
-                            last_update_data={}, cache_refresh_rate=None) -> str:
+                            last_update_data: Optional[dict] = None, cache_refresh_rate=None) -> str:
     """
-    Get the ioc list to return in the list
+    Get the ioc list to return in the list.
+    In on_demand mode, last_update_data is the integration context, which is read if not given.
     """
-    last_update = last_update_data.get('last_run')
-    last_query = last_update_data.get('last_query')
-    current_iocs = last_update_data.get('current_iocs')
-
     # on_demand ignores cache
     if on_demand:
-        if request_args.is_request_change(last_update_data):
-            values_str = get_ioc_values_str_from_context(request_args=request_args, iocs=current_iocs)
+        if last_update_data is None:
+            last_update_data = demisto.getIntegrationContext()
+        last_update = last_update_data.get('last_run')
+        if not last_update:
+            return get_ioc_values_str_from_context(last_update_data)
 
-        else:
-            values_str = get_ioc_values_str_from_context(request_args=request_args)
+        if OUTPUT_STORE.snapshot_id != last_update:
+            # the list was updated by the eis-update command
+            OUTPUT_STORE.reset(last_update, last_update_data.get('last_query'),
+                               last_update_data.get('current_iocs') or [], exhausted=True)
 
-    else:
-        if last_update:
-            # takes the cache_refresh_rate amount of time back since run time.
-            cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
-            if last_update <= cache_time or request_args.is_request_change(last_update_data) or \
-                    request_args.query != last_query:
-                values_str = refresh_outbound_context(request_args=request_args)
-            else:
-                values_str = get_ioc_values_str_from_context(request_args=request_args)
-        else:
-            values_str = refresh_outbound_context(request_args)
+    elif OUTPUT_STORE.is_expired(request_args.query, cache_refresh_rate):
+        OUTPUT_STORE.fetch(request_args.query, request_args.offset + request_args.limit)
 
-    return values_str
+    return OUTPUT_STORE.get_values(request_args)
 
 
-def get_ioc_values_str_from_context(request_args: RequestArguments, iocs=None) -> str:
+def get_ioc_values_str_from_context(integration_context: Optional[dict] = None) -> str:
     """
-    Extracts output values from cache
+    Extracts output values from cache, reading the integration context if not given
     """
-    if iocs:
-        if request_args.offset > len(iocs):
-            return ''
-
-        iocs = iocs[request_args.offset: request_args.limit + request_args.offset]
-        returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
-        current_cache = demisto.getIntegrationContext()
-        current_cache['last_output'] = returned_dict
-        demisto.setIntegrationContext(current_cache)
-
-    else:
-        returned_dict = demisto.getIntegrationContext().get('last_output', {})
-
+    if integration_context is None:
+        integration_context = demisto.getIntegrationContext()
+    returned_dict = integration_context.get('last_output', {})
     return returned_dict.get(CTX_VALUES_KEY, '')
 
 
@@ -776,21 +837,24 @@ def route_list_values() -> Response:
 
         request_args = get_request_args(params)
 
+        # the integration context is read only in on-demand mode, where the list is updated by the eis-update command
+        on_demand = params.get('on_demand')
+        integration_context = demisto.getIntegrationContext() if on_demand else {}
         values = get_outbound_ioc_values(
-            on_demand=params.get('on_demand'),
-            last_update_data=demisto.getIntegrationContext(),
+            on_demand=on_demand,
+            last_update_data=integration_context,
             cache_refresh_rate=params.get('cache_refresh_rate'),
             request_args=request_args
         )
 
-        if not demisto.getIntegrationContext() and params.get('on_demand'):
+        if on_demand and not integration_context:
             values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
                      'export process'
 
         elif not values:
             values = "No Results Found For the Query"
 
-        mimetype = get_outbound_mimetype()
+        mimetype = get_outbound_mimetype(request_args)
         return Response(values, status=200, mimetype=mimetype)
 
     except Exception:
@@ -961,5 +1025,7 @@ def main():
         return_error(err_msg)
 
 
+from IPCollapseApiModule import *  # noqa: E402
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
@@ -30,111 +30,161 @@ class TestHelperFunctions:
     @pytest.mark.get_outbound_ioc_values
     def test_get_outbound_ioc_values_2(self, mocker):
         """Test update by not on_demand with no refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383899, 1578383899))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+            first_ioc_list = ei.get_outbound_ioc_values(on_demand=False, request_args=request_args,
+                                                        cache_refresh_rate='1 minute')
+            ioc_list = ei.get_outbound_ioc_values(on_demand=False, request_args=request_args,
+                                                  cache_refresh_rate='1 minute')
+            assert find_indicators.call_count == 1
+            assert ioc_list == first_ioc_list == '\n'.join(ioc['value'] for ioc in iocs_json)
 
     @pytest.mark.get_outbound_ioc_values
     def test_get_outbound_ioc_values_3(self, mocker):
         """Test update by not on_demand with refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+            ei.get_outbound_ioc_values(on_demand=False, request_args=request_args, cache_refresh_rate='1 minute')
+            # the cache time is after the last refresh
+            mocker.patch.object(ei, 'parse_date_range', return_value=(ei.OUTPUT_STORE.snapshot_id + 1, 0))
+            find_indicators.return_value = iocs_json[:2]
+            ioc_list = ei.get_outbound_ioc_values(on_demand=False, request_args=request_args,
+                                                  cache_refresh_rate='1 minute')
+            assert find_indicators.call_count == 2
+            assert ioc_list == f"{iocs_json[0]['value']}\n{iocs_json[1]['value']}"
 
     @pytest.mark.get_outbound_ioc_values
     def test_get_outbound_ioc_values_4(self, mocker):
         """Test update by request params change - limit"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 1, "last_offset": 0,
-                                                                                "last_query": "type:ip",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            create_values = mocker.spy(ei, 'create_values_for_returned_dict')
+            ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                       request_args=ei.RequestArguments(query='type:ip', limit=50))
+            ioc_list = ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                                  request_args=ei.RequestArguments(query='type:ip', limit=3))
+            assert find_indicators.call_count == 1
+            assert create_values.call_count == 1
+            assert ioc_list.split('\n') == [ioc['value'] for ioc in iocs_json[:3]]
 
     @pytest.mark.get_outbound_ioc_values
     def test_get_outbound_ioc_values_5(self, mocker):
         """Test update by request params change - offset"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 50, "last_offset": 1,
-                                                                                "last_query": "type:ip",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            create_values = mocker.spy(ei, 'create_values_for_returned_dict')
+            ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                       request_args=ei.RequestArguments(query='type:ip', out_format='csv', limit=50))
+            ioc_list = ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                                  request_args=ei.RequestArguments(query='type:ip', out_format='csv',
+                                                                                   limit=2, offset=36))
+            assert find_indicators.call_count == 1
+            assert create_values.call_count == 1
+            assert ioc_list == f"indicator\n{iocs_json[36]['value']}\n{iocs_json[37]['value']}"
+            assert ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                              request_args=ei.RequestArguments(query='type:ip', out_format='csv',
+                                                                               limit=2, offset=38)) == ''
 
     @pytest.mark.get_outbound_ioc_values
     def test_get_outbound_ioc_values_6(self, mocker):
         """Test update by request params change - query"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 50, "last_offset": 0,
-                                                                                "last_query": "type:URL",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                       request_args=ei.RequestArguments(query='type:URL', limit=50))
+            ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                       request_args=ei.RequestArguments(query='type:ip', limit=50))
+            assert find_indicators.call_count == 2
+            assert find_indicators.call_args[0] == ('type:ip', 50, 0)
+
+    @pytest.mark.get_outbound_ioc_values
+    def test_get_outbound_ioc_values_on_demand_snapshot(self, mocker):
+        """Test on_demand serves the indicators of the last eis-update, in any format"""
+        import ExportIndicators as ei
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+            mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+            find_indicators = mocker.patch.object(ei, 'find_indicators_with_limit')
+            last_update_data = {'last_run': 1578383898000, 'last_query': 'type:ip', 'current_iocs': iocs_json}
+            ioc_list = ei.get_outbound_ioc_values(on_demand=True, last_update_data=last_update_data,
+                                                  request_args=ei.RequestArguments(query='type:ip',
+                                                                                   out_format='XSOAR json',
+                                                                                   limit=2, offset=1))
+            assert json.loads(ioc_list) == iocs_json[1:3]
+            assert ioc_list == json.dumps(iocs_json[1:3])
+            assert not find_indicators.called
+
+    @pytest.mark.get_outbound_ioc_values
+    def test_route_list_values_integration_context(self, mocker):
+        """Test the integration context is read once per request in on_demand mode, and not read otherwise"""
+        import ExportIndicators as ei
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+        mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+        mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+        mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+        get_integration_context = mocker.patch.object(demisto, 'getIntegrationContext', return_value={
+            'last_run': 1578383898000, 'last_query': 'type:ip', 'current_iocs': iocs_json})
+
+        params = {'format': 'text', 'list_size': '2', 'indicators_query': 'type:ip'}
+        mocker.patch.object(demisto, 'params', return_value=params)
+        response = ei.APP.test_client().get('/')
+        assert response.status_code == 200
+        assert not get_integration_context.called
+
+        mocker.patch.object(demisto, 'params', return_value=dict(params, on_demand=True))
+        response = ei.APP.test_client().get('/')
+        assert response.status_code == 200
+        assert get_integration_context.call_count == 1
+
+    @pytest.mark.get_outbound_ioc_values
+    def test_get_outbound_ioc_values_extend_snapshot(self, mocker):
+        """Test indicators are added to the snapshot when collapsing ips left less entries than requested"""
+        import ExportIndicators as ei
+        iocs = [{'value': f'1.1.1.{i}', 'indicator_type': 'IP'} for i in range(10)] + \
+               [{'value': f'2.2.2.{i}', 'indicator_type': 'IP'} for i in range(0, 20, 2)]
+
+        def find_indicators_with_limit(query, limit, offset):
+            return iocs[offset:offset + limit]
+
+        mocker.patch.object(ei, 'OUTPUT_STORE', ei.OutputStore())
+        mocker.patch.object(ei, 'find_indicators_with_limit', side_effect=find_indicators_with_limit)
+        ioc_list = ei.get_outbound_ioc_values(on_demand=False, cache_refresh_rate='1 minute',
+                                              request_args=ei.RequestArguments(query='', limit=4,
+                                                                               collapse_ips=ei.COLLAPSE_TO_RANGES))
+        assert ioc_list == '1.1.1.0-1.1.1.9\n2.2.2.0\n2.2.2.2\n2.2.2.4'
+
+    @pytest.mark.get_outbound_ioc_values
+    def test_rendered_output_proxysg_slice(self, tmp_path):
+        """Test slicing a ProxySG output keeps the category blocks of the entries in the window"""
+        from ExportIndicators import RenderedOutput, FORMAT_PROXYSG
+        entries = [('category1', 'a.com'), ('category1', 'b.com'), ('category2', 'c.com'), ('category2', 'd.com')]
+        output = RenderedOutput(str(tmp_path / 'proxysg'), FORMAT_PROXYSG, '', entries)
+        assert len(output) == 4
+        assert output.slice(1, 2) == 'define category category1\nb.com\nend\ndefine category category2\nc.com\nend\n'
+        assert output.slice(3, 10) == 'define category category2\nd.com\nend\n'
+        output.close()
 
     @pytest.mark.list_to_str
     def test_list_to_str_1(self):
@@ -323,8 +323,7 @@ def main():
         elif command == 'fetch-indicators':
             indicators, _ = fetch_indicators_command(client, feedTags)
 
-            for single_batch in batch(indicators, batch_size=2000):
-                demisto.createIndicators(single_batch)
+            create_indicators_in_batches(indicators)
 
         else:
             raise NotImplementedError(f'Command {command} is not implemented.')
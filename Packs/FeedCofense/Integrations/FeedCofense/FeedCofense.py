@@ -318,8 +318,7 @@ def main():
             begin_time, end_time = build_fetch_times(params.get("fetch_time", "3 days"))
             indicators = fetch_indicators_command(client, begin_time, end_time)
             # Send indicators to demisto
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            create_indicators_in_batches(indicators)
 
         elif demisto.command() == "cofense-get-indicators":
             # dummy command for testing
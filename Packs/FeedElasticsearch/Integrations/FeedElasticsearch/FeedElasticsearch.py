@@ -191,14 +191,12 @@ def fetch_indicators_command(client, feed_type, src_val, src_type, default_type,
             ioc_lst.extend(extract_indicators_from_generic_hit(hit, src_val, src_type, default_type))
 
     if ioc_lst:
-        for b in batch(ioc_lst, batch_size=2000):
-            demisto.createIndicators(b)
+        create_indicators_in_batches(ioc_lst)
     if ioc_enrch_lst:
         ioc_enrch_batches = create_enrichment_batches(ioc_enrch_lst)
         for enrch_batch in ioc_enrch_batches:
             # ensure batch sizes don't exceed 2000
-            for b in batch(enrch_batch, batch_size=2000):
-                demisto.createIndicators(b)
+            create_indicators_in_batches(enrch_batch)
     demisto.setLastRun({'time': now.timestamp() * 1000})
 
 
@@ -145,8 +145,7 @@ def main():
 
         elif demisto.command() == 'fetch-indicators':
             indicators = fetch_indicators(client, demisto.params())
-            for single_batch in batch(indicators, batch_size=2000):
-                demisto.createIndicators(single_batch)
+            create_indicators_in_batches(indicators)
 
     except Exception as e:
         return_error(f'Failed to execute {demisto.command()} command. Error: {str(e)}')
@@ -307,16 +307,11 @@ def search_command(client, args):
     sensitive = True if args.get('casesensitive') == 'True' else False
     return_list_md: List[Dict] = list()
     entries = list()
-    all_indicators = list()
-    page = 0
-    size = 1000
-    raw_data = demisto.searchIndicators(query=f'type:"{client.indicatorType}"', page=page, size=size)
-    while len(raw_data.get('iocs', [])) > 0:
-        all_indicators.extend(raw_data.get('iocs', []))
-        page += 1
-        raw_data = demisto.searchIndicators(query=f'type:"{client.indicatorType}"', page=page, size=size)
-
-    for indicator in all_indicators:
+    # nothing else calls demisto while the indicators are scanned, so the next page can be read ahead
+    indicators = IndicatorsSearcher(query=f'type:"{client.indicatorType}"', page_size=1000,
+                                    fields=['id', 'value', 'CustomFields'], prefetch=True)
+
+    for indicator in indicators:
         custom_fields = indicator.get('CustomFields', {})
         for v in custom_fields.values():
             if type(v) != str:
@@ -356,17 +351,9 @@ def reputation_command(client, args):
     input_indicator = args.get('indicator')
     demisto_urls = demisto.demistoUrls()
     indicator_url = demisto_urls.get('server') + "/#/indicator/"
-    all_indicators = list()
-    page = 0
-    size = 1000
-    raw_data = demisto.searchIndicators(query=f'type:"{client.indicatorType}" value:{input_indicator}', page=page,
-                                        size=size)
-    while len(raw_data.get('iocs', [])) > 0:
-        all_indicators.extend(raw_data.get('iocs', []))
-        page += 1
-        raw_data = demisto.searchIndicators(query=f'type:"{client.indicatorType}" value:{input_indicator}', page=page,
-                                            size=size)
-    for indicator in all_indicators:
+    indicators = IndicatorsSearcher(query=f'type:"{client.indicatorType}" value:{input_indicator}', page_size=1000,
+                                    fields=['id', 'value', 'score', 'CustomFields'])
+    for indicator in indicators:
         custom_fields = indicator.get('CustomFields')
 
         score = indicator.get('score')
@@ -419,8 +406,7 @@ def main():
 
         elif demisto.command() == 'fetch-indicators':
             indicators = fetch_indicators(client)
-            for iter_ in batch(indicators, batch_size=2000):
-                demisto.createIndicators(iter_)
+            create_indicators_in_batches(indicators)
 
         else:
             commands[command](client, args)
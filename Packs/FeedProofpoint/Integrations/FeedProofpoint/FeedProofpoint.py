@@ -265,8 +265,7 @@ def main():
         if command == "fetch-indicators":
             indicators = fetch_indicators_command(client, params.get("indicator_type"))
             # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            create_indicators_in_batches(indicators)
         elif command == "test-module":
             return_outputs(module_test_command(client, params.get("indicator_type")))
         elif command == "proofpoint-get-indicators":
@@ -1014,8 +1014,7 @@ def main():
         if demisto.command() == 'fetch-indicators':
             indicators = fetch_indicators_command(client)
             # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            create_indicators_in_batches(indicators)
             demisto.setLastRun({'time': client.last_taxii_run})
         else:
             readable_output, outputs, raw_response = commands[command](client, demisto.args())  # type: ignore
@@ -13,34 +13,32 @@ def empty_list_context(items, list_name):
 def build_filtered_data(lst, items, ignore_case, match_exact, regex_ignore_case_flag):
     not_white_listed = []  # type: list
     white_listed = []  # type: list
-    human_readable = ''
+    human_readable_lines = []  # type: list
 
     # fill whitelisted array with all the the values that match the regex items in listname argument
-    list_to_lowercase = [list_item.lower().strip() for list_item in lst]
+    # exact matches are looked up in a set, so each item is checked in constant time
+    list_items = set(list_item.lower().strip() for list_item in lst) if ignore_case else set(lst)
     for item in items:
         if match_exact:
-            if ignore_case:
-                if item.lower() not in list_to_lowercase:
-                    continue
-            else:
-                if item not in lst:
-                    continue
-
-            human_readable += item + ' is in the list\n'
+            if (item.lower() if ignore_case else item) not in list_items:
+                continue
+
+            human_readable_lines.append(item + ' is in the list\n')
             white_listed.append(item)
         else:
             for list_item in lst:
                 if list_item and re.search(item, list_item, regex_ignore_case_flag):
-                    human_readable += item + ' is in the list\n'
+                    human_readable_lines.append(item + ' is in the list\n')
                     white_listed.append(item)
 
     # fill not_white_listed array with all the the values that not in whitelisted
+    white_listed_items = set(white_listed)
     for item in items:
-        if item not in white_listed:
-            human_readable += item + ' is not part of the list\n'
+        if item not in white_listed_items:
+            human_readable_lines.append(item + ' is not part of the list\n')
             not_white_listed.append(item)
 
-    return white_listed, not_white_listed, human_readable
+    return white_listed, not_white_listed, ''.join(human_readable_lines)
 
 
 def filter_list(lst, items, ignore_case, match_exact, list_name, delimiter):
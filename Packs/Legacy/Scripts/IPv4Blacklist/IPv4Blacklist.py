@@ -1,25 +1,12 @@
 import demistomock as demisto
 from CommonServerPython import *
 
-from netaddr import IPAddress, IPNetwork
-
 
 def main():
     ip_addresses = argToList(demisto.args()['value'])
-    cidr_range_list = argToList(demisto.args()['cidr_ranges'])
-
-    excluded_addresses = []
-
-    for ip_address in ip_addresses:
-        found = False
-        ip = IPAddress(ip_address)
-
-        for cidr_range in cidr_range_list:
-            if ip in IPNetwork(cidr_range):
-                found = True
+    cidr_index = CidrIndex(argToList(demisto.args()['cidr_ranges']))
 
-        if not found:
-            excluded_addresses.append(ip_address)
+    excluded_addresses = [ip_address for ip_address in ip_addresses if ip_address not in cidr_index]
 
     if not excluded_addresses:
         demisto.results(None)
@@ -1,19 +1,13 @@
 import demistomock as demisto
 from CommonServerPython import *
 
-from netaddr import IPAddress, IPNetwork
-
 
 def main():
-    ip_address = demisto.args()['left']
-    cidr_range_list = argToList(demisto.args()['right'])
-
-    for cidr in cidr_range_list:
-        if IPAddress(ip_address) in IPNetwork(cidr):
-            demisto.results(True)
-            return
+    ip_addresses = argToList(demisto.args()['left'])
+    cidr_index = CidrIndex(argToList(demisto.args()['right']))
 
-    demisto.results(False)
+    # a filter returns a single boolean, so for a list of addresses it is whether any of them is in a range
+    demisto.results(any(ip_address in cidr_index for ip_address in ip_addresses))
 
 
 if __name__ == "__builtin__" or __name__ == "builtins":
@@ -23,3 +23,25 @@ def test_main(mocker):
     assert demisto.results.call_count == 1
     results = demisto.results.call_args
     assert results[0][0] is False
+
+
+def test_main_list(mocker):
+    from IsNotInCidrRanges import main
+
+    mocker.patch.object(demisto, 'args', return_value={
+        'left': ['172.16.0.1', '2001:db8::1'],
+        'right': '10.0.0.0/8,192.168.0.0/16,2001:db8::/32'
+    })
+    mocker.patch.object(demisto, 'results')
+    main()
+    assert demisto.results.call_count == 1
+    assert demisto.results.call_args[0][0] is False
+
+    mocker.patch.object(demisto, 'args', return_value={
+        'left': ['172.16.0.1', '2001:db9::1'],
+        'right': '10.0.0.0/8,192.168.0.0/16,2001:db8::/32'
+    })
+    mocker.patch.object(demisto, 'results')
+    main()
+    assert demisto.results.call_count == 1
+    assert demisto.results.call_args[0][0] is True
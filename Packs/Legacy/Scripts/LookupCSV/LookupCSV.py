@@ -1,43 +1,153 @@
 """
 Given a CSV file in the War Room by entry ID, searches based on column and value.
 If the column is not present, simply parse the CSV into a list of lists or list of dicts (if header row supplied).
+
+Searches go through an index of the search column, which maps each value to the byte offsets of its rows.
+The index is cached on disk per file entry and column, so repeated lookups in the same file do not parse it again,
+and only the matching rows are read and parsed.
 """
+import csv
+import hashlib
+import os
+import tempfile
+import zlib
+from itertools import chain
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
 from CommonServerPython import *
 
+INDEX_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'lookup_csv_index')
+INDEX_BUCKETS = 256
+
+
+def iter_file_rows(f: IO[bytes], start: int = 0) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Streams the rows of an open CSV file. Lines without quotes are split directly, and rows with quotes go through
+    the csv module, so quoted commas and line breaks are parsed correctly. Empty lines are skipped.
+
+    Args:
+        f: The CSV file, opened in binary mode.
+        start: The byte offset to start reading from.
 
-def search_dicts(k, v, data):
+    Returns:
+        A generator of the byte offset each row starts at, and the row.
     """
-    Search a list of dicts by key
+    f.seek(start)
+    offset = start
+
+    def continuation_lines():
+        nonlocal offset
+        for continuation_line in f:
+            offset += len(continuation_line)
+            yield continuation_line.decode('utf-8')
+
+    for line in f:
+        row_offset = offset
+        offset += len(line)
+        if b'"' not in line:
+            text = line.decode('utf-8').rstrip('\r\n')
+            if text:
+                yield row_offset, text.split(',')
+            continue
+        # the reader pulls the next lines of the file only until the quoted row is complete
+        row = next(csv.reader(chain([line.decode('utf-8')], continuation_lines())), None)
+        if row:
+            yield row_offset, row
+
+
+def iter_csv_rows(file_path: str, skip_rows: int = 0) -> Iterator[Tuple[int, List[str]]]:
     """
-    match = []
-    for row in data:
-        if k in row:
-            if v == row[k]:
-                match.append(row)
-
-    if len(match) == 1:
-        # If we only get one result: return just it as a dictr
-        return match[0]
-    else:
-        return match
+    Streams the rows of a CSV file, see iter_file_rows.
 
+    Args:
+        file_path: The path of the CSV file.
+        skip_rows: The number of rows to skip (e.g. 1 for the header row).
 
-def search_lists(k, v, data):
+    Returns:
+        A generator of the byte offset each row starts at, and the row.
     """
-    Search a list of lists by index
+    with open(file_path, 'rb') as f:
+        for row_number, offset_and_row in enumerate(iter_file_rows(f)):
+            if row_number >= skip_rows:
+                yield offset_and_row
+
+
+def read_rows(file_path: str, offsets: List[int]) -> List[List[str]]:
+    """
+    Reads the rows which start at the given byte offsets.
     """
-    match = []
+    with open(file_path, 'rb') as f:
+        return [next(iter_file_rows(f, offset))[1] for offset in offsets]
 
-    k = int(k)
-    for row in data:
-        if row[k] == v:
-            match.append(row)
 
-    if len(match) == 1:
-        # If we only get one result: return just it.
-        return match[0]
-    else:
-        return match
+def row_to_dict(headers: List[str], row: List[str]) -> Dict[str, str]:
+    return {header: row[i] if i < len(row) else '' for i, header in enumerate(headers)}
+
+
+def get_bucket(value: str) -> int:
+    return zlib.crc32(value.encode('utf-8')) % INDEX_BUCKETS
+
+
+def build_index(file_path: str, column: int, skip_rows: int = 0) -> List[Dict[str, List[int]]]:
+    """
+    Builds an index of a column of a CSV file.
+
+    Args:
+        file_path: The path of the CSV file.
+        column: The (0 based) index of the column.
+        skip_rows: The number of rows to skip (e.g. 1 for the header row).
+
+    Returns:
+        The buckets of the index. Each bucket is a dict of the values of the column that fall in it (see get_bucket)
+        to the byte offsets of their rows, in the order of the file.
+    """
+    buckets: List[Dict[str, List[int]]] = [{} for _ in range(INDEX_BUCKETS)]
+    for offset, row in iter_csv_rows(file_path, skip_rows):
+        if column < len(row):
+            buckets[get_bucket(row[column])].setdefault(row[column], []).append(offset)
+    return buckets
+
+
+def get_offsets(entry_id: str, file_path: str, column: int, values: List[str],
+                skip_rows: int = 0) -> Dict[str, List[int]]:
+    """
+    Gets the byte offsets of the rows of each value in a column of a CSV file.
+    The index of the column is built once and cached on disk per file entry and column, and is built again if the
+    file changed. The index is stored in buckets, so a lookup loads only the buckets of the searched values.
+
+    Args:
+        entry_id: The entry ID of the file.
+        file_path: The path of the CSV file.
+        column: The (0 based) index of the column.
+        values: The values to search for.
+        skip_rows: The number of rows to skip (e.g. 1 for the header row).
+
+    Returns:
+        A dict of each value to the byte offsets of its rows.
+    """
+    values = [value for value in values if value is not None]
+    stat = os.stat(file_path)
+    cache_key = json.dumps([entry_id, file_path, stat.st_size, stat.st_mtime, column, skip_rows])
+    index_dir = os.path.join(INDEX_CACHE_DIR, hashlib.sha256(cache_key.encode('utf-8')).hexdigest())
+    if os.path.isdir(index_dir):
+        buckets: Dict[int, Dict[str, List[int]]] = {}
+        for bucket in {get_bucket(value) for value in values}:
+            with open(os.path.join(index_dir, '{}.json'.format(bucket))) as f:
+                buckets[bucket] = json.load(f)
+        return {value: buckets[get_bucket(value)].get(value, []) for value in values}
+
+    index = build_index(file_path, column, skip_rows)
+    try:
+        os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+        # write to a temporary directory first, so a concurrent lookup never reads a partially written index
+        tmp_dir = tempfile.mkdtemp(dir=INDEX_CACHE_DIR)
+        for bucket, bucket_index in enumerate(index):
+            with open(os.path.join(tmp_dir, '{}.json'.format(bucket)), 'w') as f:
+                json.dump(bucket_index, f)
+        os.rename(tmp_dir, index_dir)
+    except OSError as e:
+        demisto.debug('Failed to cache the index of {}: {}'.format(file_path, e))
+    return {value: index[get_bucket(value)].get(value, []) for value in values}
 
 
 def main():
@@ -48,6 +158,7 @@ def main():
     search_column = d_args['column'] if 'column' in d_args else None
 
     search_value: str = d_args['value'] if 'value' in d_args else None
+    search_values = argToList(d_args['values']) if 'values' in d_args else None
 
     add_row = d_args['add_header_row'] if 'add_header_row' in d_args else None
 
@@ -62,51 +173,59 @@ def main():
             '"{}" is not in csv format. Please ensure the file is in correct format and has a ".csv" extension'.format(
                 file_name))
 
-    csv_data: list = []
-    with open(file_path) as f:
-        lines = f.read().splitlines()
-
-        if header_row:
-            headers = lines[0]
-            headers = headers.split(",")
-            lines = lines[1:]
-
-            for line in lines:
-                d = {}
-                row = line.split(",")
-                for i, h in enumerate(headers):
-                    d[h] = row[i]
-                csv_data.append(d)
-        elif add_row:
-            if len(lines[0].split(",")) != len(add_row.split(",")):
-                return_error(
-                    "Added row via add_header_row has invalid length.")
-
-            headers = add_row.split(",")
-            for line in lines:
-                d = {}
-                row = line.split(",")
-                for i, h in enumerate(headers):
-                    d[h] = row[i]
-                csv_data.append(d)
-
-        else:
-            for line in lines:
-                row = line.split(",")
-                csv_data.append(row)
+    headers: Optional[List[str]] = None
+    skip_rows = 0
+    if header_row:
+        headers = next(iter_csv_rows(file_path), (0, []))[1]
+        skip_rows = 1
+    elif add_row:
+        headers = next(csv.reader([add_row]))
+        if len(next(iter_csv_rows(file_path), (0, []))[1]) != len(headers):
+            return_error(
+                "Added row via add_header_row has invalid length.")
 
     # If we're searching the CSV
     if search_column:
-        if header_row:
-            csv_data = search_dicts(search_column, search_value, csv_data)
+        column: Optional[int] = None
+        if headers is not None:
+            # with duplicated headers, the row dicts hold the value of the last column of the name
+            column = max((i for i, header in enumerate(headers) if header == search_column), default=None)
         else:
             # Lists are 0-indexed but this makes it more human readable (column 0 is column 1)
             try:
-                search_column = int(search_column) - 1
+                column = int(search_column) - 1
             except ValueError:
                 return_error(
                     "CSV column spec must be integer if header_row not supplied (got {})".format(search_column))
-            csv_data = search_lists(search_column, search_value, csv_data)
+
+        # a list of values is answered with a single pass over the file, and only the matching rows are parsed
+        values = search_values if search_values is not None else [search_value]
+        value_to_offsets = get_offsets(entry_id, file_path, column, values, skip_rows) if column is not None else {}
+        results = []
+        for value in values:
+            matches: list = read_rows(file_path, value_to_offsets.get(value, []))
+            if headers is not None:
+                matches = [row_to_dict(headers, row) for row in matches]
+            # If we only get one result: return just it.
+            results.append(matches[0] if len(matches) == 1 else matches)
+
+        if search_values is not None:
+            values_results = [{
+                'SearchValue': value,
+                'FoundResult': True if result else False,
+                'Result': result if result else None
+            } for value, result in zip(search_values, results)]
+            demisto.results({
+                "Type": entryTypes["note"],
+                "ContentsFormat": formats["json"],
+                "Contents": values_results,
+                "EntryContext": {'LookupCSV(val.SearchValue && val.SearchValue == obj.SearchValue)': values_results}
+            })
+            return
+        csv_data = results[0]
+    else:
+        csv_data = [row_to_dict(headers, row) if headers is not None else row
+                    for _, row in iter_csv_rows(file_path, skip_rows)]
 
     output = {
         'LookupCSV': {
@@ -153,3 +153,45 @@ class TestLookupCSV:
         with pytest.raises(SystemExit):
             # Raises using return_error due to invalid file spec (.txt, not .csv)
             main()
+
+    def test_main_csv_search_quoted(self, mocker, tmpdir):
+        # Values with quoted commas and line breaks are parsed as a single field
+        import LookupCSV
+        mocker.patch.object(LookupCSV, 'INDEX_CACHE_DIR', str(tmpdir))
+        args_value = {
+            "entryID": "entry_id",
+            "header_row": "true",
+            "column": "name",
+            "value": "Doe, John"
+        }
+        self.mock_demisto(mocker, file_obj=self.create_file_object("./TestData/quoted.csv"), args_value=args_value)
+        LookupCSV.main()
+        result = self.get_demisto_results()
+        assert result['Contents'] == [
+            {'name': 'Doe, John', 'address': '1 Main St\nSpringfield', 'count': '1'},
+            {'name': 'Doe, John', 'address': '3 Oak St', 'count': '3'}
+        ]
+        assert result['EntryContext']['LookupCSV']['FoundResult']
+
+    def test_main_csv_search_values(self, mocker, tmpdir):
+        # A list of values is answered in one call, and the index of the column is cached for the next calls
+        import LookupCSV
+        mocker.patch.object(LookupCSV, 'INDEX_CACHE_DIR', str(tmpdir))
+        build_index = mocker.spy(LookupCSV, 'build_index')
+        args_value = {
+            "entryID": "entry_id",
+            "column": "3",
+            "values": "1,3,4"
+        }
+        self.mock_demisto(mocker, file_obj=self.create_file_object("./TestData/quoted.csv"), args_value=args_value)
+        LookupCSV.main()
+        result = self.get_demisto_results()
+        assert result['EntryContext'] == {'LookupCSV(val.SearchValue && val.SearchValue == obj.SearchValue)': [
+            {'SearchValue': '1', 'FoundResult': True, 'Result': ['Doe, John', '1 Main St\nSpringfield', '1']},
+            {'SearchValue': '3', 'FoundResult': True, 'Result': ['Doe, John', '3 Oak St', '3']},
+            {'SearchValue': '4', 'FoundResult': False, 'Result': None}
+        ]}
+
+        LookupCSV.main()
+        assert self.get_demisto_results() == result
+        assert build_index.call_count == 1
@@ -1,4 +1,5 @@
 import csv
+import itertools
 
 from CommonServerPython import *
 
@@ -185,7 +186,10 @@ def main():
 
     elif not (parse_ip == -1 and parse_domain == -1 and parse_hash == -1):
         # if need to parse ips/domains/hashes, keep the script running
-        if sum(1 for line in open(file_path)) <= 1:  # checks if there are less than one line
+        with open(file_path) as f:
+            # only the first two lines are read to check if there are less than one line
+            is_one_lined = len(list(itertools.islice(f, 2))) <= 1
+        if is_one_lined:
             return_error('No data to parse. CSV file might be empty or one-lined. try the `ParseAll=yes` argument.')
 
         with open(file_path, 'rU') as f:
@@ -196,34 +200,37 @@ def main():
             if has_header:
                 next(csv_data)
 
-            md = '### Parsed Data Table\n' + ('IPs |' if 'ips' in d_args else '') + (
-                'Domains |' if 'domains' in d_args else '') + ('Hashes |' if 'hashes' in d_args else '') + '\n'
-            md += ('- |' if 'ips' in d_args else '') + ('- |' if 'domains' in d_args else '') + (
-                '- |' if 'hashes' in d_args else '') + '\n'
-            content = ''
+            # the table and the content are collected in lists and joined once, so large files are not copied per row
+            md_parts = ['### Parsed Data Table\n' + ('IPs |' if 'ips' in d_args else '') + (
+                'Domains |' if 'domains' in d_args else '') + ('Hashes |' if 'hashes' in d_args else '') + '\n']
+            md_parts.append(('- |' if 'ips' in d_args else '') + ('- |' if 'domains' in d_args else '') + (
+                '- |' if 'hashes' in d_args else '') + '\n')
+            content_parts = []
 
             for row in csv_data:
-                content += ','.join(row) + '\n'
+                content_parts.append(','.join(row) + '\n')
                 if parse_ip != -1:
-                    md += (row[parse_ip] + '|' if row[parse_ip] else ' |')
+                    md_parts.append(row[parse_ip] + '|' if row[parse_ip] else ' |')
                     is_ip = re.search(r'([0-9]{1,3}\.){3}[0-9]{1,3}', row[parse_ip])
                     is_valid = is_ip_valid(row[parse_ip])
                     if is_ip and is_valid:
                         ip_list.append(row[parse_ip])
 
                 if parse_domain != -1:
-                    md += (row[parse_domain] + '|' if row[parse_domain] else ' |')
+                    md_parts.append(row[parse_domain] + '|' if row[parse_domain] else ' |')
                     has_dot = '.' in row[parse_domain]
                     no_spaces = ' ' not in row[parse_domain]
                     if has_dot and no_spaces:
                         domain_list.append(row[parse_domain])
 
                 if parse_hash != -1:
-                    md += (row[parse_hash] + '|' if row[parse_hash] else ' |')
+                    md_parts.append(row[parse_hash] + '|' if row[parse_hash] else ' |')
                     is_hash = re.search(r'[0-9A-Fa-f]{32,128}', row[parse_hash])
                     if is_hash:
                         hash_list.append(row[parse_hash])
-                md += '\n'
+                md_parts.append('\n')
+            md = ''.join(md_parts)
+            content = ''.join(content_parts)
 
         context = {}  # type: dict
         if ip_list:
@@ -11,6 +11,10 @@ from email.parser import HeaderParser
 import traceback
 import tempfile
 import sys
+import binascii
+import functools
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
 
 # -*- coding: utf-8 -*-
 # !/usr/bin/env python
@@ -44,6 +48,8 @@ sys.setdefaultencoding('utf8')  # pylint: disable=no-member
 
 MAX_DEPTH_CONST = 3
 IS_NESTED_EML = False
+STREAM_BUFFER_SIZE = 1 << 16
+DEFAULT_MAX_WORKERS = 4
 
 """
 https://github.com/vikramarsid/msg_parser
@@ -3416,6 +3422,44 @@ def unfold(s):
     return re.sub(r'[ \t]*[\r\n][ \t\r\n]*', ' ', s).strip(' ')
 
 
+def create_eml_headers_map(headers):
+    header_list = []
+    headers_map = {}  # type: dict
+    for item in headers.items():
+        value = unfold(convert_to_unicode(item[1]))
+        item_dict = {
+            "name": item[0],
+            "value": value
+        }
+
+        # old way to map headers
+        header_list.append(item_dict)
+
+        # new way to map headers - dictionary
+        if item[0] in headers_map:
+            # in case there is already such header
+            # then add that header value to value array
+            if not isinstance(headers_map[item[0]], list):
+                # convert the existing value to array
+                headers_map[item[0]] = [headers_map[item[0]]]
+
+            # add the new value to the value array
+            headers_map[item[0]].append(value)
+        else:
+            headers_map[item[0]] = value
+
+    return header_list, headers_map
+
+
+def get_attachment_file_name(part):
+    attachment_file_name = convert_to_unicode(part.get_filename())
+    if attachment_file_name is None and part.get('filename'):
+        attachment_file_name = os.path.normpath(part.get('filename'))
+        if os.path.isabs(attachment_file_name):
+            attachment_file_name = os.path.basename(attachment_file_name)
+    return attachment_file_name
+
+
 def handle_eml(file_path, b64=False, file_name=None, parse_only_headers=False, max_depth=3):
     global ENCODINGS_TYPES
     global IS_NESTED_EML
@@ -3431,31 +3475,7 @@ def handle_eml(file_path, b64=False, file_name=None, parse_only_headers=False, m
 
         parser = HeaderParser()
         headers = parser.parsestr(file_data)
-
-        header_list = []
-        headers_map = {}  # type: dict
-        for item in headers.items():
-            value = unfold(convert_to_unicode(item[1]))
-            item_dict = {
-                "name": item[0],
-                "value": value
-            }
-
-            # old way to map headers
-            header_list.append(item_dict)
-
-            # new way to map headers - dictionary
-            if item[0] in headers_map:
-                # in case there is already such header
-                # then add that header value to value array
-                if not isinstance(headers_map[item[0]], list):
-                    # convert the existing value to array
-                    headers_map[item[0]] = [headers_map[item[0]]]
-
-                # add the new value to the value array
-                headers_map[item[0]].append(value)
-            else:
-                headers_map[item[0]] = value
+        header_list, headers_map = create_eml_headers_map(headers)
 
         eml = message_from_string(file_data)
         if not eml:
@@ -3479,11 +3499,7 @@ def handle_eml(file_path, b64=False, file_name=None, parse_only_headers=False, m
 
             elif part.get_filename() or "attachment" in part.get("Content-Disposition", ""):
 
-                attachment_file_name = convert_to_unicode(part.get_filename())
-                if attachment_file_name is None and part.get('filename'):
-                    attachment_file_name = os.path.normpath(part.get('filename'))
-                    if os.path.isabs(attachment_file_name):
-                        attachment_file_name = os.path.basename(attachment_file_name)
+                attachment_file_name = get_attachment_file_name(part)
 
                 if "message/rfc822" in part.get("Content-Type", "") \
                         or ("application/octet-stream" in part.get("Content-Type", "")
@@ -3599,6 +3615,406 @@ def handle_eml(file_path, b64=False, file_name=None, parse_only_headers=False, m
         return email_data, attached_emails
 
 
+def get_delimiter(line, boundaries):
+    """
+    Checks whether a line is a delimiter of one of the given multipart boundaries.
+
+    Returns:
+        tuple. The boundary and whether it is the closing delimiter, or None if the line is not a delimiter.
+    """
+    if not line.startswith('--'):
+        return None
+    marker = line[2:].rstrip()
+    if marker in boundaries:
+        return marker, False
+    if marker.endswith('--') and marker[:-2] in boundaries:
+        return marker[:-2], True
+    return None
+
+
+class LineReader(object):
+    """
+    Reads the lines of a file one at a time, and allows to push back the last line read.
+    """
+    def __init__(self, f):
+        self._lines = iter(f)
+        self._pushed = None
+
+    def readline(self):
+        if self._pushed is not None:
+            line, self._pushed = self._pushed, None
+            return line
+        return next(self._lines, '')
+
+    def push(self, line):
+        self._pushed = line
+
+
+class TransferDecoder(object):
+    """
+    Decodes the body of a MIME part by its Content-Transfer-Encoding as its lines are written,
+    and writes the decoded data to a file object. The lines are decoded in buffers of STREAM_BUFFER_SIZE,
+    so a large body is never held in memory as a whole.
+    Decoding errors are added to debug_messages instead of being logged, so the decoder can run in a worker thread.
+    """
+    BASE64_IGNORED_CHARS = re.compile(r'[^A-Za-z0-9+/=]')
+
+    def __init__(self, out, encoding, debug_messages=None):
+        self.out = out
+        self.encoding = (encoding or '').strip().lower()
+        self.debug_messages = debug_messages if debug_messages is not None else []
+        self.size = 0
+        self._lines = []  # type: list
+        self._buffered = 0
+        self._base64_remainder = ''
+
+    def write(self, line):
+        self._lines.append(line)
+        self._buffered += len(line)
+        if self._buffered >= STREAM_BUFFER_SIZE:
+            self._flush()
+
+    def close(self):
+        self._flush(final=True)
+
+    def _flush(self, final=False):
+        data = ''.join(self._lines)
+        self._lines = []
+        self._buffered = 0
+        if self.encoding == 'base64':
+            # base64 is decoded in groups of 4 characters, the rest is kept for the next buffer
+            data = self._base64_remainder + self.BASE64_IGNORED_CHARS.sub('', data)
+            aligned = len(data) - len(data) % 4
+            data, self._base64_remainder = data[:aligned], data[aligned:]
+            if final and len(self._base64_remainder) > 1:
+                data += self._base64_remainder + '=' * (4 - len(self._base64_remainder))
+            try:
+                data = binascii.a2b_base64(data)
+            except binascii.Error as e:
+                self.debug_messages.append('Failed to decode base64 data: {}'.format(e))
+                data = ''
+        elif self.encoding == 'quoted-printable':
+            data = binascii.a2b_qp(data)
+        self.out.write(data)
+        self.size += len(data)
+
+
+class StreamingEmlParser(object):
+    """
+    Parses an eml file part by part in a single pass over the file, without loading the whole email into memory.
+    Attachments are decoded straight into war room files, the first text and HTML bodies are decoded,
+    and other bodies are skipped without being decoded.
+    Attached emails are not parsed here, so they can be parsed concurrently (see parse_attached_emails).
+
+    The parser does not send results to the war room or write to the log, so it can run in a worker thread.
+    The results are sent and the debug_messages are logged by output_streamed_email.
+    """
+    def __init__(self, file_path, file_name, max_depth, parse_only_headers=False, is_nested=False):
+        self.file_path = file_path
+        self.file_name = file_name
+        self.max_depth = max_depth
+        self.parse_only_headers = parse_only_headers
+        self.is_nested = is_nested
+        self.headers = None
+        self.header_list = []  # type: list
+        self.headers_map = {}  # type: dict
+        self.bodies = {}  # type: dict
+        # the attachments in the order of the email, with their war room entry and their parser if they are emails
+        self.attachments = []  # type: list
+        self.debug_messages = []  # type: list
+
+    def parse(self):
+        with open(self.file_path, 'rb') as f:
+            reader = LineReader(f)
+            self.headers = self._read_headers(reader, ())
+            if not self.headers:
+                raise Exception("Could not parse eml file!")
+            self.header_list, self.headers_map = create_eml_headers_map(self.headers)
+            if not self.parse_only_headers:
+                self._parse_body(reader, self.headers, ())
+
+    @staticmethod
+    def _read_headers(reader, boundaries):
+        header_lines = []
+        while True:
+            line = reader.readline()
+            if not line or line in ('\n', '\r\n'):
+                break
+            if get_delimiter(line, boundaries):
+                reader.push(line)
+                break
+            # folded headers are parsed with plain line breaks, like the headers of messages which handle_eml saves
+            header_lines.append(line.rstrip('\r\n') + '\n')
+        return HeaderParser().parsestr(''.join(header_lines))
+
+    @staticmethod
+    def _skip(reader, boundaries):
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            if get_delimiter(line, boundaries):
+                reader.push(line)
+                return
+
+    def _parse_body(self, reader, headers, boundaries):
+        is_attachment = headers.get_filename() or "attachment" in headers.get("Content-Disposition", "")
+        boundary = headers.get_boundary() if headers.get_content_maintype() == 'multipart' else None
+        if boundary and not is_attachment:
+            self._parse_multipart(reader, boundary, boundaries)
+        elif headers.get_content_type() == 'message/rfc822' and not is_attachment:
+            # the parts of an inline email are parsed as parts of this email
+            self._parse_body(reader, self._read_headers(reader, boundaries), boundaries)
+        else:
+            self._parse_leaf(reader, headers, boundaries)
+
+    def _parse_multipart(self, reader, boundary, boundaries):
+        inner_boundaries = boundaries + (boundary,)
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            delimiter = get_delimiter(line, inner_boundaries)
+            if not delimiter:
+                # the preamble
+                continue
+            if delimiter[0] != boundary:
+                # a delimiter of an enclosing multipart, this one was not closed
+                reader.push(line)
+                return
+            if delimiter[1]:
+                break
+            self._parse_body(reader, self._read_headers(reader, inner_boundaries), inner_boundaries)
+        # the epilogue
+        self._skip(reader, boundaries)
+
+    def _parse_leaf(self, reader, headers, boundaries):
+        decoder, on_close = self._open_part(headers)
+        previous = None
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+            if line.startswith('--') and get_delimiter(line, boundaries):
+                reader.push(line)
+                # the line break before a delimiter is part of the delimiter
+                if previous is not None:
+                    previous = previous[:-2] if previous.endswith('\r\n') else previous.rstrip('\n')
+                break
+            if previous is not None and decoder:
+                decoder.write(previous)
+            previous = line
+        if decoder:
+            if previous:
+                decoder.write(previous)
+            decoder.close()
+            on_close(decoder)
+
+    def _open_part(self, headers):
+        encoding = headers.get("Content-Transfer-Encoding")
+        if headers.get_filename() or "attachment" in headers.get("Content-Disposition", ""):
+            attachment_file_name = get_attachment_file_name(headers)
+            file_id = demisto.uniqueFile()
+            file_path = demisto.investigation()['id'] + '_' + file_id
+            out = open(file_path, 'wb')
+
+            def on_attachment_close(decoder):
+                out.close()
+                self._add_attachment(headers, attachment_file_name, file_id, file_path, decoder.size)
+
+            return TransferDecoder(out, encoding, self.debug_messages), on_attachment_close
+
+        content_type = headers.get_content_type()
+        if content_type in ('text/html', 'text/plain') and content_type not in self.bodies:
+            body = BytesIO()
+
+            def on_body_close(decoder):
+                # bodies are small, so they are decoded by the email package, which keeps malformed bodies as they are
+                message = email.message.Message()
+                if encoding:
+                    message['Content-Transfer-Encoding'] = encoding
+                message.set_payload(body.getvalue())
+                self.bodies[content_type] = message.get_payload(decode=True)
+
+            return TransferDecoder(body, None, self.debug_messages), on_body_close
+
+        return None, None
+
+    def _add_attachment(self, headers, attachment_file_name, file_id, file_path, size):
+        content_type = headers.get("Content-Type", "")
+        kind = None
+        if "message/rfc822" in content_type \
+                or ("application/octet-stream" in content_type and (attachment_file_name or '').endswith(".eml")):
+            kind = 'eml'
+            if not attachment_file_name:
+                # in case there is no filename for the eml we will try to use mail subject as file name
+                with open(file_path, 'rb') as f:
+                    subject = self._read_headers(LineReader(f), ()).get('Subject', "no_name_mail_attachment")
+                attachment_file_name = convert_to_unicode(subject) + '.eml'
+        elif headers.get_content_type() == 'message/delivery-status':
+            kind = 'dsn'
+        elif (attachment_file_name or '').endswith(".msg"):
+            kind = 'msg'
+
+        entry = {'Contents': '', 'ContentsFormat': formats['text'], 'Type': entryTypes['file'],
+                 'File': attachment_file_name, 'FileID': file_id}
+        if kind == 'eml' and not size:
+            self.debug_messages.append("found eml attachment with Content-Type=message/rfc822 but has no payload")
+            entry = None
+
+        self.attachments.append({
+            'name': attachment_file_name,
+            'kind': kind,
+            'path': file_path,
+            'size': size,
+            'entry': entry,
+            'email': None
+        })
+
+    def get_email_data(self, attachment_names, has_attached_emails):
+        """
+        Builds the email data, the same as handle_eml does. Sends the bodies which fail to decode to the war room,
+        so it should be called from the main thread.
+        """
+        content_type = self.headers.get_content_type()
+        # a signed email which wraps an attached email is not returned, the attached email is returned instead
+        if 'multipart/signed' in content_type and (self.is_nested or has_attached_emails):
+            return None
+        html = get_utf_string(self.bodies['text/html'], 'HTML') if 'text/html' in self.bodies else ''
+        text = get_utf_string(self.bodies['text/plain'], 'TEXT') if 'text/plain' in self.bodies else ''
+        return {
+            'To': extract_address_eml(self.headers, 'to'),
+            'CC': extract_address_eml(self.headers, 'cc'),
+            'From': extract_address_eml(self.headers, 'from'),
+            'Subject': convert_to_unicode(self.headers['Subject']),
+            'HTML': convert_to_unicode(html),
+            'Text': convert_to_unicode(text),
+            'Headers': self.header_list,
+            'HeadersMap': self.headers_map,
+            'Attachments': ','.join(attachment_names) if attachment_names else '',
+            'AttachmentNames': attachment_names if attachment_names else [],
+            'Format': content_type,
+            'Depth': MAX_DEPTH_CONST - self.max_depth
+        }
+
+
+def parse_attached_emails(root_parser, max_workers=DEFAULT_MAX_WORKERS, size_limit=None):
+    """
+    Parses the emails attached to a streamed email, and the emails attached to them, one depth level at a time.
+    The emails of each level are parsed concurrently. Attached .msg files are parsed by output_streamed_email.
+
+    Args:
+        root_parser (StreamingEmlParser): The parser of the parsed email.
+        max_workers (int): The maximum number of emails to parse at the same time.
+        size_limit (int): The maximum total size in bytes of the attached emails to parse. Attached emails beyond
+            the limit are returned as files, without being parsed. None for no limit.
+    """
+    pool = ThreadPool(max_workers)
+    try:
+        parsed_size = 0
+        level = [root_parser]
+        while level:
+            next_level = []
+            for parser in level:
+                if parser.max_depth - 1 <= 0:
+                    continue
+                for attachment in parser.attachments:
+                    if attachment['kind'] != 'eml' or not attachment['size']:
+                        continue
+                    if size_limit is not None and parsed_size + attachment['size'] > size_limit:
+                        demisto.debug('Skipped parsing {}, the attached emails size limit was reached'.format(
+                            attachment['name']))
+                        continue
+                    parsed_size += attachment['size']
+                    attachment['email'] = StreamingEmlParser(attachment['path'], attachment['name'],
+                                                             parser.max_depth - 1, is_nested=True)
+                    next_level.append(attachment['email'])
+            pool.map(lambda attached_email: attached_email.parse(), next_level)
+            level = next_level
+    finally:
+        pool.close()
+
+
+def output_streamed_email(parser):
+    """
+    Sends the attachments of a streamed email and of its attached emails to the war room, in the same order as
+    handle_eml does, and logs the debug messages of their parsers.
+
+    Returns:
+        tuple. The email data, and the data of the attached emails.
+    """
+    for message in parser.debug_messages:
+        demisto.debug(message)
+    attached_emails = []
+    attachment_names = []
+    has_attached_emails = False
+    # handle_eml walks the parts with a stack, so it handles the attachments in reverse order
+    for attachment in reversed(parser.attachments):
+        attachment_file_name = attachment['name']
+        if attachment['entry']:
+            demisto.results(attachment['entry'])
+
+        if attachment['email']:
+            has_attached_emails = True
+            inner_eml, inner_attached_emails = output_streamed_email(attachment['email'])
+            attached_emails.append(inner_eml)
+            attached_emails.extend(inner_attached_emails)
+            # if we are outter email is a singed attachment it is a wrapper and we don't return the output of
+            # this inner email as it will be returned as part of the main result
+            if 'multipart/signed' not in parser.headers.get_content_type():
+                return_outputs(readable_output=data_to_md(inner_eml, attachment_file_name, parser.file_name),
+                               outputs=None)
+
+        elif attachment['kind'] == 'dsn' and parser.max_depth - 1 > 0:
+            # email is DSN, its human-readable section is returned with the attached emails
+            with open(attachment['path'], 'rb') as f:
+                attached_emails.append(f.read().decode('utf-8'))
+
+        elif attachment['kind'] == 'msg' and parser.max_depth - 1 > 0:
+            inner_msg, inner_attached_emails = handle_msg(attachment['path'], attachment_file_name, False,
+                                                          parser.max_depth - 1)
+            attached_emails.append(inner_msg)
+            attached_emails.extend(inner_attached_emails)
+
+            # will output the inner email to the UI
+            return_outputs(readable_output=data_to_md(inner_msg, attachment_file_name, parser.file_name),
+                           outputs=None)
+
+        attachment_names.append(attachment_file_name)
+        demisto.setContext('AttachmentName', attachment_file_name)
+
+    return parser.get_email_data(attachment_names, has_attached_emails), attached_emails
+
+
+def handle_eml_streaming(file_path, b64=False, file_name=None, parse_only_headers=False, max_depth=3,
+                         max_workers=DEFAULT_MAX_WORKERS, size_limit=None):
+    """
+    Parses an eml file like handle_eml, by streaming its parts (see StreamingEmlParser).
+    The attached emails are parsed concurrently, up to max_depth and size_limit (see parse_attached_emails).
+    """
+    if max_depth == 0:
+        return None, []
+
+    decoded_file_path = None
+    if b64:
+        with open(file_path, 'rb') as encoded_file, \
+                tempfile.NamedTemporaryFile(delete=False) as decoded_file:
+            base64.decode(encoded_file, decoded_file)
+        file_path = decoded_file_path = decoded_file.name
+
+    try:
+        parser = StreamingEmlParser(file_path, file_name, max_depth, parse_only_headers)
+        parser.parse()
+        if parse_only_headers:
+            return {"HeadersMap": parser.headers_map}, []
+
+        parse_attached_emails(parser, max_workers, size_limit)
+        return output_streamed_email(parser)
+    finally:
+        if decoded_file_path:
+            os.remove(decoded_file_path)
+
+
 def create_email_output(email_data, attached_emails):
     # for backward compatibility if there are no attached files we return single dict
     # if there are attached files then we will return array of all the emails
@@ -3639,6 +4055,13 @@ def main():
 
     parse_only_headers = demisto.args().get('parse_only_headers', 'false').lower() == 'true'
 
+    parse_eml = handle_eml
+    if demisto.args().get('streaming', 'false').lower() == 'true':
+        max_workers = int(demisto.args().get('max_workers', DEFAULT_MAX_WORKERS))
+        max_attached_emails_size = demisto.args().get('max_attached_emails_size')
+        size_limit = int(float(max_attached_emails_size) * 1024 * 1024) if max_attached_emails_size else None
+        parse_eml = functools.partial(handle_eml_streaming, max_workers=max_workers, size_limit=size_limit)
+
     try:
         result = demisto.executeCommand('getFilePath', {'id': entry_id})
         if is_error(result):
@@ -3666,7 +4089,7 @@ def main():
             output = create_email_output(email_data, attached_emails)
 
         elif 'rfc 822 mail' in file_type_lower or 'smtp mail' in file_type_lower or 'multipart/signed' in file_type_lower:
-            email_data, attached_emails = handle_eml(file_path, False, file_name, parse_only_headers, max_depth)
+            email_data, attached_emails = parse_eml(file_path, False, file_name, parse_only_headers, max_depth)
             output = create_email_output(email_data, attached_emails)
 
         elif ('ascii text' in file_type_lower or 'unicode text' in file_type_lower
@@ -3677,23 +4100,23 @@ def main():
                     file_contents = f.read()
 
                 if file_contents and 'Content-Type:'.lower() in file_contents.lower():
-                    email_data, attached_emails = handle_eml(file_path, b64=False, file_name=file_name,
-                                                             parse_only_headers=parse_only_headers, max_depth=max_depth)
+                    email_data, attached_emails = parse_eml(file_path, b64=False, file_name=file_name,
+                                                            parse_only_headers=parse_only_headers, max_depth=max_depth)
                     output = create_email_output(email_data, attached_emails)
                 else:
                     # Try a base64 decode
                     b64decode(file_contents)
                     if file_contents and 'Content-Type:'.lower() in file_contents.lower():
-                        email_data, attached_emails = handle_eml(file_path, b64=True, file_name=file_name,
-                                                                 parse_only_headers=parse_only_headers,
-                                                                 max_depth=max_depth)
+                        email_data, attached_emails = parse_eml(file_path, b64=True, file_name=file_name,
+                                                                parse_only_headers=parse_only_headers,
+                                                                max_depth=max_depth)
                         output = create_email_output(email_data, attached_emails)
                     else:
                         try:
                             # Try to open
-                            email_data, attached_emails = handle_eml(file_path, b64=False, file_name=file_name,
-                                                                     parse_only_headers=parse_only_headers,
-                                                                     max_depth=max_depth)
+                            email_data, attached_emails = parse_eml(file_path, b64=False, file_name=file_name,
+                                                                    parse_only_headers=parse_only_headers,
+                                                                    max_depth=max_depth)
                             is_data_populated = is_email_data_populated(email_data)
                             if not is_data_populated:
                                 raise DemistoException("No email_data found")
@@ -580,3 +580,102 @@ def test_eml_base64_header_comment_although_string(mocker):
     assert 'Attacker+email+.msg' in results[0]['EntryContext']['Email'][0]['Attachments']
     assert results[0]['EntryContext']['Email'][1]["Subject"] == 'Attacker email'
     assert results[0]['EntryContext']['Email'][1]['Depth'] == 1
+
+
+@pytest.mark.parametrize('email_file', ['DONT_OPEN-MALICIOUS.eml', 'ParseEmailFiles-test-emls.eml',
+                                        'eml_contains_base64_eml.eml', 'eml_contains_base64_eml2.eml',
+                                        'eml_contains_htm_attachment.eml', 'email_with_special_char_bytes.eml',
+                                        'multiple_to_cc.eml', 'utf_8_email.eml'])
+@pytest.mark.parametrize('max_depth', ['3', '2'])
+def test_eml_streaming(mocker, email_file, max_depth):
+    """
+    Given: an eml file.
+    When: parsing it with and without streaming.
+    Then: the same emails and attachment names are returned.
+    """
+    mocker.patch.object(demisto, 'executeCommand', side_effect=exec_command_for_file(email_file))
+    outputs = []
+    for streaming in ['false', 'true']:
+        mocker.patch.object(demisto, 'args', return_value={'entryid': 'test', 'max_depth': max_depth,
+                                                           'streaming': streaming, 'max_workers': '2'})
+        mocker.patch.object(demisto, 'results')
+        main()
+        entries = [call[0][0] for call in demisto.results.call_args_list]
+        outputs.append(([entry['File'] for entry in entries if 'File' in entry], entries[-1]['EntryContext']))
+    assert outputs[0] == outputs[1]
+
+
+def test_eml_streaming_size_limit(mocker):
+    """
+    Given: an eml file with an attached email, and a limit of the size of attached emails smaller than it.
+    When: parsing it with streaming.
+    Then: the attached email is returned as a file without being parsed.
+    """
+    mocker.patch.object(demisto, 'args', return_value={'entryid': 'test', 'streaming': 'true',
+                                                       'max_attached_emails_size': '0.0001'})
+    mocker.patch.object(demisto, 'executeCommand', side_effect=exec_command_for_file('eml_contains_base64_eml.eml'))
+    mocker.patch.object(demisto, 'results')
+    main()
+    assert demisto.results.call_count == 2
+    email = demisto.results.call_args[0][0]['EntryContext']['Email']
+    assert email['Subject'] == 'Fwd: test - inner attachment eml (base64)'
+    assert email['Attachments'] == 'message.eml'
+
+
+@pytest.mark.parametrize('encoding, lines, decoded', [
+    ('base64', ['aGVsbG8g\r\n', 'd29y\r\n', 'bGQ=\r\n'], 'hello world'),
+    ('base64', ['aGVsbG8gd29ybGQ\r\n'], 'hello world'),
+    ('quoted-printable', ['hello=\r\n', ' w=6Frld\r\n'], 'hello world\r\n'),
+    ('7bit', ['hello\r\n', 'world'], 'hello\r\nworld'),
+])
+def test_transfer_decoder(mocker, encoding, lines, decoded):
+    """
+    Given: the lines of a MIME part body.
+    When: decoding them in buffers smaller than the lines.
+    Then: the body is decoded as a whole.
+    """
+    import ParseEmailFiles
+    from io import BytesIO
+    mocker.patch.object(ParseEmailFiles, 'STREAM_BUFFER_SIZE', 3)
+    out = BytesIO()
+    decoder = ParseEmailFiles.TransferDecoder(out, encoding)
+    for line in lines:
+        decoder.write(line)
+    decoder.close()
+    assert out.getvalue() == decoded
+    assert decoder.size == len(decoded)
+
+
+def test_transfer_decoder_error(mocker):
+    """
+    Given: the lines of a base64 body which fail to decode.
+    When: decoding them.
+    Then: the error is added to the debug messages instead of being logged.
+    """
+    import ParseEmailFiles
+    from io import BytesIO
+    mocker.patch.object(demisto, 'debug')
+    debug_messages = []
+    decoder = ParseEmailFiles.TransferDecoder(BytesIO(), 'base64', debug_messages)
+    decoder.write('a===\r\n')
+    decoder.close()
+    assert decoder.size == 0
+    assert debug_messages == ['Failed to decode base64 data: Incorrect padding']
+    assert demisto.debug.call_count == 0
+
+
+def test_output_streamed_email_logs_debug_messages(mocker):
+    """
+    Given: a streamed email whose parser recorded debug messages.
+    When: outputting it.
+    Then: the debug messages are logged.
+    """
+    import ParseEmailFiles
+    mocker.patch.object(demisto, 'debug')
+    mocker.patch.object(demisto, 'results')
+    mocker.patch.object(demisto, 'setContext')
+    parser = ParseEmailFiles.StreamingEmlParser('test_data/multiple_to_cc.eml', 'multiple_to_cc.eml', 3)
+    parser.parse()
+    parser.debug_messages.append('a debug message')
+    ParseEmailFiles.output_streamed_email(parser)
+    demisto.debug.assert_called_once_with('a debug message')
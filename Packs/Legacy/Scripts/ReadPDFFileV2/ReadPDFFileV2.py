@@ -8,7 +8,9 @@ import re
 import errno
 import shutil
 import json
-from typing import List
+import mmap
+from multiprocessing.pool import ThreadPool
+from typing import Dict, List
 
 
 # error class for shell errors
@@ -28,6 +30,9 @@ except ValueError:
 EMAIL_REGXEX = "[a-zA-Z0-9-_.]+@[a-zA-Z0-9-_.]+"
 # Documentation claims png is enough for pdftohtml, but through testing we found jpg can be generated as well
 IMG_FORMATS = ['jpg', 'jpeg', 'png', 'gif']
+# the number of pages each pdftotext/pdftohtml run extracts
+PAGES_PER_CHUNK = 10
+DEFAULT_MAX_WORKERS = 4
 
 
 def mark_suspicious(suspicious_reason, entry_id):
@@ -58,15 +63,23 @@ def return_error_without_exit(message):
     })
 
 
-def run_shell_command(command, *args):
-    """Runs shell command and returns the result if not encountered an error"""
+def run_shell_command(command, *args, warnings=None):
+    """
+    Runs shell command and returns the result if not encountered an error.
+    If a warnings list is given, the warnings of the command are added to it instead of being logged, so the command
+    can run in a worker thread, which must not call demisto.
+    """
     cmd = [command] + list(args)
     completed_process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     if completed_process.returncode != 0:
         raise ShellException(f'Failed with the following error code: {completed_process.returncode}.'
                              f' Error: {completed_process.stderr}')
     elif completed_process.stderr:
-        demisto.debug(f'ReadPDFFilev2: exec of [{cmd}] completed with warnings: {completed_process.stderr}')
+        warning = f'ReadPDFFilev2: exec of [{cmd}] completed with warnings: {completed_process.stderr}'
+        if warnings is None:
+            demisto.debug(warning)
+        else:
+            warnings.append(warning)
     return completed_process.stdout
 
 
@@ -122,13 +135,25 @@ def get_pdf_metadata(file_path):
     return metadata
 
 
-def get_pdf_text(file_path, pdf_text_output_path):
+def get_page_range_args(first_page=None, last_page=None):
+    """Returns the poppler arguments which limit a command to a range of pages (all the pages if not given)"""
+    args = []
+    if first_page:
+        args += ['-f', str(first_page)]
+    if last_page:
+        args += ['-l', str(last_page)]
+    return args
+
+
+def get_pdf_text(file_path, pdf_text_output_path, first_page=None, last_page=None, warnings=None):
     """Creates a txt file from the pdf in the pdf_text_output_path and returns the content of the txt file"""
     user_password = demisto.args().get('userPassword')
+    page_range_args = get_page_range_args(first_page, last_page)
     if user_password:
-        run_shell_command('pdftotext', '-upw', user_password, file_path, pdf_text_output_path)
+        run_shell_command('pdftotext', '-upw', user_password, *page_range_args, file_path, pdf_text_output_path,
+                          warnings=warnings)
     else:
-        run_shell_command('pdftotext', file_path, pdf_text_output_path)
+        run_shell_command('pdftotext', *page_range_args, file_path, pdf_text_output_path, warnings=warnings)
     text = ''
     with open(pdf_text_output_path, 'rb') as f:
         for line in f:
@@ -136,15 +161,18 @@ def get_pdf_text(file_path, pdf_text_output_path):
     return text
 
 
-def get_pdf_htmls_content(pdf_path, output_folder):
+def get_pdf_htmls_content(pdf_path, output_folder, first_page=None, last_page=None, warnings=None):
     """Creates an html file and images from the pdf in output_folder and returns the text content of the html files"""
     pdf_html_output_path = f'{output_folder}/PDF.html'
     user_password = demisto.args().get('userPassword')
+    page_range_args = get_page_range_args(first_page, last_page)
     if user_password:
-        run_shell_command('pdftohtml', '-upw', user_password, pdf_path, pdf_html_output_path)
+        run_shell_command('pdftohtml', '-upw', user_password, *page_range_args, pdf_path, pdf_html_output_path,
+                          warnings=warnings)
     else:
-        run_shell_command('pdftohtml', pdf_path, pdf_html_output_path)
-    html_file_names = get_files_names_in_path(output_folder, '*.html')
+        run_shell_command('pdftohtml', *page_range_args, pdf_path, pdf_html_output_path, warnings=warnings)
+    # glob without changing the working directory, as pages are extracted in worker threads
+    html_file_names = sorted(glob.glob(os.path.join(glob.escape(str(output_folder)), '*.html')))
     html_content = ''
     for file_name in html_file_names:
         with open(file_name, 'rb') as f:
@@ -153,10 +181,114 @@ def get_pdf_htmls_content(pdf_path, output_folder):
     return html_content
 
 
-def build_readpdf_entry_object(pdf_file, metadata, text, urls, emails, images):
-    """Builds an entry object for the main script flow"""
+def get_page_ranges(pages, max_pages=None):
+    """Splits the pages of the pdf to ranges of up to PAGES_PER_CHUNK pages, limited to the first max_pages pages"""
+    if max_pages:
+        pages = min(pages, max_pages)
+    return [(first_page, min(first_page + PAGES_PER_CHUNK - 1, pages))
+            for first_page in range(1, pages + 1, PAGES_PER_CHUNK)]
+
+
+def extract_pages(pdf_path, output_folder, page_range):
+    """
+    Extracts the text, the html content and the images of a range of pages of the pdf to a folder of its own under
+    output_folder. Runs in a worker thread, so it does not call demisto, and returns the warnings of the poppler
+    commands to be logged by the main thread.
+    Returns the folder, the text, the html content and the warnings.
+    """
+    first_page, last_page = page_range
+    chunk_folder = f'{output_folder}/pages_{first_page}' if first_page else f'{output_folder}/pages'
+    os.makedirs(chunk_folder, exist_ok=True)
+    warnings: List[str] = []
+    text = get_pdf_text(pdf_path, f'{chunk_folder}/PDFText.txt', first_page, last_page, warnings)
+    html_content = get_pdf_htmls_content(pdf_path, chunk_folder, first_page, last_page, warnings)
+    return chunk_folder, text, html_content, warnings
+
+
+def iter_pdf_pages(pdf_path, output_folder, page_ranges, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Extracts the page ranges of the pdf concurrently, each worker running the poppler commands of a range, and
+    yields the results of extract_pages in page order as soon as they are ready. This lets the first pages be
+    processed while the next ones are extracted. Closing the generator stops the extraction of the pages left.
+    """
+    with ThreadPool(max(1, min(max_workers, len(page_ranges)))) as pool:
+        yield from pool.imap(lambda page_range: extract_pages(pdf_path, output_folder, page_range), page_ranges)
+
+
+def extract_indicators(text):
+    """Extracts the indicators from the text with the extractIndicators command, as a dict of type to indicators"""
+    try:
+        indicators_map = json.loads(demisto.executeCommand("extractIndicators", {"text": text})[0][u"Contents"])
+    except json.JSONDecodeError:
+        return {}
+    return indicators_map if isinstance(indicators_map, dict) else {}
+
+
+def merge_indicators_maps(indicators_map, other_indicators_map):
+    """Adds the indicators of other_indicators_map which are missing in indicators_map to it"""
+    for indicator_type, indicators in other_indicators_map.items():
+        merged_indicators = indicators_map.setdefault(indicator_type, [])
+        known_indicators = set(merged_indicators)
+        for indicator in indicators:
+            if indicator not in known_indicators:
+                known_indicators.add(indicator)
+                merged_indicators.append(indicator)
+    return indicators_map
+
+
+def read_pdf_pages(pdf_path, output_folder, pages, max_pages=None, max_text_size=None,
+                   max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Reads the text of the pdf, and the URLs and emails in its html content, in ranges of pages (see iter_pdf_pages).
+    The indicators in the text of each range are extracted as soon as it is read, while the next ranges are extracted.
+    Reading stops after max_pages pages, or once the text reaches max_text_size bytes. The text is then cut at
+    max_text_size bytes, and the pages left are not extracted.
+
+    Returns:
+        The text, the indicators extracted from it, the URLs and emails in the html content, the folders of the page
+        ranges (which hold their images), and whether the pdf was truncated.
+    """
+    # without the number of pages, the whole pdf is extracted at once
+    page_ranges = get_page_ranges(pages, max_pages) if pages else [(None, None)]
+    truncated = bool(max_pages and pages > max_pages)
+    texts: List[str] = []
+    text_size = 0
+    text_indicators_map: Dict[str, list] = {}
+    urls_set = set()
+    emails_set = set()
+    chunk_folders = []
+    for chunk_folder, chunk_text, html_content, warnings in iter_pdf_pages(pdf_path, output_folder, page_ranges,
+                                                                           max_workers):
+        for warning in warnings:
+            demisto.debug(warning)
+        chunk_folders.append(chunk_folder)
+        encoded_text = chunk_text.encode('utf-8')
+        if max_text_size and text_size + len(encoded_text) > max_text_size:
+            chunk_text = encoded_text[:max_text_size - text_size].decode('utf-8', 'ignore')
+            truncated = True
+        text_size += len(encoded_text)
+        texts.append(chunk_text)
+        if chunk_text.strip():
+            merge_indicators_maps(text_indicators_map, extract_indicators(chunk_text))
+        urls_set.update(re.findall(urlRegex, html_content))
+        emails_set.update(re.findall(EMAIL_REGXEX, html_content))
+        if max_text_size and text_size >= max_text_size:
+            # closing the generator stops the extraction of the pages left
+            truncated = truncated or len(chunk_folders) < len(page_ranges)
+            break
+    return ''.join(texts), text_indicators_map, urls_set, emails_set, chunk_folders, truncated
+
+
+def build_readpdf_entry_object(pdf_file, metadata, text, urls, emails, images, text_indicators_map=None,
+                               truncated=False):
+    """
+    Builds an entry object for the main script flow.
+    If text_indicators_map is given, it holds the indicators already extracted from the text, which is then not
+    sent to extractIndicators again.
+    """
     # Add Text to file entity
     pdf_file["Text"] = text
+    pdf_file["Truncated"] = truncated
 
     # Add Metadata to file entity
     for k in metadata.keys():
@@ -171,6 +303,8 @@ def build_readpdf_entry_object(pdf_file, metadata, text, urls, emails, images):
     md += "\n* ".join([f'{str(k["Data"])}' for k in urls])
 
     md += "\n### Text"
+    if truncated:
+        md += "\nThe PDF file is too large, so only the text of its first pages was extracted."
     md += f"\n{text}"
     results = [{"Type": entryTypes["note"],
                 "ContentsFormat": formats["markdown"],
@@ -190,7 +324,7 @@ def build_readpdf_entry_object(pdf_file, metadata, text, urls, emails, images):
     if metadata:
         for k, v in metadata.items():
             all_pdf_data += str(v)
-    if text:
+    if text and text_indicators_map is None:
         all_pdf_data += text
     if urls:
         for u in urls:
@@ -201,10 +335,13 @@ def build_readpdf_entry_object(pdf_file, metadata, text, urls, emails, images):
     try:
         indicators_map = demisto.executeCommand("extractIndicators", {"text": all_pdf_data})[0][u"Contents"]
         indicators_map = json.loads(indicators_map)
-        if emails:
-            indicators_map["Email"] = emails
     except json.JSONDecodeError:
         pass
+    if text_indicators_map:
+        indicators_map = merge_indicators_maps(text_indicators_map,
+                                               indicators_map if isinstance(indicators_map, dict) else {})
+    if emails and isinstance(indicators_map, dict):
+        indicators_map["Email"] = emails
     ec = build_readpdf_entry_context(indicators_map)
     results.append({
         "Type": entryTypes["note"],
@@ -234,11 +371,14 @@ def build_readpdf_entry_context(indicators_map):
 
 def get_urls_from_binary_file(file_path):
     """Reading from the binary pdf in the pdf_text_output_path and returns a list of the urls in the file"""
-    with open(file_path, 'rb') as file:
+    binary_file_urls = set()
+    if not os.path.getsize(file_path):
+        return binary_file_urls
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
         # the urls usually appear in the form: '/URI (url)'
-        urls = re.findall(r'/URI ?\((.*?)\)', str(file.read()))
+        # the file is searched in place, and only the matches are converted to their escaped str form
+        urls = [str(url)[2:-1] for url in re.findall(rb'/URI ?\((.*?)\)', file_map, re.DOTALL)]
 
-    binary_file_urls = set()
     # make sure the urls match the url regex
     for url in urls:
         mached_url = re.findall(urlRegex, url)
@@ -259,6 +399,12 @@ def main():
     urls_ec = []
     emails_ec = []
     folders_to_remove = []
+    try:
+        max_pages = int(demisto.args().get('maxPages') or 0)
+        max_text_size = int(demisto.args().get('maxTextSize') or 0)
+        max_workers = int(demisto.args().get('maxWorkers') or DEFAULT_MAX_WORKERS)
+    except ValueError:
+        return_error("Values provided for maxPages, maxTextSize and maxWorkers must be integers")
     try:
         path = demisto.getFilePath(entry_id).get('path')
         if path:
@@ -279,20 +425,18 @@ def main():
                 # Get urls from the binary file
                 binary_file_urls = get_urls_from_binary_file(cpy_file_path)
 
-                # Get text:
-                pdf_text_output_path = f'{output_folder}/PDFText.txt'
-                text = get_pdf_text(cpy_file_path, pdf_text_output_path)
-
-                # Get URLS + emails:
-                pdf_html_content = get_pdf_htmls_content(cpy_file_path, output_folder)
-                urls = re.findall(urlRegex, pdf_html_content)
-                urls_set = set(urls)
-                emails_set = set(re.findall(EMAIL_REGXEX, pdf_html_content))
+                # Get text + URLS + emails, page by page:
+                try:
+                    pages = int(metadata.get('Pages', 0))
+                except ValueError:
+                    pages = 0
+                text, text_indicators_map, urls_set, emails_set, chunk_folders, truncated = read_pdf_pages(
+                    cpy_file_path, output_folder, pages, max_pages, max_text_size, max_workers)
 
                 urls_set = urls_set.union(binary_file_urls)
 
                 # this url is always generated with the pdf html file, and that's why we remove it
-                urls_set.remove('http://www.w3.org/1999/xhtml')
+                urls_set.discard('http://www.w3.org/1999/xhtml')
                 for url in urls_set:
                     if re.match(emailRegex, url):
                         emails_set.add(url)
@@ -303,7 +447,7 @@ def main():
                     emails_ec.append(email)
 
                 # Get images:
-                images = get_images_paths_in_path(output_folder)
+                images = [image for chunk_folder in chunk_folders for image in get_images_paths_in_path(chunk_folder)]
             except Exception as e:
                 demisto.results({
                     "Type": entryTypes["error"],
@@ -311,7 +455,8 @@ def main():
                     "Contents": f"Could not load pdf file in EntryID {entry_id}\nError: {str(e)}"
                 })
                 raise e
-            readpdf_entry_object = build_readpdf_entry_object(pdf_file, metadata, text, urls_ec, emails_ec, images)
+            readpdf_entry_object = build_readpdf_entry_object(pdf_file, metadata, text, urls_ec, emails_ec, images,
+                                                              text_indicators_map, truncated)
             demisto.results(readpdf_entry_object)
         else:
             demisto.results({
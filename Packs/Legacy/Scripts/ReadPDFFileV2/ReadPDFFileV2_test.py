@@ -159,3 +159,119 @@ def test_get_urls_from_binary_file():
     from ReadPDFFileV2 import get_urls_from_binary_file
     urls = get_urls_from_binary_file(f'{CWD}/text-with-images.pdf')
     assert len(urls) == 10
+
+
+def test_get_page_ranges(mocker):
+    import ReadPDFFileV2
+    from ReadPDFFileV2 import get_page_ranges
+    mocker.patch.object(ReadPDFFileV2, 'PAGES_PER_CHUNK', 10)
+    assert get_page_ranges(25) == [(1, 10), (11, 20), (21, 25)]
+    assert get_page_ranges(25, max_pages=12) == [(1, 10), (11, 12)]
+    assert get_page_ranges(5, max_pages=12) == [(1, 5)]
+
+
+def mock_extract_pages(pdf_path, output_folder, page_range):
+    first_page, last_page = page_range
+    text = ''.join(f'page {page} 1.1.1.{page}\n\f' for page in range(first_page, last_page + 1))
+    html = ''.join(f'<a href="http://www.example{page}.com">user{page}@example.com</a>'
+                   for page in range(first_page, last_page + 1))
+    warnings = [f'warning of page {first_page}'] if first_page == 1 else []
+    return f'{output_folder}/pages_{first_page}', text, html, warnings
+
+
+def mock_extract_indicators(command, args):
+    import json
+    import re
+    return [{u'Contents': json.dumps({'IP': re.findall(r'1\.1\.1\.\d+', args['text'])})}]
+
+
+def test_read_pdf_pages(mocker):
+    """
+    Given:
+        A pdf file with 25 pages.
+    When:
+        Reading its pages in ranges of 10 pages, in 2 workers.
+    Then:
+        The text, URLs and emails of all the pages are returned in page order, the indicators of the text are
+        extracted once per range, and the warnings of the ranges are logged.
+    """
+    import ReadPDFFileV2
+    from ReadPDFFileV2 import read_pdf_pages
+    mocker.patch.object(ReadPDFFileV2, 'PAGES_PER_CHUNK', 10)
+    mocker.patch.object(ReadPDFFileV2, 'extract_pages', side_effect=mock_extract_pages)
+    execute_command = mocker.patch.object(demisto, 'executeCommand', side_effect=mock_extract_indicators)
+    debug = mocker.patch.object(demisto, 'debug')
+    text, indicators_map, urls, emails, chunk_folders, truncated = read_pdf_pages('ReadPDF.pdf', 'ReadPDF', 25,
+                                                                                  max_workers=2)
+    assert text == ''.join(f'page {page} 1.1.1.{page}\n\f' for page in range(1, 26))
+    assert indicators_map == {'IP': [f'1.1.1.{page}' for page in range(1, 26)]}
+    assert execute_command.call_count == 3
+    assert len(urls) == 25
+    assert 'user25@example.com' in emails
+    assert chunk_folders == ['ReadPDF/pages_1', 'ReadPDF/pages_11', 'ReadPDF/pages_21']
+    assert not truncated
+    # the warnings of the workers are logged by the main thread
+    debug.assert_called_once_with('warning of page 1')
+
+
+def test_read_pdf_pages_truncated(mocker):
+    """
+    Given:
+        A pdf file with 25 pages.
+    When:
+        Reading it with a budget of pages, or of text bytes.
+    Then:
+        Only the pages within the budget are read, and the pdf is marked as truncated.
+    """
+    import ReadPDFFileV2
+    from ReadPDFFileV2 import read_pdf_pages
+    mocker.patch.object(ReadPDFFileV2, 'PAGES_PER_CHUNK', 10)
+    extract_pages = mocker.patch.object(ReadPDFFileV2, 'extract_pages', side_effect=mock_extract_pages)
+    mocker.patch.object(demisto, 'executeCommand', side_effect=mock_extract_indicators)
+
+    text, indicators_map, _, _, chunk_folders, truncated = read_pdf_pages('ReadPDF.pdf', 'ReadPDF', 25, max_pages=12,
+                                                                          max_workers=1)
+    assert text.count('\f') == 12
+    assert indicators_map == {'IP': [f'1.1.1.{page}' for page in range(1, 13)]}
+    assert extract_pages.call_count == 2
+    assert truncated
+
+    text, _, _, _, chunk_folders, truncated = read_pdf_pages('ReadPDF.pdf', 'ReadPDF', 25, max_text_size=200,
+                                                             max_workers=1)
+    assert text == ''.join(f'page {page} 1.1.1.{page}\n\f' for page in range(1, 26))[:200]
+    assert chunk_folders == ['ReadPDF/pages_1', 'ReadPDF/pages_11']
+    assert truncated
+
+
+def test_build_readpdf_entry_object_with_text_indicators(mocker):
+    """
+    Given:
+        Indicators which were already extracted from the text of a truncated pdf.
+    When:
+        Building the entry object.
+    Then:
+        Only the metadata and URLs are sent to extractIndicators, the indicators are merged and the file is marked
+        as truncated.
+    """
+    from ReadPDFFileV2 import build_readpdf_entry_object
+    execute_command = mocker.patch.object(demisto, 'executeCommand',
+                                          return_value=[{u'Contents': '{"IP": ["1.1.1.1", "2.2.2.2"]}'}])
+    res = build_readpdf_entry_object({}, {'Title': 'title'}, 'text 1.1.1.1', [], ['user@example.com'], [],
+                                     text_indicators_map={'IP': ['1.1.1.1']}, truncated=True)
+    assert execute_command.call_args[0][1] == {'text': 'title'}
+    assert res[0]['EntryContext']['File(val.EntryID == obj.EntryID)']['Truncated'] is True
+    assert 'only the text of its first pages was extracted' in res[0]['HumanReadable']
+    assert res[-1]['Contents'] == {'IP': ['1.1.1.1', '2.2.2.2'], 'Email': ['user@example.com']}
+
+
+def test_run_shell_command_warnings(mocker):
+    from ReadPDFFileV2 import run_shell_command
+    debug = mocker.patch.object(demisto, 'debug')
+    warnings: list = []
+    assert run_shell_command('sh', '-c', 'echo text; echo warning >&2', warnings=warnings) == 'text\n'
+    assert len(warnings) == 1
+    assert 'warning' in warnings[0]
+    assert not debug.called
+
+    run_shell_command('sh', '-c', 'echo warning >&2')
+    assert debug.call_count == 1
@@ -1,11 +1,11 @@
 
-from YaraScan import main
+import os
+import YaraScan
+from YaraScan import main, scanFiles
 import demistomock as demisto
 from CommonServerPython import entryTypes
 
-
-def test_main(mocker):
-    rule = '''rule PE_file_identifier
+rule = '''rule PE_file_identifier
 {
     meta:
         author = "Adam Burt"
@@ -19,6 +19,9 @@ def test_main(mocker):
         $MZ at 0
 }'''
 
+
+def test_main(mocker):
+
     def executeCommand(name, args=None):
         if name == 'getFilePath':
             return [
@@ -46,3 +49,96 @@ def test_main(mocker):
     assert results[0]['Type'] == entryTypes['note']
     assert results[0]['Contents'][0]['HasMatch']
     assert results[0]['Contents'][0]['Matches'][0]['RuleName'] == 'PE_file_identifier'
+
+
+def test_scan_files_parallel(mocker, tmpdir):
+    """
+    Given
+    - A PE file and a text file, and a rule which matches PE files.
+
+    When
+    - Scanning the files in 2 threads.
+
+    Then
+    - Ensure the results are in the order of the files, with the scan time of each file.
+    - Ensure the compiled rules were cached on disk, and are loaded on the next scan.
+    """
+    mocker.patch.object(YaraScan, 'YARA_CACHE_DIR', str(tmpdir.join('cache')))
+    text_file = tmpdir.join('file.txt')
+    text_file.write('not a PE file')
+    fileInfos = [
+        {'name': 'unzip.exe', 'id': '1', 'path': 'test_data/unzip.exe', 'entryID': '1@1'},
+        {'name': 'file.txt', 'id': '2', 'path': str(text_file), 'entryID': '2@1'},
+        {'name': 'missing.exe', 'id': '3', 'path': str(tmpdir.join('missing.exe')), 'entryID': '3@1'},
+    ]
+    results = scanFiles(fileInfos, rule, maxWorkers=2)
+    assert [result['entryID'] for result in results] == ['1@1', '2@1', '3@1']
+    assert [result['HasMatch'] for result in results] == [True, False, False]
+    assert [result['HasError'] for result in results] == [False, False, True]
+    assert all(result['ScanTime'] >= 0 for result in results)
+    assert len(os.listdir(str(tmpdir.join('cache')))) == 1
+
+    compile_rules = mocker.spy(YaraScan.yara, 'compile')
+    results = scanFiles(fileInfos, rule, maxWorkers=1)
+    assert [result['HasMatch'] for result in results] == [True, False, False]
+    assert compile_rules.call_count == 0
+
+
+def test_scan_files_invalid_rule(mocker, tmpdir):
+    """
+    Given
+    - A rule with a syntax error.
+
+    When
+    - Scanning files with it.
+
+    Then
+    - Ensure every file has the compilation error.
+    """
+    mocker.patch.object(YaraScan, 'YARA_CACHE_DIR', str(tmpdir))
+    fileInfos = [
+        {'name': 'unzip.exe', 'id': '1', 'path': 'test_data/unzip.exe', 'entryID': '1@1'},
+        {'name': 'unzip2.exe', 'id': '2', 'path': 'test_data/unzip.exe', 'entryID': '2@1'},
+    ]
+    results = scanFiles(fileInfos, 'rule invalid {', maxWorkers=2)
+    assert [result['HasError'] for result in results] == [True, True]
+    assert all(result['Errors'] for result in results)
+
+
+def test_scan_files_cache_write_failure(mocker, tmpdir):
+    """
+    Given
+    - A cache directory the compiled rules cannot be written to.
+
+    When
+    - Scanning a file.
+
+    Then
+    - Ensure the file is scanned with the compiled rules, and no error is reported.
+    """
+    cache_file = tmpdir.join('cache')
+    cache_file.write('not a directory')
+    mocker.patch.object(YaraScan, 'YARA_CACHE_DIR', str(cache_file))
+    fileInfos = [{'name': 'unzip.exe', 'id': '1', 'path': 'test_data/unzip.exe', 'entryID': '1@1'}]
+    results = scanFiles(fileInfos, rule)
+    assert results[0]['HasMatch']
+    assert not results[0]['HasError']
+
+
+def test_rules_cache_is_pruned(mocker, tmpdir):
+    """
+    Given
+    - A cache which holds the maximal number of compiled rule sets.
+
+    When
+    - Compiling new rules.
+
+    Then
+    - Ensure the least recently used compiled rules are removed.
+    """
+    cache_dir = tmpdir.join('cache')
+    mocker.patch.object(YaraScan, 'YARA_CACHE_DIR', str(cache_dir))
+    mocker.patch.object(YaraScan, 'YARA_CACHE_MAX_FILES', 2)
+    for i in range(3):
+        YaraScan.loadRules(rule.replace('PE_file_identifier', 'rule_{}'.format(i)))
+    assert len(os.listdir(str(cache_dir))) == 2
@@ -6,8 +6,8 @@ from CommonServerUserPython import *
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 import uuid
-import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
 # disable insecure warnings
 requests.packages.urllib3.disable_warnings()
@@ -19,6 +19,9 @@ if not demisto.params().get('port'):
 URL = demisto.params()['server'].rstrip('/:') + ':' + demisto.params().get('port') + '/api/'
 API_KEY = str(demisto.params().get('key'))
 USE_SSL = not demisto.params().get('insecure')
+# User-ID messages (tag registration) are sent in chunks of entries, a few chunks at a time
+UID_MESSAGE_CHUNK_SIZE = 1000
+UID_MESSAGE_MAX_WORKERS = 4
 
 # determine a vsys or a device-group
 VSYS = demisto.params().get('vsys')
@@ -109,10 +112,35 @@ class PAN_OS_Not_Found(Exception):
         pass
 
 
+class PAN_OS_Message(Exception):
+    """ A PAN-OS response which is returned to the war room as a message, and not as an error. """
+    def __init__(self, message: str, is_warning: bool = False):
+        super().__init__(message)
+        self.is_warning = is_warning
+
+
 def http_request(uri: str, method: str, headers: Dict = {},
                  body: Dict = {}, params: Dict = {}, files=None) -> Any:
     """
-    Makes an API call with the given arguments
+    Makes an API call with the given arguments.
+    Responses which are returned as a message (e.g. the IPs are already registered) end the command.
+    """
+    try:
+        return send_http_request(uri, method, headers, body, params, files)
+    except PAN_OS_Message as e:
+        if e.is_warning:
+            return_warning(str(e), True)
+        else:
+            demisto.results(str(e))
+            sys.exit(0)
+
+
+def send_http_request(uri: str, method: str, headers: Dict = {},
+                      body: Dict = {}, params: Dict = {}, files=None) -> Any:
+    """
+    Makes an API call with the given arguments.
+    Responses which are returned as a message (e.g. the IPs are already registered) raise PAN_OS_Message,
+    so unlike http_request, it does not write to the war room and does not exit, and can run in worker threads.
     """
     result = requests.request(
         method,
@@ -131,7 +159,7 @@ def http_request(uri: str, method: str, headers: Dict = {},
     if params.get('type') == 'export':
         return result
 
-    json_result = json.loads(xml2json(result.text))
+    json_result = xml2dict(result.text)
 
     # handle non success
     if json_result['response']['@status'] != 'success':
@@ -155,8 +183,7 @@ def http_request(uri: str, method: str, headers: Dict = {},
 
             # catch already at the top/bottom error for rules and return this as an entry.note
             elif str(json_result['response']['msg']['line']).find('already at the') != -1:
-                demisto.results('Rule ' + str(json_result['response']['msg']['line']))
-                sys.exit(0)
+                raise PAN_OS_Message('Rule ' + str(json_result['response']['msg']['line']))
 
             # catch already registered ip tags and return this as an entry.note
             elif str(json_result['response']['msg']['line']).find('already exists, ignore') != -1:
@@ -166,14 +193,12 @@ def http_request(uri: str, method: str, headers: Dict = {},
                            json_result['response']['msg']['line']['uid-response']['payload']['register']['entry']]
                 else:
                     ips = json_result['response']['msg']['line']['uid-response']['payload']['register']['entry']['@ip']
-                demisto.results(
+                raise PAN_OS_Message(
                     'IP ' + str(ips) + ' already exist in the tag. All submitted IPs were not registered to the tag.')
-                sys.exit(0)
 
             # catch timed out log queries and return this as an entry.note
             elif str(json_result['response']['msg']['line']).find('Query timed out') != -1:
-                demisto.results(str(json_result['response']['msg']['line']) + '. Rerun the query.')
-                sys.exit(0)
+                raise PAN_OS_Message(str(json_result['response']['msg']['line']) + '. Rerun the query.')
 
         if '@code' in json_result['response']:
             raise Exception(
@@ -193,7 +218,7 @@ def http_request(uri: str, method: str, headers: Dict = {},
                                       f' The available Device Groups for this instance:'
                                       f' {", ".join(device_group_names)}.')
                     raise PAN_OS_Not_Found(error_message)
-            return_warning('List not found and might be empty', True)
+            raise PAN_OS_Message('List not found and might be empty', is_warning=True)
         if json_result['response']['@code'] not in ['19', '20']:
             # error code non exist in dict and not of success
             if 'msg' in json_result['response']:
@@ -3037,7 +3062,7 @@ def panorama_list_pcaps_command():
         raise Exception('can not provide dlp-pcap without password')
 
     result = http_request(URL, 'GET', params=params)
-    json_result = json.loads(xml2json(result.text))['response']
+    json_result = xml2dict(result.text)['response']
     if json_result['@status'] != 'success':
         raise Exception('Request to get list of Pcaps Failed.\nStatus code: ' + str(
             json_result['response']['@code']) + '\nWith message: ' + str(json_result['response']['msg']['line']))
@@ -3547,26 +3572,105 @@ def panorama_refresh_edl_command():
 ''' IP Tags '''
 
 
-@logger
-def panorama_register_ip_tag(tag: str, ips: List, persistent: str):
-    entry: str = ''
-    for ip in ips:
-        entry += f'<entry ip=\"{ip}\" persistent=\"{persistent}\"><tag><member>{tag}</member></tag></entry>'
+def send_uid_message(payload: str) -> Dict:
+    """
+    Sends a User-ID message. The message is sent in the body of the request and not in the URL,
+    so its size is not limited by the maximal URL length.
 
-    params = {
+    Args:
+        payload: The payload of the message, e.g. <register>...</register>.
+
+    Returns:
+        The response of the firewall.
+    """
+    body = {
         'type': 'user-id',
-        'cmd': '<uid-message><version>2.0</version><type>update</type><payload><register>' + entry
-               + '</register></payload></uid-message>',
+        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload>{payload}</payload></uid-message>',
         'key': API_KEY
     }
+    return send_http_request(URL, 'POST', body=body)
 
-    result = http_request(
-        URL,
-        'POST',
-        params=params,
-    )
 
-    return result
+def send_uid_message_in_chunks(payload_type: str, entries: List[str], chunk_size: int = UID_MESSAGE_CHUNK_SIZE,
+                               max_workers: int = UID_MESSAGE_MAX_WORKERS) -> List[Dict]:
+    """
+    Sends the entries of a User-ID message in chunks, which are sent concurrently.
+    A chunk that fails does not stop the other chunks. The chunks are sent without writing to the war room,
+    and their results are returned to be reported by the calling command.
+
+    Args:
+        payload_type: The type of the payload, e.g. register or unregister.
+        entries: The entries of the payload.
+        chunk_size: The maximal number of entries to send in a single message.
+        max_workers: The maximal number of messages to send at a time.
+
+    Returns:
+        A report per chunk, with the index of its first entry, its number of entries,
+        whether it succeeded, and the response of the firewall or the error. If the error is a message
+        which is returned as a note (e.g. the IPs are already registered), Note is true.
+    """
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be at least 1.')
+    chunks = list(batch(entries, batch_size=chunk_size))
+
+    def send_chunk(chunk_index: int) -> Dict:
+        chunk = chunks[chunk_index]
+        report: Dict[str, Any] = {'Chunk': chunk_index + 1, 'Start': chunk_index * chunk_size, 'Entries': len(chunk)}
+        try:
+            report['Response'] = send_uid_message(f'<{payload_type}>{"".join(chunk)}</{payload_type}>')
+            report['Success'] = True
+        except PAN_OS_Message as e:
+            report['Success'] = False
+            report['Error'] = str(e)
+            report['Note'] = not e.is_warning
+        except Exception as e:
+            report['Success'] = False
+            report['Error'] = str(e)
+        return report
+
+    if max_workers <= 1 or len(chunks) <= 1:
+        return [send_chunk(chunk_index) for chunk_index in range(len(chunks))]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        return list(executor.map(send_chunk, range(len(chunks))))
+
+
+def get_uid_message_results(reports: List[Dict], values: List[str], success_message: str) -> Tuple[List[str], str]:
+    """
+    Gets the results of a User-ID message that was sent in chunks.
+
+    Args:
+        reports: The reports of the chunks, as returned from send_uid_message_in_chunks.
+        values: The values (e.g. IPs) the entries of the message were built from, in the same order.
+        success_message: The human readable message to return if all the chunks succeeded.
+
+    Returns:
+        The values of the chunks that succeeded, and the human readable.
+    """
+    failed_reports = [report for report in reports if not report['Success']]
+    if failed_reports and len(failed_reports) == len(reports):
+        if all(report.get('Note') for report in failed_reports):
+            # e.g. all the IPs are already registered, which is returned as a note and not as an error
+            demisto.results(failed_reports[0]['Error'])
+            sys.exit(0)
+        raise Exception(failed_reports[0]['Error'])
+
+    succeeded_values = [value for report in reports if report['Success']
+                        for value in values[report['Start']:report['Start'] + report['Entries']]]
+    if failed_reports:
+        human_readable = f'{len(failed_reports)} of {len(reports)} chunks failed. ' \
+                         f'{len(succeeded_values)} of {len(values)} entries were sent successfully.'
+    else:
+        human_readable = success_message
+    if len(reports) > 1:
+        human_readable += '\n' + tableToMarkdown('Chunks', reports, headers=['Chunk', 'Entries', 'Success', 'Error'],
+                                                 removeNull=True)
+    return succeeded_values, human_readable
+
+
+@logger
+def panorama_register_ip_tag(tag: str, ips: List, persistent: str, chunk_size: int = UID_MESSAGE_CHUNK_SIZE):
+    entries = [f'<entry ip=\"{ip}\" persistent=\"{persistent}\"><tag><member>{tag}</member></tag></entry>' for ip in ips]
+    return send_uid_message_in_chunks('register', entries, chunk_size)
 
 
 def panorama_register_ip_tag_command():
@@ -3575,11 +3679,13 @@ def panorama_register_ip_tag_command():
     """
     tag = demisto.args()['tag']
     ips = argToList(demisto.args()['IPs'])
+    chunk_size = int(demisto.args().get('chunk_size', UID_MESSAGE_CHUNK_SIZE))
 
     persistent = demisto.args()['persistent'] if 'persistent' in demisto.args() else 'true'
     persistent = '1' if persistent == 'true' else '0'
 
-    result = panorama_register_ip_tag(tag, ips, str(persistent))
+    result = panorama_register_ip_tag(tag, ips, str(persistent), chunk_size)
+    registered_ips, human_readable = get_uid_message_results(result, ips, 'Registered ip-tag successfully')
 
     registered_ip: Dict[str, str] = {}
     # update context only if IPs are persistent
@@ -3588,9 +3694,9 @@ def panorama_register_ip_tag_command():
         context_ips = demisto.dt(demisto.context(), 'Panorama.DynamicTags(val.Tag ==\"' + tag + '\").IPs')
 
         if context_ips:
-            all_ips = ips + context_ips
+            all_ips = registered_ips + context_ips
         else:
-            all_ips = ips
+            all_ips = registered_ips
 
         registered_ip = {
             'Tag': tag,
@@ -3601,8 +3707,8 @@ def panorama_register_ip_tag_command():
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Registered ip-tag successfully',
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable,
         'EntryContext': {
             "Panorama.DynamicTags(val.Tag == obj.Tag)": registered_ip
         }
@@ -3610,24 +3716,9 @@ def panorama_register_ip_tag_command():
 
 
 @logger
-def panorama_unregister_ip_tag(tag: str, ips: list):
-    entry = ''
-    for ip in ips:
-        entry += '<entry ip=\"' + ip + '\"><tag><member>' + tag + '</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': '<uid-message><version>2.0</version><type>update</type><payload><unregister>' + entry
-               + '</unregister></payload></uid-message>',
-        'key': API_KEY
-    }
-    result = http_request(
-        URL,
-        'POST',
-        params=params,
-    )
-
-    return result
+def panorama_unregister_ip_tag(tag: str, ips: list, chunk_size: int = UID_MESSAGE_CHUNK_SIZE):
+    entries = ['<entry ip=\"' + ip + '\"><tag><member>' + tag + '</member></tag></entry>' for ip in ips]
+    return send_uid_message_in_chunks('unregister', entries, chunk_size)
 
 
 def panorama_unregister_ip_tag_command():
@@ -3636,15 +3727,17 @@ def panorama_unregister_ip_tag_command():
     """
     tag = demisto.args()['tag']
     ips = argToList(demisto.args()['IPs'])
+    chunk_size = int(demisto.args().get('chunk_size', UID_MESSAGE_CHUNK_SIZE))
 
-    result = panorama_unregister_ip_tag(tag, ips)
+    result = panorama_unregister_ip_tag(tag, ips, chunk_size)
+    _, human_readable = get_uid_message_results(result, ips, 'Unregistered ip-tag successfully')
 
     demisto.results({
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Unregistered ip-tag successfully'
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable
     })
 
 
@@ -3652,25 +3745,9 @@ def panorama_unregister_ip_tag_command():
 
 
 @logger
-def panorama_register_user_tag(tag: str, users: List):
-    entry: str = ''
-    for user in users:
-        entry += f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload><register-user>{entry}'
-               f'</register-user></payload></uid-message>',
-        'key': API_KEY
-    }
-
-    result = http_request(
-        URL,
-        'POST',
-        params=params,
-    )
-
-    return result
+def panorama_register_user_tag(tag: str, users: List, chunk_size: int = UID_MESSAGE_CHUNK_SIZE):
+    entries = [f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>' for user in users]
+    return send_uid_message_in_chunks('register-user', entries, chunk_size)
 
 
 def panorama_register_user_tag_command():
@@ -3682,16 +3759,18 @@ def panorama_register_user_tag_command():
         raise Exception('The panorama-register-user-tag command is only available for PAN-OS 9.X and above versions.')
     tag = demisto.args()['tag']
     users = argToList(demisto.args()['Users'])
+    chunk_size = int(demisto.args().get('chunk_size', UID_MESSAGE_CHUNK_SIZE))
 
-    result = panorama_register_user_tag(tag, users)
+    result = panorama_register_user_tag(tag, users, chunk_size)
+    registered_users, human_readable = get_uid_message_results(result, users, 'Registered user-tag successfully')
 
     # get existing Users for this tag
     context_users = demisto.dt(demisto.context(), 'Panorama.DynamicTags(val.Tag ==\"' + tag + '\").Users')
 
     if context_users:
-        all_users = users + context_users
+        all_users = registered_users + context_users
     else:
-        all_users = users
+        all_users = registered_users
 
     registered_user = {
         'Tag': tag,
@@ -3702,8 +3781,8 @@ def panorama_register_user_tag_command():
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Registered user-tag successfully',
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable,
         'EntryContext': {
             "Panorama.DynamicTags(val.Tag == obj.Tag)": registered_user
         }
@@ -3711,24 +3790,9 @@ def panorama_register_user_tag_command():
 
 
 @logger
-def panorama_unregister_user_tag(tag: str, users: list):
-    entry = ''
-    for user in users:
-        entry += f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload><unregister-user>{entry}'
-               f'</unregister-user></payload></uid-message>',
-        'key': API_KEY
-    }
-    result = http_request(
-        URL,
-        'POST',
-        params=params,
-    )
-
-    return result
+def panorama_unregister_user_tag(tag: str, users: list, chunk_size: int = UID_MESSAGE_CHUNK_SIZE):
+    entries = [f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>' for user in users]
+    return send_uid_message_in_chunks('unregister-user', entries, chunk_size)
 
 
 def panorama_unregister_user_tag_command():
@@ -3740,15 +3804,17 @@ def panorama_unregister_user_tag_command():
         raise Exception('The panorama-unregister-user-tag command is only available for PAN-OS 9.X and above versions.')
     tag = demisto.args()['tag']
     users = argToList(demisto.args()['Users'])
+    chunk_size = int(demisto.args().get('chunk_size', UID_MESSAGE_CHUNK_SIZE))
 
-    result = panorama_unregister_user_tag(tag, users)
+    result = panorama_unregister_user_tag(tag, users, chunk_size)
+    _, human_readable = get_uid_message_results(result, users, 'Unregistered user-tag successfully')
 
     demisto.results({
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Unregistered user-tag successfully'
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable
     })
 
 
@@ -197,3 +197,89 @@ def test_validate_search_time():
     with pytest.raises(Exception):
         assert validate_search_time('219/12/26 00:00:00')
         assert validate_search_time('219/10/35')
+
+
+def test_send_uid_message_in_chunks(mocker):
+    import Panorama
+    mocker.patch.object(Panorama, 'send_http_request', return_value={'response': {'@status': 'success'}})
+    entries = [f'<entry ip="1.1.1.{i}"/>' for i in range(25)]
+    reports = Panorama.send_uid_message_in_chunks('register', entries, chunk_size=10)
+    assert [(report['Chunk'], report['Start'], report['Entries'], report['Success']) for report in reports] == \
+        [(1, 0, 10, True), (2, 10, 10, True), (3, 20, 5, True)]
+
+    # the message is sent in the body of the request, and not in the URL
+    cmds = sorted(call[1]['body']['cmd'] for call in Panorama.send_http_request.call_args_list)
+    assert all(call[1].get('params') is None for call in Panorama.send_http_request.call_args_list)
+    assert ''.join(cmds).count('<entry ') == 25
+    assert cmds[0].startswith('<uid-message><version>2.0</version><type>update</type><payload><register><entry ')
+
+
+def test_send_uid_message_in_chunks_messages(mocker):
+    """
+    Given
+    - A chunk whose IPs are already registered, which PAN-OS returns as a message, and a chunk which succeeds.
+
+    When
+    - Sending the chunks concurrently.
+
+    Then
+    - Ensure the chunks do not write to the war room or exit, and the message is reported as a note of its chunk.
+    """
+    import Panorama
+    already_exists = 'IP 1.1.1.0 already exist in the tag. All submitted IPs were not registered to the tag.'
+
+    def send_http_request(uri, method, body=None, **kwargs):
+        if '1.1.1.0' in body['cmd']:
+            raise Panorama.PAN_OS_Message(already_exists)
+        return {'response': {'@status': 'success'}}
+
+    mocker.patch.object(Panorama, 'send_http_request', side_effect=send_http_request)
+    mocker.patch.object(demisto, 'results')
+    entries = [f'<entry ip="1.1.1.{i}"/>' for i in range(2)]
+    reports = Panorama.send_uid_message_in_chunks('register', entries, chunk_size=1)
+    assert [(report['Success'], report.get('Note')) for report in reports] == [(False, True), (True, None)]
+    assert reports[0]['Error'] == already_exists
+    assert not demisto.results.called
+
+
+def test_send_uid_message_in_chunks_invalid_chunk_size():
+    from Panorama import send_uid_message_in_chunks
+    with pytest.raises(ValueError, match='at least 1'):
+        send_uid_message_in_chunks('register', ['<entry ip="1.1.1.1"/>'], chunk_size=0)
+
+
+def test_get_uid_message_results_notes(mocker):
+    """
+    Given
+    - Chunks which all returned a message which is returned as a note.
+
+    When
+    - Getting the results of the message.
+
+    Then
+    - Ensure the note is returned to the war room and the command ends, as when the message is sent at once.
+    """
+    from Panorama import get_uid_message_results
+    mocker.patch.object(demisto, 'results')
+    reports = [{'Chunk': 1, 'Start': 0, 'Entries': 1, 'Success': False, 'Error': 'IP already exist', 'Note': True}]
+    with pytest.raises(SystemExit):
+        get_uid_message_results(reports, ['1.1.1.1'], 'Registered ip-tag successfully')
+    demisto.results.assert_called_once_with('IP already exist')
+
+
+def test_get_uid_message_results():
+    from Panorama import get_uid_message_results
+    ips = ['1.1.1.1', '1.1.1.2', '1.1.1.3']
+    reports = [{'Chunk': 1, 'Start': 0, 'Entries': 2, 'Success': True},
+               {'Chunk': 2, 'Start': 2, 'Entries': 1, 'Success': False, 'Error': 'Request Failed.'}]
+    registered_ips, human_readable = get_uid_message_results(reports, ips, 'Registered ip-tag successfully')
+    assert registered_ips == ['1.1.1.1', '1.1.1.2']
+    assert human_readable.startswith('1 of 2 chunks failed. 2 of 3 entries were sent successfully.')
+    assert '| 2 | 1 | false | Request Failed. |' in human_readable
+
+    registered_ips, human_readable = get_uid_message_results(reports[:1], ips[:2], 'Registered ip-tag successfully')
+    assert registered_ips == ['1.1.1.1', '1.1.1.2']
+    assert human_readable == 'Registered ip-tag successfully'
+
+    with pytest.raises(Exception, match='Request Failed.'):
+        get_uid_message_results(reports[1:], ips[2:], 'Registered ip-tag successfully')
@@ -2,7 +2,6 @@ import demistomock as demisto
 from CommonServerPython import *
 from CommonServerUserPython import *
 
-import json
 import shutil
 import requests
 from typing import Dict, Any
@@ -116,7 +115,7 @@ def http_request(url, method, headers=None, body=None, params=None, files=None):
     if result.headers['Content-Type'] == 'application/octet-stream':
         return result
     try:
-        json_res = json.loads(xml2json(result.text))
+        json_res = xml2dict(result.text)
         return json_res
     except Exception:
         raise Exception(f'Failed to parse response to json. response: {result.text}')
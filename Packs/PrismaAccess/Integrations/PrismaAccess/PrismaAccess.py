@@ -237,7 +237,7 @@ def http_request(uri: str, method: str, headers: Dict = {},
     if params.get('type') == 'export':
         return result
 
-    json_result = json.loads(xml2json(result.text))
+    json_result = xml2dict(result.text)
 
     # handle non success
     if json_result['response']['@status'] != 'success':
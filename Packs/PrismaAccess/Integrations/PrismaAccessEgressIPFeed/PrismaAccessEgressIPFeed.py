@@ -216,8 +216,7 @@ def main():
 
         elif command == 'fetch-indicators':
             indicators = fetch_indicators_command(client)
-            for iter_ in batch(indicators, batch_size=2000):
-                demisto.createIndicators(iter_)
+            create_indicators_in_batches(indicators)
 
         else:
             raise NotImplementedError(f'Command {command} is not implemented.')
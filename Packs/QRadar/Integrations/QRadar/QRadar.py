@@ -9,6 +9,7 @@ import urllib
 import re
 from requests.exceptions import HTTPError, ConnectionError
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 
 # disable insecure warnings
 requests.packages.urllib3.disable_warnings()
@@ -26,6 +27,8 @@ if TOKEN:
     AUTH_HEADERS['SEC'] = str(TOKEN)
 OFFENSES_PER_CALL = int(demisto.params().get('offensesPerCall', 50))
 OFFENSES_PER_CALL = 50 if OFFENSES_PER_CALL > 50 else OFFENSES_PER_CALL
+BULK_LOAD_CHUNK_SIZE = 5000
+BULK_LOAD_MAX_WORKERS = 5
 
 if not TOKEN and not (USERNAME and PASSWORD):
     raise Exception('Either credentials or auth token should be provided.')
@@ -1007,7 +1010,8 @@ def update_reference_set_value_command():
     if args.get('date_value') == 'True':
         values = [date_to_timestamp(value, date_format="%Y-%m-%dT%H:%M:%S.%f000Z") for value in values]
     if len(values) > 1:
-        raw_ref = upload_indicators_list_request(args.get('ref_name'), values)
+        raw_ref = upload_indicators_list_in_chunks(args.get('ref_name'), values,
+                                                   int(args.get('chunk_size', BULK_LOAD_CHUNK_SIZE)))
     elif len(values) == 1:
         raw_ref = update_reference_set_value(args.get('ref_name'), values[0], args.get('source'))
     else:
@@ -1085,6 +1089,47 @@ def upload_indicators_list_request(reference_name, indicators_list):
     return send_request('POST', url, params=params, data=json.dumps(indicators_list))
 
 
+def upload_indicators_list_in_chunks(reference_name, indicators_list, chunk_size=BULK_LOAD_CHUNK_SIZE,
+                                     max_workers=BULK_LOAD_MAX_WORKERS):
+    """
+        Upload indicators list to the reference set with the bulk load endpoint, in chunks which are uploaded concurrently
+
+        Args:
+              reference_name (str): Reference set name
+              indicators_list (list): Indicators values list
+              chunk_size (int): The maximal number of values to upload in a single request
+              max_workers (int): The maximal number of chunks to upload at a time
+        Returns:
+            dict: Reference set object
+    """
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be at least 1.')
+    chunks = list(batch(indicators_list, batch_size=chunk_size))
+
+    def upload_chunk(chunk):
+        try:
+            return upload_indicators_list_request(reference_name, chunk)
+        except Exception as e:
+            return e
+
+    if max_workers <= 1 or len(chunks) <= 1:
+        results = [upload_chunk(chunk) for chunk in chunks]
+    else:
+        pool = ThreadPool(min(max_workers, len(chunks)))
+        try:
+            results = pool.map(upload_chunk, chunks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise Exception('Failed to upload {0} of {1} chunks to reference set {2}. {3}'.format(
+            len(errors), len(chunks), reference_name, errors[0]))
+    # the chunks are uploaded concurrently, so the latest reference set object is the one with the most elements
+    return max(results, key=lambda ref: ref.get('number_of_elements', 0))
+
+
 def upload_indicators_command():
     """
         The function finds indicators according to user query and updates QRadar reference set
@@ -1115,7 +1160,8 @@ def upload_indicators_command():
         if len(indicators_values_list) == 0:
             return "No indicators found, Reference set {0} didn't change".format(reference_name), {}, {}
         else:
-            raw_response = upload_indicators_list_request(reference_name, indicators_values_list)
+            raw_response = upload_indicators_list_in_chunks(reference_name, indicators_values_list,
+                                                            int(args.get('chunk_size', BULK_LOAD_CHUNK_SIZE)))
             ref_set_data = unicode_to_str_recur(get_ref_set(reference_name))
             ref = replace_keys(ref_set_data, REFERENCE_NAMES_MAP)
             enrich_reference_set_result(ref)
@@ -279,6 +279,70 @@ def test_upload_indicators_command_no_indicators_found(mocker):
     assert res == "No indicators found, Reference set test_ref_set didn't change"
 
 
+def test_upload_indicators_list_in_chunks(mocker):
+    """
+    Given:
+        - A list of 25 values
+    When:
+        - Uploading it to a reference set in chunks of 10 values
+    Then:
+        - The values are uploaded with the bulk load endpoint in 3 chunks
+        - The reference set object with the most elements is returned
+    """
+    import QRadar as qradar
+    uploaded = []
+
+    def upload(reference_name, chunk):
+        uploaded.extend(chunk)
+        return {'name': reference_name, 'number_of_elements': len(uploaded)}
+
+    mocker.patch.object(qradar, 'upload_indicators_list_request', side_effect=upload)
+    values = [str(i) for i in range(25)]
+    ref = qradar.upload_indicators_list_in_chunks('test_ref_set', values, chunk_size=10)
+    assert sorted(len(call[0][1]) for call in qradar.upload_indicators_list_request.call_args_list) == [5, 10, 10]
+    assert sorted(uploaded) == sorted(values)
+    assert ref == {'name': 'test_ref_set', 'number_of_elements': 25}
+
+
+def test_upload_indicators_list_in_chunks_failure(mocker):
+    """
+    Given:
+        - A list of 30 values, and a QRadar server which fails to load the second chunk
+    When:
+        - Uploading it to a reference set in chunks of 10 values
+    Then:
+        - All the chunks are uploaded, and the error reports how many chunks failed
+    """
+    import QRadar as qradar
+
+    def upload(reference_name, chunk):
+        if '10' in chunk:
+            raise Exception('QRadar Error Code: 1005')
+        return {'name': reference_name, 'number_of_elements': 10}
+
+    mocker.patch.object(qradar, 'upload_indicators_list_request', side_effect=upload)
+    with pytest.raises(Exception, match='Failed to upload 1 of 3 chunks to reference set test_ref_set. QRadar Error Code: 1005'):
+        qradar.upload_indicators_list_in_chunks('test_ref_set', [str(i) for i in range(30)], chunk_size=10)
+    assert qradar.upload_indicators_list_request.call_count == 3
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test_upload_indicators_list_in_chunks_invalid_chunk_size(mocker, chunk_size):
+    """
+    Given:
+        - A chunk size smaller than 1
+    When:
+        - Uploading a list of values to a reference set in chunks
+    Then:
+        - A ValueError is raised, and nothing is uploaded
+    """
+    import QRadar as qradar
+    mocker.patch.object(qradar, 'upload_indicators_list_request')
+    with pytest.raises(ValueError, match='at least 1'):
+        qradar.upload_indicators_list_in_chunks('test_ref_set', ['1.1.1.1'], chunk_size=chunk_size)
+    assert qradar.upload_indicators_list_request.call_count == 0
+
+
 """ CONSTANTS """
 REQUEST_HEADERS = {'Content-Type': 'application/json', 'SEC': 'token'}
 NON_URL_SAFE_MSG = 'non-safe/;/?:@=&"<>#%{}|\\^~[] `'
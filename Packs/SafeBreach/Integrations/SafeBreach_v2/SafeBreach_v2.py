@@ -868,8 +868,7 @@ def main():
         elif command == 'fetch-indicators':
             indicators = get_indicators_command(client, insight_category_filter, insight_data_type_filter,
                                                 demisto.args())
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)  # type: ignore
+            create_indicators_in_batches(indicators)
             demisto.results('ok')
         elif command == 'safebreach-get-indicators':
             indicators = get_indicators_command(client, insight_category_filter, insight_data_type_filter,
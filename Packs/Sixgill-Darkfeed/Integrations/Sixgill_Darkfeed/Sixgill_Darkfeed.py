@@ -220,8 +220,7 @@ def main():
     try:
         if demisto.command() == 'fetch-indicators':
             indicators = fetch_indicators_command(client)
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)
+            create_indicators_in_batches(indicators)
         else:
             readable_output, outputs, raw_response = commands[command](client, demisto.args())
 
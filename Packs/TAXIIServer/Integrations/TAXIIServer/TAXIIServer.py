@@ -5,9 +5,12 @@ from gevent.pywsgi import WSGIServer
 from urllib.parse import urlparse, ParseResult
 from tempfile import NamedTemporaryFile
 from base64 import b64decode
-from typing import Callable, List, Generator
+from typing import Callable, Iterator, List, Generator, Optional, Tuple
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 from multiprocessing import Process
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+from itertools import islice
 
 from libtaxii.messages_11 import (
     TAXIIMessage,
@@ -17,7 +20,9 @@ from libtaxii.messages_11 import (
     CollectionInformation,
     CollectionInformationResponse,
     PollRequest,
+    PollFulfillmentRequest,
     PollingServiceInstance,
+    StatusMessage,
     ServiceInstance,
     ContentBlock,
     generate_message_id,
@@ -26,10 +31,14 @@ from libtaxii.constants import (
     MSG_COLLECTION_INFORMATION_REQUEST,
     MSG_DISCOVERY_REQUEST,
     MSG_POLL_REQUEST,
+    MSG_POLL_FULFILLMENT_REQUEST,
     SVC_DISCOVERY,
     SVC_COLLECTION_MANAGEMENT,
     SVC_POLL,
-    CB_STIX_XML_11
+    CB_STIX_XML_11,
+    ST_BAD_MESSAGE,
+    ST_FAILURE,
+    ST_NOT_FOUND
 )
 from cybox.core import Observable
 
@@ -58,6 +67,18 @@ PAGE_SIZE = 200
 APP: Flask = Flask('demisto-taxii')
 NAMESPACE_URI = 'https://www.paloaltonetworks.com/cortex'
 NAMESPACE = 'cortex'
+# a thread that renders a page of indicators to STIX while the next page is searched. Rendering holds the GIL,
+# so a single thread is used - it only overlaps with the wait for the search results from the server
+RENDER_POOL: Optional[ThreadPool] = None
+# the number of multi-part poll results kept for poll fulfillment requests
+MAX_POLL_RESULTS = 1000
+
+
+class NotFoundError(ValueError):
+    """
+    Raised when the collection or the poll result a request asks for does not exist.
+    """
+    pass
 
 
 ''' Log Handler '''
@@ -80,7 +101,7 @@ class Handler:
 
 class TAXIIServer:
     def __init__(self, host: str, port: int, collections: dict, certificate: str, private_key: str,
-                 http_server: bool, credentials: dict):
+                 http_server: bool, credentials: dict, result_part_size: int = 0):
         """
         Class for a TAXII Server configuration.
         Args:
@@ -91,6 +112,7 @@ class TAXIIServer:
             private_key: The private key for SSL.
             http_server: Whether to use HTTP server (not SSL).
             credentials: The user credentials.
+            result_part_size: The maximum number of indicators in a poll response part, 0 for a single part.
         """
         self.host = host
         self.port = port
@@ -101,6 +123,9 @@ class TAXIIServer:
         self.auth = None
         if credentials:
             self.auth = (credentials.get('identifier', ''), credentials.get('password', ''))
+        self.result_part_size = result_part_size
+        # result ID -> the collection and time frame of a multi-part poll result
+        self.poll_results: OrderedDict = OrderedDict()
 
         self.service_instances = [
             {
@@ -191,26 +216,76 @@ class TAXIIServer:
 
     def get_poll_response(self, taxii_message: PollRequest) -> Response:
         """
-        Handle poll request.
+        Handle poll request and poll fulfillment request.
         Args:
-            taxii_message: The poll request message.
+            taxii_message: The poll request or poll fulfillment request message.
 
         Returns:
             The poll response.
         """
+        taxii_feeds = list(self.collections.keys())
+        collection_name = taxii_message.collection_name
+
+        if taxii_message.message_type == MSG_POLL_FULFILLMENT_REQUEST:
+            return self.get_poll_fulfillment_response(taxii_feeds, taxii_message)
+
         if taxii_message.message_type != MSG_POLL_REQUEST:
             raise ValueError('Invalid message, invalid Message Type')
 
-        taxii_feeds = list(self.collections.keys())
-        collection_name = taxii_message.collection_name
         exclusive_begin_time = taxii_message.exclusive_begin_timestamp_label
         inclusive_end_time = taxii_message.inclusive_end_timestamp_label
 
         return self.stream_stix_data_feed(taxii_feeds, taxii_message.message_id, collection_name,
                                           exclusive_begin_time, inclusive_end_time)
 
+    def get_poll_fulfillment_response(self, taxii_feeds: list, taxii_message: PollFulfillmentRequest) -> Response:
+        """
+        Handle poll fulfillment request, which asks for a part of a multi-part poll result.
+        Args:
+            taxii_feeds: The available taxii feeds according to the collections.
+            taxii_message: The poll fulfillment request message.
+
+        Returns:
+            The poll response of the requested result part.
+        """
+        poll_result = self.poll_results.get(taxii_message.result_id)
+        if not poll_result or poll_result['collection_name'] != taxii_message.collection_name:
+            raise NotFoundError('Invalid message, unknown result ID')
+
+        result_part_number = int(taxii_message.result_part_number)
+        if result_part_number < 1:
+            raise ValueError('Invalid message, invalid result part number')
+
+        return self.stream_stix_data_feed(taxii_feeds, taxii_message.message_id, taxii_message.collection_name,
+                                          poll_result['exclusive_begin_time'], poll_result['inclusive_end_time'],
+                                          result_id=taxii_message.result_id, result_part_number=result_part_number)
+
+    def save_poll_result(self, collection_name: str, exclusive_begin_time: datetime,
+                         inclusive_end_time: datetime) -> str:
+        """
+        Keep the collection and time frame of a multi-part poll result, so the next parts cover the same indicators.
+        Args:
+            collection_name: The collection name.
+            exclusive_begin_time: The query exclusive begin time.
+            inclusive_end_time: The query inclusive end time.
+
+        Returns:
+            The result ID.
+        """
+        result_id = str(uuid.uuid4())
+        self.poll_results[result_id] = {
+            'collection_name': collection_name,
+            'exclusive_begin_time': exclusive_begin_time,
+            'inclusive_end_time': inclusive_end_time
+        }
+        while len(self.poll_results) > MAX_POLL_RESULTS:
+            self.poll_results.popitem(last=False)
+
+        return result_id
+
     def stream_stix_data_feed(self, taxii_feeds: list, message_id: str, collection_name: str,
-                              exclusive_begin_time: datetime, inclusive_end_time: datetime) -> Response:
+                              exclusive_begin_time: datetime, inclusive_end_time: datetime,
+                              result_id: Optional[str] = None, result_part_number: int = 1) -> Response:
         """
         Get the indicator query results in STIX data feed format.
         Args:
@@ -219,16 +294,30 @@ class TAXIIServer:
             collection_name: The collection name to get the indicator query from.
             exclusive_begin_time: The query exclusive begin time.
             inclusive_end_time: The query inclusive end time.
+            result_id: The ID of the multi-part poll result, if already created.
+            result_part_number: The number of the result part to get.
 
         Returns:
             Stream of STIX indicator data feed.
         """
         if collection_name not in taxii_feeds:
-            raise ValueError('Invalid message, unknown feed')
+            raise NotFoundError('Invalid message, unknown feed')
 
         if not inclusive_end_time:
             inclusive_end_time = datetime.utcnow().replace(tzinfo=pytz.utc)
 
+        indicator_query = self.collections[str(collection_name)]
+        offset = 0
+        limit = None
+        more = False
+        if self.result_part_size:
+            offset = (result_part_number - 1) * self.result_part_size
+            limit = self.result_part_size
+            more = has_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time,
+                                                offset + limit)
+            if more and not result_id:
+                result_id = self.save_poll_result(collection_name, exclusive_begin_time, inclusive_end_time)
+
         def yield_response() -> Generator:
             """
 
@@ -236,12 +325,14 @@ class TAXIIServer:
 
             """
             # yield the opening tag of the Poll Response
+            result_id_attribute = f' result_id="{result_id}"' if result_id else ''
             response = '<taxii_11:Poll_Response xmlns:taxii="http://taxii.mitre.org/messages/taxii_xml_binding-1"' \
                        ' xmlns:taxii_11="http://taxii.mitre.org/messages/taxii_xml_binding-1.1" ' \
                        'xmlns:tdq="http://taxii.mitre.org/query/taxii_default_query-1"' \
                        f' message_id="{generate_message_id()}"' \
                        f' in_response_to="{message_id}"' \
-                       f' collection_name="{collection_name}" more="false" result_part_number="1"> ' \
+                       f' collection_name="{collection_name}" more="{str(more).lower()}"' \
+                       f' result_part_number="{result_part_number}"{result_id_attribute}> ' \
                        f'<taxii_11:Inclusive_End_Timestamp>{inclusive_end_time.isoformat()}' \
                        '</taxii_11:Inclusive_End_Timestamp>'
 
@@ -251,21 +342,17 @@ class TAXIIServer:
 
             yield response
 
-            # yield the content blocks
-            indicator_query = self.collections[str(collection_name)]
-
-            for indicator in find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time):
-                try:
-                    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
-                    content_block = ContentBlock(
-                        content_binding=CB_STIX_XML_11,
-                        content=stix_xml_indicator
-                    )
-
-                    content_xml = content_block.to_xml().decode('utf-8')
-                    yield f'{content_xml}\n'
-                except Exception as e:
-                    handle_long_running_error(f'Failed parsing indicator to STIX: {e}')
+            # yield the content blocks - a page is rendered by the render thread while the next one is searched
+            indicators = find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time,
+                                                       offset=offset, limit=limit)
+            get_rendered_page: Optional[Callable] = None
+            for page in iterate_pages(indicators, PAGE_SIZE):
+                get_next_rendered_page = start_rendering(page)
+                if get_rendered_page:
+                    yield from yield_content_blocks(get_rendered_page())
+                get_rendered_page = get_next_rendered_page
+            if get_rendered_page:
+                yield from yield_content_blocks(get_rendered_page())
 
             # yield the closing tag
 
@@ -570,7 +657,6 @@ def get_stix_indicator(indicator: dict) -> stix.core.STIXPackage:
         confidence = 'Low'
         indicator_score = indicator.get('score')
         if indicator_score is None:
-            demisto.error(f'indicator without score: {value}')
             stix_indicator.confidence = "Unknown"
         else:
             score = int(indicator.get('score', 0))
@@ -719,16 +805,36 @@ def get_collections(params: dict = demisto.params()) -> dict:
     return collections
 
 
-def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime) -> list:
+def get_result_part_size(params: dict = demisto.params()) -> int:
     """
-    Find indicators according to a query and begin time/end time.
+    Gets the maximum number of indicators in a poll response part from the integration parameters.
+    """
+    result_part_size: str = params.get('result_part_size', '')
+    if not result_part_size:
+        return 0
+
+    try:
+        part_size = int(result_part_size)
+    except ValueError:
+        raise ValueError('The maximum indicators per poll response part must be an integer.')
+
+    if part_size <= 0:
+        return 0
+
+    # the parts are searched in whole pages
+    return -(-part_size // PAGE_SIZE) * PAGE_SIZE
+
+
+def get_time_frame_query(indicator_query: str, begin_time: datetime, end_time: datetime) -> str:
+    """
+    Add a time frame to an indicator query.
     Args:
         indicator_query: The indicator query.
         begin_time: The exclusive begin time.
         end_time: The inclusive end time.
 
     Returns:
-        Indicator query results from Demisto.
+        The indicator query of the time frame.
     """
 
     if indicator_query:
@@ -744,31 +850,138 @@ def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, en
     if end_time:
         tz_end_time = datetime.strftime(end_time, '%Y-%m-%dT%H:%M:%S %z')
         indicator_query += f'sourcetimestamp:<="{tz_end_time}"'
+
+    return indicator_query
+
+
+def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime,
+                                  offset: int = 0, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Find indicators according to a query and begin time/end time.
+    Args:
+        indicator_query: The indicator query.
+        begin_time: The exclusive begin time.
+        end_time: The inclusive end time.
+        offset: The index of the first indicator to find, a multiple of the page size.
+        limit: The maximum number of indicators to find, None for all of them.
+
+    Returns:
+        Indicator query results from Demisto.
+    """
+    indicator_query = get_time_frame_query(indicator_query, begin_time, end_time)
     demisto.info(f'Querying indicators by: {indicator_query}')
 
-    return find_indicators_loop(indicator_query)
+    return find_indicators_loop(indicator_query, offset=offset, limit=limit)
+
+
+def has_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime,
+                                 offset: int) -> bool:
+    """
+    Check whether a query and begin time/end time has indicators beyond an offset.
+    Args:
+        indicator_query: The indicator query.
+        begin_time: The exclusive begin time.
+        end_time: The inclusive end time.
+        offset: The index of the indicator to look for.
+
+    Returns:
+        True if the indicator at the offset exists, False otherwise.
+    """
+    indicator_query = get_time_frame_query(indicator_query, begin_time, end_time)
+    # a page of a single indicator starts right at the offset
+    return bool(demisto.searchIndicators(query=indicator_query, page=offset, size=1).get('iocs'))
 
 
-def find_indicators_loop(indicator_query: str):
+def find_indicators_loop(indicator_query: str, offset: int = 0, limit: Optional[int] = None) -> Iterator[dict]:
     """
-    Find indicators in a loop according to a query.
+    Find indicators according to a query, fetching a page at a time while the results are consumed.
     Args:
         indicator_query: The indicator query.
+        offset: The index of the first indicator to find, a multiple of the page size.
+        limit: The maximum number of indicators to find, None for all of them.
 
     Returns:
         Indicator query results from Demisto.
     """
-    iocs: List[dict] = []
-    total_fetched = 0
-    next_page = 0
-    last_found_len = PAGE_SIZE
-    while last_found_len == PAGE_SIZE:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs
+    return iter(IndicatorsSearcher(query=indicator_query, page=offset // PAGE_SIZE, page_size=PAGE_SIZE, limit=limit))
+
+
+def iterate_pages(indicators: Iterator[dict], page_size: int) -> Iterator[List[dict]]:
+    """
+    Group indicators into pages, without reading ahead of the current page.
+    Args:
+        indicators: The indicators.
+        page_size: The number of indicators in a page.
+
+    Returns:
+        The pages of indicators.
+    """
+    page = list(islice(indicators, page_size))
+    while page:
+        yield page
+        page = list(islice(indicators, page_size))
+
+
+def render_content_blocks(indicators: List[dict]) -> List[Tuple[str, str]]:
+    """
+    Render indicators to STIX content blocks. Runs in the render thread, so it must not call demisto.
+    Args:
+        indicators: The Demisto indicators.
+
+    Returns:
+        A (content block XML, error) pair per indicator, the content block is empty if rendering failed.
+    """
+    content_blocks = []
+    for indicator in indicators:
+        try:
+            stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
+            content_block = ContentBlock(
+                content_binding=CB_STIX_XML_11,
+                content=stix_xml_indicator
+            )
+
+            content_xml = content_block.to_xml().decode('utf-8')
+            error = '' if indicator.get('score') is not None else f'indicator without score: {indicator.get("value")}'
+            content_blocks.append((f'{content_xml}\n', error))
+        except Exception as e:
+            content_blocks.append(('', f'Failed parsing indicator to STIX: {e}'))
+
+    return content_blocks
+
+
+def start_rendering(indicators: List[dict]) -> Callable[[], List[Tuple[str, str]]]:
+    """
+    Start rendering indicators to STIX content blocks, in the render thread if it is running.
+    Args:
+        indicators: The Demisto indicators.
+
+    Returns:
+        A function that waits for the rendering and returns its results.
+    """
+    if RENDER_POOL is None:
+        return lambda: render_content_blocks(indicators)
+
+    async_result = RENDER_POOL.apply_async(render_content_blocks, (indicators,))
+
+    return async_result.get
+
+
+def yield_content_blocks(content_blocks: List[Tuple[str, str]]) -> Generator:
+    """
+    Yield rendered STIX content blocks and report their errors.
+    Args:
+        content_blocks: The (content block XML, error) pairs.
+
+    Returns:
+        The content blocks XML.
+    """
+    for content_xml, error in content_blocks:
+        if not content_xml:
+            handle_long_running_error(error)
+            continue
+        if error:
+            demisto.error(error)
+        yield content_xml
 
 
 def taxii_make_response(taxii_message: TAXIIMessage):
@@ -848,7 +1061,23 @@ def taxii_poll_service() -> Response:
         handle_long_running_error(error)
         return make_response(error, 400)
 
-    return SERVER.get_poll_response(taxii_message)
+    try:
+        return SERVER.get_poll_response(taxii_message)
+    except NotFoundError as e:
+        status_type = ST_NOT_FOUND
+        error = str(e)
+    except ValueError as e:
+        status_type = ST_BAD_MESSAGE
+        error = str(e)
+    except Exception as e:
+        status_type = ST_FAILURE
+        error = f'Could not perform the polling request: {str(e)}'
+        handle_long_running_error(error)
+
+    return taxii_make_response(StatusMessage(message_id=generate_message_id(),
+                                             in_response_to=taxii_message.message_id,
+                                             status_type=status_type,
+                                             message=error))
 
 
 ''' COMMAND FUNCTIONS '''
@@ -864,6 +1093,7 @@ def run_server(taxii_server: TAXIIServer, is_test=False):
     Start the taxii server.
     """
 
+    global RENDER_POOL
     certificate_path = str()
     private_key_path = str()
     ssl_args = dict()
@@ -893,6 +1123,7 @@ def run_server(taxii_server: TAXIIServer, is_test=False):
             time.sleep(5)
             server_process.terminate()
         else:
+            RENDER_POOL = ThreadPool(1)
             wsgi_server.serve_forever()
     except SSLError as e:
         ssl_err_message = f'Failed to validate certificate and/or private key: {str(e)}'
@@ -902,6 +1133,9 @@ def run_server(taxii_server: TAXIIServer, is_test=False):
         handle_long_running_error(f'An error occurred: {str(e)}')
         raise ValueError(str(e))
     finally:
+        if RENDER_POOL is not None:
+            RENDER_POOL.terminate()
+            RENDER_POOL = None
         if certificate_path:
             os.unlink(certificate_path)
         if private_key_path:
@@ -916,6 +1150,7 @@ def main():
     command = demisto.command()
     port = get_port(params)
     collections = get_collections(params)
+    result_part_size = get_result_part_size(params)
     server_links = demisto.demistoUrls()
     server_link_parts: ParseResult = urlparse(server_links.get('server'))
 
@@ -936,7 +1171,7 @@ def main():
         host_name = get_https_hostname(host_name)
 
     SERVER = TAXIIServer(f'{scheme}://{host_name}', port, collections,
-                         certificate, private_key, http_server, credentials)
+                         certificate, private_key, http_server, credentials, result_part_size)
 
     demisto.debug(f'Command being called is {command}')
     commands = {
@@ -386,7 +386,7 @@ def test_find_indicators_by_time_frame(mocker):
     import pytz
     from TAXIIServer import find_indicators_by_time_frame
 
-    def find_indicators(indicator_query):
+    def find_indicators(indicator_query, offset=0, limit=None):
         if indicator_query == INDICATOR_QUERY:
             return 'yep'
         return 'nope'
@@ -412,13 +412,81 @@ def test_find_indicators_loop(mocker):
     mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
 
     # Arrange
-    indicators = find_indicators_loop('q')
+    indicators = list(find_indicators_loop('q'))
 
     # Assert
     assert len(indicators) == 1
     assert indicators[0]['value'] == '52.218.100.20'
 
 
+def test_find_indicators_loop_result_part(mocker):
+    import TAXIIServer
+    from TAXIIServer import find_indicators_loop
+
+    # Set
+    mocker.patch.object(TAXIIServer, 'PAGE_SIZE', 1)
+    search = mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
+
+    # Arrange
+    indicators = list(find_indicators_loop('q', offset=2, limit=2))
+
+    # Assert
+    assert len(indicators) == 2
+    assert [call[1]['page'] for call in search.call_args_list] == [2, 3]
+
+
+@pytest.mark.parametrize('result_part_size, expected', [('', 0), ('0', 0), ('200', 200), ('1000', 1000), ('250', 400)])
+def test_get_result_part_size(result_part_size, expected):
+    from TAXIIServer import get_result_part_size
+
+    assert get_result_part_size({'result_part_size': result_part_size}) == expected
+
+
+def test_poll_fulfillment_unknown_result_id():
+    from TAXIIServer import TAXIIServer, MSG_POLL_FULFILLMENT_REQUEST
+    from libtaxii.messages_11 import PollFulfillmentRequest
+
+    # Set
+    server = TAXIIServer('localhost', 1337, {'Collection': 'type:IP'}, '', '', True, {}, result_part_size=200)
+    server.save_poll_result('Collection', None, None)
+    poll_fulfillment = PollFulfillmentRequest('1', collection_name='Collection', result_id='unknown',
+                                              result_part_number=2)
+
+    # Assert
+    assert poll_fulfillment.message_type == MSG_POLL_FULFILLMENT_REQUEST
+    with pytest.raises(ValueError, match='unknown result ID'):
+        server.get_poll_response(poll_fulfillment)
+
+
+def test_poll_service_unknown_result_id(mocker):
+    import TAXIIServer
+    from TAXIIServer import APP
+    from libtaxii.constants import ST_NOT_FOUND
+    from libtaxii.messages_11 import PollFulfillmentRequest, get_message_from_xml
+
+    # Set
+    server = TAXIIServer.TAXIIServer('localhost', 1337, {'Collection': 'type:IP'}, '', '', True, {},
+                                     result_part_size=200)
+    mocker.patch.object(TAXIIServer, 'SERVER', server, create=True)
+    poll_fulfillment = PollFulfillmentRequest('1', collection_name='Collection', result_id='expired',
+                                              result_part_number=2)
+    headers = {
+        'X-TAXII-Content-Type': 'urn:taxii.mitre.org:message:xml:1.1',
+        'X-TAXII-Protocol': 'urn:taxii.mitre.org:protocol:http:1.0',
+        'X-TAXII-Services': 'urn:taxii.mitre.org:services:1.1'
+    }
+
+    # Arrange
+    response = APP.test_client().post('/taxii-poll-service', data=poll_fulfillment.to_xml(), headers=headers)
+    status_message = get_message_from_xml(response.data)
+
+    # Assert
+    assert response.status_code == 200
+    assert status_message.in_response_to == '1'
+    assert status_message.status_type == ST_NOT_FOUND
+    assert 'unknown result ID' in status_message.message
+
+
 @pytest.mark.parametrize('indicator',
                          [json.loads(IP_INDICATORS)['iocs'][0], json.loads(URL_INDICATORS)['iocs'][0],
                           json.loads(EMAIL_INDICATORS)['iocs'][0], json.loads(CIDR_INDICATORS)['iocs'][0],
@@ -1,4 +1,4 @@
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List
 from collections import defaultdict
 import demistomock as demisto
 from CommonServerPython import *
@@ -9,6 +9,7 @@ requests.packages.urllib3.disable_warnings()
 
 XFORCE_URL = 'https://exchange.xforce.ibmcloud.com'
 DEFAULT_THRESHOLD = 7
+MAX_CONCURRENT_REQUESTS = 10
 DBOT_SCORE_KEY = 'DBotScore(val.Indicator == obj.Indicator && val.Vendor == obj.Vendor)'
 
 
@@ -28,25 +29,45 @@ class Client(BaseClient):
         super().__init__(url, verify=use_ssl, proxy=use_proxy, headers={'Accept': 'application/json'},
                          auth=(api_key, password))
 
-    def ip_report(self, ip: str) -> dict:
-        if not is_ip_valid(ip):
+    def get_many(self, url_suffixes: List[str]) -> List[Any]:
+        """
+        Sends GET requests concurrently.
+
+        Args:
+            url_suffixes (List[str]): the API endpoints to request.
+
+        Returns:
+            List[Any]: the responses, in the order of the endpoints.
+        """
+        responses = self._bulk_http_request([{'method': 'GET', 'url_suffix': url_suffix} for url_suffix in url_suffixes],
+                                            max_workers=MAX_CONCURRENT_REQUESTS)
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return responses
+
+    def ip_reports(self, ips: List[str]) -> List[dict]:
+        if not all(is_ip_valid(ip) for ip in ips):
             raise DemistoException('The given IP was invalid')
 
-        return self._http_request('GET', f'/ipr/{ip}')
+        return self.get_many([f'/ipr/{ip}' for ip in ips])
 
     def url_report(self, url: str) -> dict:
         return self._http_request('GET', f'/url/{url}').get('result')
 
-    def cve_report(self, code: str) -> dict:
-        return self._http_request('GET', f'/vulnerabilities/search/{code}')
+    def url_reports(self, urls: List[str]) -> List[dict]:
+        return [report.get('result') for report in self.get_many([f'/url/{url}' for url in urls])]
+
+    def cve_reports(self, codes: List[str]) -> List[dict]:
+        return self.get_many([f'/vulnerabilities/search/{code}' for code in codes])
 
     def search_cves(self, q: str, start_date: str, end_date: str, bookmark: str) -> dict:
         params = {'q': q, 'startDate': start_date, 'endDate': end_date, 'bookmark': bookmark}
         params = {key: value for key, value in params.items() if value}
         return self._http_request('GET', '/vulnerabilities/fulltext', params=params)
 
-    def file_report(self, file_hash: str) -> dict:
-        return self._http_request('GET', f'/malware/{file_hash}').get('malware')
+    def file_reports(self, file_hashes: List[str]) -> List[dict]:
+        return [report.get('malware') for report in self.get_many([f'/malware/{file_hash}' for file_hash in file_hashes])]
 
     def get_recent_vulnerabilities(self, start_date: str, end_date: str, limit: int) -> dict:
         params = {'startDate': start_date, 'endDate': end_date, 'limit': limit}
@@ -154,8 +175,7 @@ def ip_command(client: Client, args: Dict[str, str]) -> Tuple[str, dict, Any]:
     context: dict = defaultdict(list)
     reports = []
 
-    for ip in argToList(args.get('ip')):
-        report = client.ip_report(ip)
+    for report in client.ip_reports(argToList(args.get('ip'))):
         outputs = {'Address': report['ip'],
                    'Score': report.get('score'),
                    'Geo': {'Country': report.get('geo', {}).get('country', '')}}
@@ -200,9 +220,7 @@ def domain_command(client: Client, args: Dict[str, str]) -> Tuple[str, dict, Any
     markdown = ''
     reports = []
 
-    for domain in domains:
-        report = client.url_report(domain)
-
+    for report in client.url_reports(domains):
         outputs = {'Name': report['url']}
         dbot_score = {
             'Indicator': report['url'],
@@ -247,9 +265,7 @@ def url_command(client: Client, args: Dict[str, str]) -> Tuple[str, dict, Any]:
     markdown = ''
     reports = []
 
-    for url in urls:
-        report = client.url_report(url)
-
+    for report in client.url_reports(urls):
         outputs = {'Data': report['url']}
         dbot_score = {'Indicator': report['url'], 'Type': 'url', 'Vendor': 'XFE',
                       'Score': calculate_score(report['score'], threshold)}
@@ -330,8 +346,7 @@ def cve_get_command(client: Client, args: Dict[str, str]) -> Tuple[str, dict, An
     context: Dict[str, Any] = defaultdict(list)
     reports = []
 
-    for cve_id in argToList(args.get('cve_id')):
-        report = client.cve_report(cve_id)
+    for report in client.cve_reports(argToList(args.get('cve_id'))):
         cve_markdown, cve_context, _ = get_cve_results(args['cve_id'], report[0], threshold)
 
         markdown += cve_markdown
@@ -362,8 +377,7 @@ def file_command(client: Client, args: Dict[str, str]) -> Tuple[str, dict, Any]:
     markdown = ''
     reports = []
 
-    for file_hash in argToList(args.get('file')):
-        report = client.file_report(file_hash)
+    for report in client.file_reports(argToList(args.get('file'))):
         hash_type = report['type']
 
         scores = {'high': 3, 'medium': 2, 'low': 1}
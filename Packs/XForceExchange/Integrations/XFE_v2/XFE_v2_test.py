@@ -361,6 +361,33 @@ def test_ip(requests_mock):
     assert outputs[outputPaths['ip']][0]['Address'] == MOCK_IP
 
 
+def test_ip_multiple(requests_mock):
+    """
+    Given:
+        - Several IPs, one of which is not found by X-Force Exchange
+
+    When:
+        - Running the ip command
+
+    Then:
+        - Ensure the IPs are enriched in the order given
+        - Ensure the error of the IP that was not found fails the command
+    """
+    import pytest
+    from CommonServerPython import DemistoException
+    ips = [f'1.1.1.{i}' for i in range(30)]
+    for ip in ips:
+        requests_mock.get(f'{MOCK_BASE_URL}/ipr/{ip}', json=dict(MOCK_IP_RESP, ip=ip))
+
+    client = Client(MOCK_BASE_URL, MOCK_API_KEY, MOCK_PASSWORD, True, False)
+    _, outputs, _ = ip_command(client, {'ip': ','.join(ips)})
+    assert [ip_context['Address'] for ip_context in outputs[outputPaths['ip']]] == ips
+
+    requests_mock.get(f'{MOCK_BASE_URL}/ipr/1.1.1.7', status_code=404)
+    with pytest.raises(DemistoException, match='404'):
+        ip_command(client, {'ip': ','.join(ips)})
+
+
 def test_url(requests_mock):
     requests_mock.get(f'{MOCK_BASE_URL}/url/{MOCK_URL}', json=MOCK_URL_RESP)
 
@@ -2,11 +2,19 @@ from __future__ import print_function
 
 import json
 import logging
+import time
 import uuid
 
 integrationContext = {}
 is_debug = False  # type: bool
 
+# simulation of the server stdin/stdout protocol, to measure the throughput of scripts and integrations locally:
+# each request/response call waits roundTripLatency seconds, and is counted in roundTrips.
+# in the pipelined protocol mode, log entries are fire-and-forget and do not wait for the server.
+roundTripLatency = 0.0  # type: float
+pipelinedProtocol = False  # type: bool
+roundTrips = 0  # type: int
+
 exampleIncidents = [
     {
         "Brand": "Builtin",
@@ -384,6 +392,23 @@ exampleDemistoUrls = {
 callingContext = {}
 
 
+def simulateProtocol(latency=0.0, pipelined=False):
+    """Sets the simulated round trip latency and protocol mode, and resets the round trips counter"""
+    global roundTripLatency, pipelinedProtocol, roundTrips
+    roundTripLatency = latency
+    pipelinedProtocol = pipelined
+    roundTrips = 0
+
+
+def _round_trip(is_log=False):
+    global roundTrips
+    if is_log and pipelinedProtocol:
+        return
+    roundTrips += 1
+    if roundTripLatency:
+        time.sleep(roundTripLatency)
+
+
 def params():
     return {}
 
@@ -424,23 +449,28 @@ def uniqueFile():
 
 
 def getLastRun():
+    _round_trip()
     return {"lastRun": "2018-10-24T14:13:20+00:00"}
 
 
 def setLastRun(obj):
+    _round_trip()
     return None
 
 
 def info(msg, *args):
+    _round_trip(is_log=True)
     logging.getLogger().info(msg, *args)
 
 
 def error(msg, *args):
+    _round_trip(is_log=True)
     # print to stdout so pytest fail if not mocked
     print(msg, *args)
 
 
 def debug(msg, *args):
+    _round_trip(is_log=True)
     logging.getLogger().info(msg, *args)
 
 
@@ -467,6 +497,7 @@ def investigation():
 
 
 def executeCommand(command, args):
+    _round_trip()
     commands = {
         "getIncidents": exampleIncidents,
         "getContext": exampleContext,
@@ -478,6 +509,12 @@ def executeCommand(command, args):
     return ""
 
 
+def executeCommandAsync(command, args):
+    """Runs the command at once, returns a function that returns its result"""
+    result = executeCommand(command, args)
+    return lambda: result
+
+
 def getParam(param):
     return params().get(param)
 
@@ -487,11 +524,13 @@ def getArg(arg):
 
 
 def setIntegrationContext(context):
+    _round_trip()
     global integrationContext
     integrationContext = context
 
 
 def getIntegrationContext():
+    _round_trip()
     return integrationContext
 
 
@@ -564,9 +603,11 @@ def integrationInstance():
     return ""
 
 def createIndicators(indicators_batch):
+    _round_trip()
     return ""
 
 def searchIndicators(fromdate = '', query = '', size = 100, page = 0, todate = '', value = ''):
+    _round_trip()
     return {}
 
 def getIndexHash():
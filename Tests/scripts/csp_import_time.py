@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Reports the import time of CommonServerPython, in the format of `python -X importtime`.
+The modules are sorted by their cumulative import time, so the sections that are worth loading lazily stand out.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+CONTENT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+PYTHON_PATH = [
+    os.path.join(CONTENT_ROOT, 'Tests', 'demistomock'),
+    os.path.join(CONTENT_ROOT, 'Packs', 'Base', 'Scripts', 'CommonServerPython'),
+]
+
+
+def get_import_times(python):
+    """Imports CommonServerPython in a new interpreter, and returns a (self us, cumulative us, module) tuple per module"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(PYTHON_PATH), PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run([python, '-X', 'importtime', '-c', 'import CommonServerPython'], env=env,
+                            stderr=subprocess.PIPE, check=True).stderr.decode('utf-8')
+    import_times = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        import_times.append((int(self_us), int(cumulative_us), module.rstrip()))
+
+    return import_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the import time of CommonServerPython')
+    parser.add_argument('--python', default=sys.executable, help='The python interpreter to import with')
+    parser.add_argument('--top', type=int, default=20, help='The number of modules to report')
+    parser.add_argument('--runs', type=int, default=5, help='The number of imports to take the best total of')
+    parser.add_argument('--max-ms', type=float, help='Fail if the import takes longer than this budget')
+    args = parser.parse_args()
+
+    runs = [get_import_times(args.python) for _ in range(args.runs)]
+    best_run = min(runs, key=lambda import_times: import_times[-1][1])
+    total_ms = best_run[-1][1] / 1000.0
+
+    print('import time: self [us] | cumulative | imported package')
+    for self_us, cumulative_us, module in sorted(best_run, key=lambda import_time: -import_time[1])[:args.top]:
+        print('import time: {:>9} | {:>10} | {}'.format(self_us, cumulative_us, module))
+    print('CommonServerPython import time: {:.1f}ms (best of {} runs)'.format(total_ms, args.runs))
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print('CommonServerPython import time is over the budget of {}ms'.format(args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
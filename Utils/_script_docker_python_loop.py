@@ -2,7 +2,10 @@ import os
 import threading
 import sys
 import json
+import time
+import hashlib
 import traceback
+from collections import OrderedDict
 
 if sys.version_info[0] < 3:
     import Queue as queue
@@ -12,6 +15,24 @@ else:
 __read_thread = None
 __input_queue = None
 
+# the compiled code of the recently executed scripts, keyed by a hash of the template and the script
+__code_cache = OrderedDict()
+MAX_CACHED_SCRIPTS = 32
+
+# when set, per-execution timings are written to stderr
+SCRIPT_TIMINGS = os.environ.get('DEMISTO_SCRIPT_TIMINGS', '').lower() in ('1', 'true', 'yes')
+timer = getattr(time, 'perf_counter', time.time)
+__io_wait = [0.0]
+
+# in pipelined protocol mode, log entries are sent in batched frames of up to MAX_BATCH_ENTRIES entries,
+# which are flushed when full, by a timer MAX_BATCH_DELAY seconds after the first entry was queued,
+# and before any other message or blocking read
+MAX_BATCH_ENTRIES = 100
+MAX_BATCH_DELAY = 1.0
+__pending_entries = []
+__flush_timer = [None]
+__entries_lock = threading.RLock()
+
 win = sys.platform.startswith('win')
 if win:
     __input_queue = queue.Queue()
@@ -46,6 +67,43 @@ def __readWhileAvailable():
         return buff
 
 
+def __flushEntries():
+    # the timer thread flushes as well, so the pending entries are written under the lock
+    with __entries_lock:
+        if __flush_timer[0] is not None:
+            __flush_timer[0].cancel()
+            __flush_timer[0] = None
+        if not __pending_entries:
+            return
+        json.dump({'type': 'batch', 'entries': __pending_entries}, sys.stdout)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        del __pending_entries[:]
+
+
+def __queueEntry(entry):
+    with __entries_lock:
+        __pending_entries.append(entry)
+        if len(__pending_entries) >= MAX_BATCH_ENTRIES:
+            __flushEntries()
+        elif __flush_timer[0] is None:
+            # a script that logs and then computes for a long time still has its entries sent
+            __flush_timer[0] = threading.Timer(MAX_BATCH_DELAY, __flushEntries)
+            __flush_timer[0].daemon = True
+            __flush_timer[0].start()
+
+
+def __timedReadWhileAvailable():
+    # the server may wait for the pending entries, so they are sent before blocking on a read
+    __flushEntries()
+    # the time a script waits for the server is I/O wait, not execution time
+    start = timer()
+    try:
+        return __readWhileAvailable()
+    finally:
+        __io_wait[0] += timer() - start
+
+
 """Demisto instance for scripts only"""
 
 template_code = '''
@@ -59,15 +117,17 @@ class Demisto:
 
     def __init__(self, context):
         self.callingContext = context
+        # pipelined protocol mode, negotiated by the server
+        self.__pipelined = bool(context.get(u'pipelined'))
+        self.__request_id = 0
+        self.__responses = {}
         args = self.args()
         if 'demisto_machine_learning_magic_key' in  args:
             import os
             os.environ['DEMISTO_MACHINE_LEARNING_MAGIC_KEY'] = args['demisto_machine_learning_magic_key']
 
     def log(self, msg):
-        json.dump({'type': 'entryLog', 'args': {'message': msg}}, sys.stdout)
-        sys.stdout.write('\\n')
-        sys.stdout.flush()
+        self.__send_entry({'type': 'entryLog', 'args': {'message': msg}})
 
     def investigation(self):
         return self.callingContext[u'context'][u'Inv']
@@ -115,18 +175,27 @@ class Demisto:
     def executeCommand(self, command, args):
         return self.__do({'type': 'executeCommand', 'command': command.strip(), 'args': args})
 
+    def executeCommandAsync(self, command, args):
+        """ Send a command without waiting for its result, returns a function that waits for the result """
+        cmd = {'type': 'executeCommand', 'command': command.strip(), 'args': args}
+        if not self.__pipelined:
+            result = self.__do(cmd)
+            return lambda: result
+        request_id = self.__send(cmd)
+        return lambda: self.__receive(request_id)
+
     def demistoUrls(self):
         return self.__do({'type': 'demistoUrls'})
 
     def info(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'info', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'info', 'args': argsObj})
 
     def error(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'error', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'error', 'args': argsObj})
 
     def exception(self, ex):
         return self.__do({'type': 'exception', 'command': 'exception', 'args': ex})
@@ -134,7 +203,7 @@ class Demisto:
     def debug(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'debug', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'debug', 'args': argsObj})
 
     def getAllSupportedCommands(self):
         return self.__do({'type': 'getAllModulesSupportedCmds'})
@@ -148,7 +217,40 @@ class Demisto:
     def dt(self, data, q):
         return self.__do({'type': 'dt', 'name': q, 'value': data})['result']
 
+    def __send_entry(self, entry):
+        # in pipelined mode log entries are fire-and-forget, and coalesced into batched frames
+        if self.__pipelined:
+            globals()['__queueEntry'](entry)
+        elif entry['type'] == 'log':
+            self.__do(entry)
+        else:
+            json.dump(entry, sys.stdout)
+            sys.stdout.write('\\n')
+            sys.stdout.flush()
+
+    def __send(self, cmd):
+        # in pipelined mode requests carry a correlation id, so several can be in flight at once
+        globals()['__flushEntries']()
+        self.__request_id += 1
+        cmd['id'] = self.__request_id
+        json.dump(cmd, sys.stdout)
+        sys.stdout.write('\\n')
+        sys.stdout.flush()
+        return self.__request_id
+
+    def __receive(self, request_id):
+        while request_id not in self.__responses:
+            response = json.loads(globals()['__readWhileAvailable']())
+            self.__responses[response.get('id')] = response
+        response = self.__responses.pop(request_id)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response.get('result')
+
     def __do(self, cmd):
+        if self.__pipelined:
+            return self.__receive(self.__send(cmd))
+
         # Watch out there is another defintion like this
         # prepare command to send to server
         json.dump(cmd, sys.stdout)
@@ -189,6 +291,8 @@ class Demisto:
         else:
             res.append(converted)
 
+        if self.__pipelined:
+            globals()['__flushEntries']()
         json.dump({'type': 'result', 'results': res}, sys.stdout)
         sys.stdout.write('\\n')
         sys.stdout.flush()
@@ -228,15 +332,17 @@ class Demisto:
 
     def __init__(self, context):
         self.callingContext = context
+        # pipelined protocol mode, negotiated by the server
+        self.__pipelined = bool(context.get(u'pipelined'))
+        self.__request_id = 0
+        self.__responses = {}
         args = self.args()
         if 'demisto_machine_learning_magic_key' in  args:
             import os
             os.environ['DEMISTO_MACHINE_LEARNING_MAGIC_KEY'] = args['demisto_machine_learning_magic_key']
 
     def log(self, msg):
-        json.dump({'type': 'entryLog', 'args': {'message': 'Integration log: ' + msg}}, sys.stdout)
-        sys.stdout.write('\\n')
-        sys.stdout.flush()
+        self.__send_entry({'type': 'entryLog', 'args': {'message': 'Integration log: ' + msg}})
 
     def investigation(self):
         return self.callingContext[u'context'][u'Inv']
@@ -299,17 +405,17 @@ class Demisto:
     def info(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'info', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'info', 'args': argsObj})
 
     def error(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'error', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'error', 'args': argsObj})
 
     def debug(self, *args):
         argsObj = {}
         argsObj["args"] = list(args)
-        self.__do({'type': 'log', 'command': 'debug', 'args': argsObj})
+        self.__send_entry({'type': 'log', 'command': 'debug', 'args': argsObj})
 
     def gets(self, obj, field):
         return str(self.get(obj, field))
@@ -323,7 +429,40 @@ class Demisto:
     def dt(self, data, q):
         return self.__do({'type': 'dt', 'name': q, 'value': data})['result']
 
+    def __send_entry(self, entry):
+        # in pipelined mode log entries are fire-and-forget, and coalesced into batched frames
+        if self.__pipelined:
+            globals()['__queueEntry'](entry)
+        elif entry['type'] == 'log':
+            self.__do(entry)
+        else:
+            json.dump(entry, sys.stdout)
+            sys.stdout.write('\\n')
+            sys.stdout.flush()
+
+    def __send(self, cmd):
+        # in pipelined mode requests carry a correlation id, so several can be in flight at once
+        globals()['__flushEntries']()
+        self.__request_id += 1
+        cmd['id'] = self.__request_id
+        json.dump(cmd, sys.stdout)
+        sys.stdout.write('\\n')
+        sys.stdout.flush()
+        return self.__request_id
+
+    def __receive(self, request_id):
+        while request_id not in self.__responses:
+            response = json.loads(globals()['__readWhileAvailable']())
+            self.__responses[response.get('id')] = response
+        response = self.__responses.pop(request_id)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response.get('result')
+
     def __do(self, cmd):
+        if self.__pipelined:
+            return self.__receive(self.__send(cmd))
+
         # Watch out there is another defintion like this
         json.dump(cmd, sys.stdout)
         sys.stdout.write('\\n')
@@ -356,6 +495,8 @@ class Demisto:
             res = converted
         else:
             res.append(converted)
+        if self.__pipelined:
+            globals()['__flushEntries']()
         json.dump({'type': 'result', 'results': res}, sys.stdout)
         sys.stdout.write('\\n')
         sys.stdout.flush()
@@ -410,6 +551,28 @@ def send_script_exception(exc_type, exc_value, exc_traceback):
     sys.stdout.flush()
 
 
+def send_script_timings(cached, compile_time, exec_time, io_wait):
+    json.dump({'type': 'timings', 'cached': cached, 'compile': round(compile_time * 1000, 3),
+               'exec': round(exec_time * 1000, 3), 'io_wait': round(io_wait * 1000, 3)}, sys.stderr)
+    sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+def get_compiled_code(code_string, is_integ_script):
+    # the same scripts run over and over, so the template is filled and compiled once per script
+    key = hashlib.sha256(('1' if is_integ_script else '0').encode('utf-8') + code_string.encode('utf-8')).hexdigest()
+    code = __code_cache.pop(key, None)
+    cached = code is not None
+    if not cached:
+        template = integ_template_code if is_integ_script else template_code
+        code = compile(template.replace('###CODE_HERE###', code_string), '<string>', 'exec')
+    __code_cache[key] = code
+    while len(__code_cache) > MAX_CACHED_SCRIPTS:
+        __code_cache.popitem(last=False)
+
+    return code, cached
+
+
 def send_pong():
     json.dump({'type': 'pong'}, sys.stdout)
     sys.stdout.write('\\n')
@@ -450,32 +613,45 @@ while True:
     contextJSON.pop('script', None)
 
     is_integ_script = contextJSON['integration']
-    complete_code = ''
-    if is_integ_script:
-        complete_code = integ_template_code.replace('###CODE_HERE###', code_string)
-    else:
-        complete_code = template_code.replace('###CODE_HERE###', code_string)
+    cached = False
+    compile_time = exec_time = 0.0
+    __io_wait[0] = 0.0
 
     try:
-        code = compile(complete_code, '<string>', 'exec')
+        start = timer()
+        code, cached = get_compiled_code(code_string, is_integ_script)
+        compile_time = timer() - start
 
         sub_globals = {
-            '__readWhileAvailable': __readWhileAvailable,
+            '__readWhileAvailable': __timedReadWhileAvailable,
+            '__queueEntry': __queueEntry,
+            '__flushEntries': __flushEntries,
             'context': contextJSON,
             'win': win
         }
 
-        exec(code, sub_globals, sub_globals)  # guardrails-disable-line
+        start = timer()
+        try:
+            exec(code, sub_globals, sub_globals)  # guardrails-disable-line
+        finally:
+            exec_time = timer() - start - __io_wait[0]
 
     except Exception as ex:
         exc_type, exc_value, exc_traceback = sys.exc_info()
+        __flushEntries()
         send_script_exception(exc_type, exc_value, exc_traceback)
     except SystemExit:
         # print 'Will not stop on sys.exit(0)'
         pass
 
+    # the log entries of the script are sent before it is reported as completed
+    __flushEntries()
+
     rollback_system()
 
+    if SCRIPT_TIMINGS:
+        send_script_timings(cached, compile_time, exec_time, __io_wait[0])
+
     # ping back to Demisto server that script is completed
     send_script_completed()
 
@@ -0,0 +1,152 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+LOOP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '_script_docker_python_loop.py')
+
+
+class LoopProcess(object):
+    """Runs the docker python loop, and plays the server side of its stdin/stdout protocol"""
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, LOOP_PATH], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+        self.lines = []
+        self.lines_available = threading.Condition()
+        self.reader = threading.Thread(target=self._read_lines)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _read_lines(self):
+        for line in iter(self.process.stdout.readline, ''):
+            with self.lines_available:
+                self.lines.append(line)
+                self.lines_available.notify()
+
+    def run(self, script, pipelined=True):
+        self.send({'script': script, 'integration': False, 'native': False, 'pipelined': pipelined, 'args': {},
+                   'context': {}})
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + '\n')
+        self.process.stdin.flush()
+
+    def receive(self, timeout=5):
+        with self.lines_available:
+            if not self.lines:
+                self.lines_available.wait(timeout)
+            if not self.lines:
+                return None
+            return json.loads(self.lines.pop(0))
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+@pytest.fixture
+def loop():
+    loop_process = LoopProcess()
+    yield loop_process
+    loop_process.close()
+
+
+def test_pipelined_entries_are_batched(loop):
+    """
+    Given
+    - A script that logs 250 lines in pipelined mode.
+
+    When
+    - Running the script.
+
+    Then
+    - Ensure the entries are sent in batched frames of up to 100 entries, before the script results.
+    """
+    loop.run("for i in range(250):\n    demisto.info(str(i))\ndemisto.results('done')")
+
+    batches = [loop.receive() for _ in range(3)]
+    assert [batch['type'] for batch in batches] == ['batch'] * 3
+    assert [len(batch['entries']) for batch in batches] == [100, 100, 50]
+    assert batches[2]['entries'][-1]['args']['args'] == ['249']
+    assert loop.receive()['results'][0]['Contents'] == 'done'
+
+
+def test_pipelined_entries_are_flushed_by_timer(loop):
+    """
+    Given
+    - A script that logs a line and then computes for longer than MAX_BATCH_DELAY.
+
+    When
+    - Running the script in pipelined mode.
+
+    Then
+    - Ensure the entry is sent while the script still computes.
+    """
+    loop.run("import time\ndemisto.info('working')\ntime.sleep(4)\ndemisto.results('done')")
+
+    batch = loop.receive(timeout=3)
+    assert batch == {'type': 'batch', 'entries': [{'type': 'log', 'command': 'info', 'args': {'args': ['working']}}]}
+
+
+def test_pipelined_entries_are_flushed_before_read(loop):
+    """
+    Given
+    - A script that sends a command asynchronously, logs a line and then waits for the result.
+
+    When
+    - Running the script in pipelined mode.
+
+    Then
+    - Ensure the entry is sent before the script blocks on the result, without waiting for the timer.
+    """
+    loop.run("wait = demisto.executeCommandAsync('getIncidents', {})\ndemisto.info('waiting')\n"
+             "demisto.results(wait())")
+
+    assert loop.receive()['command'] == 'getIncidents'
+    assert loop.receive(timeout=0.5)['entries'][0]['args']['args'] == ['waiting']
+    loop.send({'id': 1, 'result': 'incidents'})
+    assert loop.receive()['results'][0]['Contents'] == 'incidents'
+
+
+def test_pipelined_responses_are_correlated(loop):
+    """
+    Given
+    - A script that sends two commands asynchronously.
+
+    When
+    - The server answers them in the reverse order.
+
+    Then
+    - Ensure each command gets its own result.
+    """
+    loop.run("first = demisto.executeCommandAsync('first', {})\nsecond = demisto.executeCommandAsync('second', {})\n"
+             "demisto.results([first(), second()])")
+
+    requests = [loop.receive(), loop.receive()]
+    assert [(request['id'], request['command']) for request in requests] == [(1, 'first'), (2, 'second')]
+    loop.send({'id': 2, 'result': 'second result'})
+    loop.send({'id': 1, 'result': 'first result'})
+    assert [result['Contents'] for result in loop.receive()['results']] == ['first result', 'second result']
+
+
+def test_not_pipelined_command(loop):
+    """
+    Given
+    - A script that sends a command asynchronously, when the pipelined mode is not negotiated.
+
+    When
+    - Running the script.
+
+    Then
+    - Ensure the command is sent without a correlation id, and its result is returned.
+    """
+    loop.run("wait = demisto.executeCommandAsync('getIncidents', {})\ndemisto.results(wait())", pipelined=False)
+
+    assert loop.receive() == {'type': 'executeCommand', 'command': 'getIncidents', 'args': {}}
+    loop.send('incidents')
+    assert loop.receive()['results'][0]['Contents'] == 'incidents'